@@ -1,29 +1,32 @@
-from flask import Flask, request, jsonify, render_template
-import requests
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 from playwright.sync_api import sync_playwright
 import sys
 import os
+import uuid
 from dotenv import load_dotenv
 from supabase import create_client, Client
-from langfuse.callback import CallbackHandler
-from app.utils import fetch_messages
 
-from app.subtitle_generator.subtitle_generator import SubtitleGenerator
-from app.processing_qna.qna_processor import run_pipeline
-from app.processing_qna.processed_qna_db import ProcessedQnADBHandler
-from app.writer.writer import compiled_graph, GraphState
-from datetime import datetime
+from app.blog_pipeline import run_blog_generation, BlogGenerationError
+from app.blog_jobs import BlogJobRunner
+from app.prompt_registry import prompt_registry
+from app.progress import ProgressReporter, RUN_STAGE, stream_events
 
 # 블루프린트 등록
-from .categorize_questions import categorize_questions_bp
-from .summarize_answers import summarize_answers_bp
-from .draft_implementation_blog import draft_implementation_blog_bp
-from .draft_debugging_blog import draft_debugging_blog_bp
-from .draft_explanation_blog import draft_explanation_blog_bp
-from .review_and_finalize_blog import review_and_finalize_blog_bp
+from .categorize_questions import categorize_questions_bp, run_categorize_questions
+from .summarize_answers import summarize_answers_bp, run_summarize_answers
+from .draft_implementation_blog import draft_implementation_blog_bp, create_implementation_draft
+from .draft_debugging_blog import draft_debugging_blog_bp, create_debugging_draft
+from .draft_explanation_blog import draft_explanation_blog_bp, create_explanation_draft
+from .review_and_finalize_blog import review_and_finalize_blog_bp, finalize_blog
 
-from .publish_to_notion import publish_to_notion_bp
-langfuse_handler = CallbackHandler()
+from .publish_to_notion import publish_to_notion_bp, publish_blog, NotionPublishError
+
+# /generate-blog 초안 작성 단계: 질문 유형별 초안 작성 함수
+DRAFT_WRITERS = [
+    ("implementation", create_implementation_draft),
+    ("error", create_debugging_draft),
+    ("explanation", create_explanation_draft),
+]
 
 
 
@@ -47,11 +50,23 @@ def create_app():
 
     database: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+    # 블로그 생성 작업 실행기, 이전 worker가 끝내지 못한 작업을 이어서 실행하고 실행 중인 작업의 heartbeat를 기록
+    blog_job_runner = BlogJobRunner(
+        lambda conversation_id, thread_id, on_stage, run_id: run_blog_generation(database, conversation_id, thread_id=thread_id, on_stage=on_stage, run_id=run_id)
+    )
+    blog_job_runner.recover()
+    blog_job_runner.start()
+
 
     @app.route('/')
     def index():
         return render_template('index.html')
 
+    @app.route('/prompt-registry/stats', methods=['GET'])
+    def prompt_registry_stats():
+        # 워커 프로세스별 Langfuse 프롬프트 캐시 적중/미스 카운터
+        return jsonify(prompt_registry.get_stats()), 200
+
     @app.route("/process-url", methods=["GET"])
     def process_url():
         url = request.args.get('url')
@@ -105,167 +120,115 @@ def create_app():
 
     @app.route('/generate-blog2', methods=['POST'])
     def generate_blog2():
+        data = request.json
+        # run_id를 미리 정해 보내면 요청이 끝나기 전에 GET /progress/<run_id>/events로 진행 상황을 구독할 수 있음
+        run_id = data.get('run_id') or str(uuid.uuid4())
+        try:
+            result = run_blog_generation(database, data.get('conversation_id'), thread_id=data.get('thread_id'), run_id=run_id)
+        except BlogGenerationError as e:
+            return jsonify({"error": e.message, "details": e.details, "thread_id": e.thread_id, "run_id": run_id}), 500
+        return jsonify({"message": "Blog generated and published to Notion successfully", **result, "run_id": run_id}), 200
+
+    @app.route('/generate-blog2/jobs', methods=['POST'])
+    def submit_generate_blog2_job():
+        # 블로그 생성을 백그라운드에서 실행하고 작업 ID를 바로 반환, 진행 상황은 GET /progress/<job_id>/events로 구독
         data = request.json
         conversation_id = data.get('conversation_id')
-        messages = fetch_messages(database, conversation_id)
-        # 1. 목차 생성
-        generatorClass = SubtitleGenerator(config_path = "app/configs/subtitle_generator.yaml");
-        result = generatorClass(messages)
-
-
-        # 2. 질문 압축 및 코드 추출
-        processed_qna_list, code_documents = run_pipeline("solar-pro", conversation_id);
-
-        # 블로그 작성 모듈 이전에 목차 생성 모듈에서 나온 결과 전처리
-        ## 목차 딕셔너리의 value 리스트 내에 있는 값들을 모두 문자열로 처리
-        for key, value in result[1].items():
-            result[1][key] = [str(v) for v in value]
-
-        # 블로그 작성 모듈 이전에 질문 압축 및 코드 추출 모듈에서 나온 결과 전처리
-        ## Database 삽입 및 조회를 위한 인스턴스 생성
-        qna_db_handler = ProcessedQnADBHandler()
-        ## 질문 압축 및 코드 추출 모듈에서 나온 결과 전처리
-        processed_code_documents = qna_db_handler._format_extracted_code(code_documents)
-
-        # 3. 블로그 작성
-        ## 들어갈 graph_state를 정의
-        graph_state = GraphState(
-            preprocessed_conversations=processed_qna_list,
-            code_document=processed_code_documents,
-            message_to_index_dict=result[1],
-            final_documents=result[0]
+        if conversation_id is None:
+            return jsonify({"error": "conversation_id is required"}), 400
+        job_id = blog_job_runner.submit(conversation_id)
+        return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+    @app.route('/generate-blog2/jobs/<job_id>', methods=['GET'])
+    def get_generate_blog2_job(job_id):
+        # 작업 상태(queued/running/succeeded/failed), 현재 단계, 완료 시 Notion URL 반환
+        job = blog_job_runner.store.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job), 200
+
+    @app.route('/progress/<run_id>/events', methods=['GET'])
+    def progress_events(run_id):
+        # 단계별 진행 이벤트를 Server-Sent Events로 전송, 재연결 시 Last-Event-ID 이후의 이벤트부터 전송
+        # 스트림은 gthread worker의 thread 하나를 점유하며(gunicorn.conf.py), PROGRESS_STREAM_MAX_SECONDS마다 닫혀 클라이언트가 재연결해 이어서 받음
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or '0'
+        last_seq = int(last_event_id) if last_event_id.isdigit() else 0
+        return Response(
+            stream_with_context(stream_events(run_id, last_seq)),
+            mimetype='text/event-stream',
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
         )
 
-        ## graph_state를 이용하여 블로그 작성
-        final_state = compiled_graph.invoke(
-            graph_state, 
-            config={
-                "configurable": {"thread_id": 42}, 
-                "callbacks": [langfuse_handler]}
-        )
-
-        final_technote = format_input(final_state["final_documents"]);
-        title = get_current_datetime()
-
-
-        # 6. 노션 페이지 생성 및 게시
-        notion_title = title
-        notion_content = final_technote
-        question_type = []
-        requirements = []
-        framework_tags = []
-        language_tags = []
-        os_tags = []
-        tech_stack_tags = []
-
-
-
-
-        notion_response = requests.post('http://localhost:4000/publish-to-notion', json={
-            "title": notion_title, 
-            "content": notion_content, 
-            "question_type": question_type,
-            "os_tags": os_tags,
-            "framework_tags": framework_tags,
-            "language_tags": language_tags,
-            "tech_stack_tags": tech_stack_tags
-        })
-
-        
-        if notion_response.status_code == 200:
-            notion_page_id = notion_response.json().get('page_id')
-            notion_page_url = notion_response.json().get('url')
-            notion_page_public_url = notion_response.json().get('public_url')
-            return jsonify({"message": "Blog generated and published to Notion successfully", "notion_page_id": notion_page_id, "notion_page_url": notion_page_url, "notion_page_public_url": notion_page_public_url}), 200
-        else:
-            return jsonify({"error": "Failed to publish to Notion", "details": notion_response.json()}), 500
-        return jsonify({"result": result, "processed_qna_list":processed_qna_list,"code_documents": code_documents, "final_state": final_state}), 200
-    def format_input(input_dict):
-        # 입력된 딕셔너리의 값들을 줄바꿈으로 연결하여 하나의 문자열로 만듭니다.
-        return '\n'.join(input_dict.values())
-    
-    def get_current_datetime():
-        # 현재 날짜와 시간을 가져옵니다
-        now = datetime.now()
-        # 연-월-일 시:분 형식으로 변환합니다
-        formatted_datetime = now.strftime("%Y년 %m월 %d일 %H시 %M분")
-        return formatted_datetime
-
 
 
 
     @app.route('/generate-blog', methods=['POST'])
     def test():
         data = request.json
-        conversation_id = data.get('conversation_id')
+        # run_id를 미리 정해 보내면 요청이 끝나기 전에 GET /progress/<run_id>/events로 진행 상황을 구독할 수 있음
+        run_id = data.get('run_id') or str(uuid.uuid4())
+        progress = ProgressReporter(run_id)
+        progress.start(RUN_STAGE)
+        try:
+            response, status_code = generate_blog(data.get('conversation_id'), progress)
+        except Exception as e:
+            progress.fail(RUN_STAGE, str(e))
+            raise
+        body = response.get_json()
+        if status_code == 200:
+            progress.finish(RUN_STAGE)
+        else:
+            progress.fail(RUN_STAGE, body.get("error"))
+        return jsonify({**body, "run_id": run_id}), status_code
 
+    def generate_blog(conversation_id, progress):
         # 1. 메시지 가져오기
         questions = get_messages(conversation_id, message_type='question')
         answers = get_messages(conversation_id, message_type='answer')
         
         # 2. 질문 카테고라이징
-        categorize_input = {
-            "conversation_id": conversation_id,
-            "questions": questions
-        }
-        categorize_response = requests.post('http://localhost:4000/categorize-questions', json=categorize_input, headers={"Content-Type": "application/json"})
-        print("")
-        if categorize_response.status_code != 200:
-            return jsonify({"error": "Error categorizing questions"}), categorize_response.status_code
-        
+        # 각 단계는 HTTP 엔드포인트를 다시 호출하지 않고 같은 프로세스에서 함수로 실행
+        # (요청마다 worker를 하나 더 점유해 모든 worker가 자기 자신을 기다리며 멈추는 것을 방지)
+        progress.start("categorize")
         try:
-            categorized_questions = categorize_response.json().get('categorized_questions')
-        except ValueError:
-            return jsonify({"error": "Invalid JSON response from categorize-questions API"}), 500
+            categorized_questions = run_categorize_questions(questions)
+        except Exception as e:
+            print("Error in categorize_questions: ", e)
+            progress.fail("categorize", str(e))
+            return jsonify({"error": "Error categorizing questions"}), 500
+        progress.finish("categorize")
         
         
         # 3. 질문에 대한 답변 요약
-        summarize_input = {
-            "categorized_questions": categorized_questions,
-            "answers": answers
-        }
-        summarize_response = requests.post('http://localhost:4000/summarize-answers', json=summarize_input, headers={"Content-Type": "application/json"})
-        if summarize_response.status_code != 200:
-            return jsonify({"error": "Error summarizing answers"}), summarize_response.status_code
-        
+        progress.start("summarize")
         try:
-            summarized_questions_answers = summarize_response.json().get('summarized_answers')
-        except ValueError:
-            return jsonify({"error": "Invalid JSON response from summarize-answers API"}), 500
+            summarized_questions_answers = run_summarize_answers(categorized_questions, answers)
+        except Exception as e:
+            print("Error in summarize_answers: ", e)
+            progress.fail("summarize", str(e))
+            return jsonify({"error": "Error summarizing answers"}), 500
+        progress.finish("summarize")
         
         # 4. 블로그 초안 작성
         drafts = []
+        draft_total = sum(len(summarized_item) for summarized_item in summarized_questions_answers)
+        drafted = 0
+        progress.start("drafting", total=draft_total)
         for summarized_item in summarized_questions_answers:
             for item in summarized_item:  # summarized_questions_answers가 이중 리스트 구조임
                 question_types = item['question_type']  # 'question_type' 리스트 직접 접근
 
-                draft_input = item
-
-                draft_response = None
-
-                if 'implementation' in question_types:
-                    draft_response = requests.post('http://localhost:4000/draft-implementation-blog', json=[draft_input], headers={"Content-Type": "application/json"})
-                    print("draft_implementation_blog response status: ", draft_response.status_code)
-                    if draft_response.status_code == 200:
-                        drafts.append(draft_response.json())
-                    else:
-                        print("Error in draft_implementation_blog: ", draft_response.json())
-
-                if 'error' in question_types:
-                    draft_response = requests.post('http://localhost:4000/draft-debugging-blog', json=[draft_input], headers={"Content-Type": "application/json"})
-                    print("draft_debugging_blog response status: ", draft_response.status_code)
-                    if draft_response.status_code == 200:
-                        drafts.append(draft_response.json())
-                    else:
-                        print("Error in draft_debugging_blog: ", draft_response.json())
-
-                if 'explanation' in question_types:
-                    draft_response = requests.post('http://localhost:4000/draft-explanation-blog', json=[draft_input], headers={"Content-Type": "application/json"})
-                    print("draft_explanation_blog response status: ", draft_response.status_code)
-                    if draft_response.status_code == 200:
-                        drafts.append(draft_response.json())
-                    else:
-                        print("Error in draft_explanation_blog: ", draft_response.json())
+                for question_type, create_draft in DRAFT_WRITERS:
+                    if question_type not in question_types:
+                        continue
+                    try:
+                        drafts.append(create_draft([item]))
+                    except Exception as e:
+                        print(f"Error in {create_draft.__name__}: ", e)
+
+                drafted += 1
+                progress.advance("drafting", drafted, draft_total)
+        progress.finish("drafting")
 
         print("Drafts: ", drafts)
 
@@ -274,46 +237,35 @@ def create_app():
             return jsonify({"error": "No drafts generated"}), 400
 
         # 5. 블로그 초안 취합 및 최종 블로그 포스트 작성
-        review_input = {
-            "drafts": drafts
-        }
-        review_response = requests.post('http://localhost:4000/review-and-finalize-blog', json=review_input)
-        
-        if review_response.status_code != 200:
-            return jsonify({"error": "Error reviewing and finalizing blog"}), review_response.status_code
-        
+        progress.start("review")
         try:
-            final_blog = review_response.json().get('output')
-        except ValueError:
-            return jsonify({"error": "Invalid JSON response from review-and-finalize-blog API"}), 500
+            final_blog = finalize_blog(drafts)
+        except Exception as e:
+            print("Error in review_and_finalize_blog: ", e)
+            progress.fail("review", str(e))
+            return jsonify({"error": "Error reviewing and finalizing blog"}), 500
+        progress.finish("review")
         
         # 6. 노션 페이지 생성 및 게시
-        notion_title = final_blog.get('title')
         notion_content = final_blog.get('content')
-        question_type = final_blog.get('question_type', [])
-        requirements = final_blog.get('requirements', [])
-        framework_tags = final_blog.get('framework_tags', [])
-        language_tags = final_blog.get('language_tags', [])
-        os_tags = final_blog.get('os_tags', [])
-        tech_stack_tags = final_blog.get('tech_stack_tags', [])
-
-        notion_response = requests.post('http://localhost:4000/publish-to-notion', json={
-            "title": notion_title, 
-            "content": notion_content, 
-            "question_type": question_type,
-            "os_tags": os_tags,
-            "framework_tags": framework_tags,
-            "language_tags": language_tags,
-            "tech_stack_tags": tech_stack_tags
-        })
+
+        progress.start("publishing")
+        try:
+            notion_page = publish_blog(
+                final_blog.get('title'),
+                notion_content,
+                final_blog.get('question_type', []),
+                final_blog.get('os_tags', []),
+                final_blog.get('framework_tags', []),
+                final_blog.get('language_tags', []),
+                final_blog.get('tech_stack_tags', [])
+            )
+        except NotionPublishError as e:
+            progress.fail("publishing", e.details or e.message)
+            return jsonify({"error": "Failed to publish to Notion", "details": e.details or e.message}), 500
+        progress.finish("publishing")
         
-        if notion_response.status_code == 200:
-            notion_page_id = notion_response.json().get('page_id')
-            notion_page_url = notion_response.json().get('url')
-            notion_page_public_url = notion_response.json().get('public_url')
-            return jsonify({"message": "Blog generated and published to Notion successfully", "notion_page_id": notion_page_id, "notion_page_url": notion_page_url, "notion_page_public_url": notion_page_public_url, "notion_content": notion_content}), 200
-        else:
-            return jsonify({"error": "Failed to publish to Notion", "details": notion_response.json()}), 500
+        return jsonify({"message": "Blog generated and published to Notion successfully", "notion_page_id": notion_page['page_id'], "notion_page_url": notion_page['url'], "notion_page_public_url": notion_page['public_url'], "notion_content": notion_content}), 200
 
     def get_messages(conversation_id, message_type):
         response = database.table('messages').select('sequence_number, message_content').eq('conversation_id', conversation_id).eq('message_type', message_type).order('sequence_number').execute()
@@ -0,0 +1,260 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BLOG_JOB_DB_PATH = os.getenv("BLOG_JOB_DB_PATH", ".cache/blog_jobs.sqlite3")
+BLOG_JOB_MAX_CONCURRENCY = int(os.getenv("BLOG_JOB_MAX_CONCURRENCY", 2))
+# 실행 중인 작업의 updated_at을 갱신(heartbeat)하고, 중단된 작업을 다시 찾는 주기(초)
+BLOG_JOB_HEARTBEAT_SECONDS = float(os.getenv("BLOG_JOB_HEARTBEAT_SECONDS", 30))
+# running 작업의 updated_at이 이 시간(초) 이상 갱신되지 않으면 owner가 사라진 것으로 보고 다시 실행
+# 다른 호스트(교체된 컨테이너 등)의 worker가 선점한 작업은 프로세스 생존 여부를 확인할 수 없어 이 기준으로만 판단
+BLOG_JOB_STALE_SECONDS = float(os.getenv("BLOG_JOB_STALE_SECONDS", 300))
+
+JOB_FIELDS = ("id", "conversation_id", "status", "stage", "thread_id", "result", "error", "claimed_by", "created_at", "updated_at")
+
+
+class BlogJobStore:
+    """
+    블로그 생성 작업 상태를 저장하는 SQLite 테이블.
+    gunicorn worker 여러 개가 같은 파일을 공유하며, 작업은 UPDATE 한 번으로 선점(claim)하므로 한 worker만 실행합니다.
+    status는 queued -> running -> succeeded / failed 순서로 바뀝니다.
+
+    Attributes:
+    - path (str): SQLite 파일 경로.
+    """
+
+    def __init__(self, path: str = BLOG_JOB_DB_PATH) -> None:
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS blog_jobs ("
+                "id TEXT PRIMARY KEY, conversation_id TEXT NOT NULL, status TEXT NOT NULL, stage TEXT, "
+                "thread_id TEXT NOT NULL, result TEXT, error TEXT, claimed_by TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS blog_jobs_status ON blog_jobs (status)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def create(self, conversation_id) -> str:
+        """queued 상태의 작업을 만들고 작업 ID를 반환합니다."""
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO blog_jobs (id, conversation_id, status, thread_id, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(conversation_id), str(uuid.uuid4()), now, now)
+            )
+        return job_id
+
+    def claim(self, job_id: str, owner: str, previous_owner: Optional[str] = None) -> bool:
+        """
+        작업을 running 상태로 바꾸고 owner가 실행하도록 선점합니다. 다른 worker가 먼저 선점했다면 False를 반환합니다.
+        previous_owner가 주어지면 해당 owner가 실행하다 중단된 running 작업을 다시 선점합니다.
+        """
+        with self._connect() as conn:
+            if previous_owner is None:
+                cursor = conn.execute(
+                    "UPDATE blog_jobs SET status = 'running', claimed_by = ?, updated_at = ? WHERE id = ? AND status = 'queued'",
+                    (owner, time.time(), job_id)
+                )
+            else:
+                cursor = conn.execute(
+                    "UPDATE blog_jobs SET status = 'running', claimed_by = ?, updated_at = ? WHERE id = ? AND status = 'running' AND claimed_by = ?",
+                    (owner, time.time(), job_id, previous_owner)
+                )
+            return cursor.rowcount == 1
+
+    def heartbeat(self, job_ids: List[str], owner: str) -> None:
+        """owner가 실행 중인 작업들의 updated_at을 갱신합니다."""
+        if not job_ids:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE blog_jobs SET updated_at = ? WHERE id = ? AND status = 'running' AND claimed_by = ?",
+                [(now, job_id, owner) for job_id in job_ids]
+            )
+
+    def _update(self, job_id: str, **fields) -> None:
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE blog_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def set_stage(self, job_id: str, stage: str) -> None:
+        self._update(job_id, stage=stage)
+
+    def succeed(self, job_id: str, result: dict) -> None:
+        self._update(job_id, status="succeeded", stage="done", result=json.dumps(result, ensure_ascii=False))
+
+    def fail(self, job_id: str, error: dict) -> None:
+        self._update(job_id, status="failed", error=json.dumps(error, ensure_ascii=False, default=str))
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM blog_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(JOB_FIELDS, row))
+        job["conversation_id"] = json.loads(job["conversation_id"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["error"] = json.loads(job["error"]) if job["error"] else None
+        return job
+
+    def unfinished(self) -> List[dict]:
+        """queued, running 상태의 작업을 오래된 순서로 반환합니다."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, status, claimed_by, updated_at FROM blog_jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [
+            {"id": job_id, "status": status, "claimed_by": claimed_by, "updated_at": updated_at}
+            for job_id, status, claimed_by, updated_at in rows
+        ]
+
+
+def _owner_is_dead(owner: Optional[str], updated_at: float, stale_seconds: float = BLOG_JOB_STALE_SECONDS) -> bool:
+    # owner가 살아 있으면 heartbeat로 updated_at이 계속 갱신되므로, 오래 갱신되지 않은 작업은 호스트와 관계없이 중단된 것으로 판단
+    if not owner or time.time() - updated_at >= stale_seconds:
+        return True
+    # 같은 호스트의 worker가 선점한 작업은 프로세스 생존 여부로 바로 확인
+    host, _, pid = owner.rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    if int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        return False
+    return False
+
+
+class BlogJobRunner:
+    """
+    블로그 생성 작업을 백그라운드 스레드에서 실행합니다.
+    worker마다 max_concurrency개까지 동시에 실행하며, 시작 시 대기 중이거나 종료된 worker가 실행하던 작업을 이어서 실행합니다.
+    start()로 켜는 백그라운드 스레드가 heartbeat_seconds마다 실행 중인 작업의 heartbeat를 기록하고 중단된 작업을 다시 찾습니다.
+
+    Attributes:
+    - store (BlogJobStore): 작업 상태 저장소.
+    - run (Callable): (conversation_id, thread_id, on_stage, run_id)를 받아 결과 dict를 반환하는 파이프라인 함수. run_id로 작업 ID를 넘깁니다.
+    """
+
+    def __init__(
+        self,
+        run: Callable[..., dict],
+        store: Optional[BlogJobStore] = None,
+        max_concurrency: int = BLOG_JOB_MAX_CONCURRENCY,
+        heartbeat_seconds: float = BLOG_JOB_HEARTBEAT_SECONDS,
+        stale_seconds: float = BLOG_JOB_STALE_SECONDS
+    ) -> None:
+        self.run = run
+        self.store = store or BlogJobStore()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="blog-job")
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_seconds = stale_seconds
+        # 이 worker의 실행 대기열에 있는 작업(중복 제출 방지)과 실행 중인 작업(heartbeat 대상)
+        self._scheduled = set()
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def owner(self) -> str:
+        # gunicorn worker가 다시 시작되면 pid가 바뀌므로 선점할 때마다 계산
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def submit(self, conversation_id) -> str:
+        job_id = self.store.create(conversation_id)
+        self._schedule(job_id)
+        return job_id
+
+    def _schedule(self, job_id: str, previous_owner: Optional[str] = None) -> bool:
+        with self._lock:
+            if job_id in self._scheduled:
+                return False
+            self._scheduled.add(job_id)
+        self.executor.submit(self._execute, job_id, previous_owner)
+        return True
+
+    def recover(self) -> List[str]:
+        """대기 중인 작업과 종료된 worker가 실행하던 작업을 이 worker의 실행 대기열에 넣습니다."""
+        recovered = []
+        for job in self.store.unfinished():
+            if job["status"] == "queued":
+                scheduled = self._schedule(job["id"])
+            elif _owner_is_dead(job["claimed_by"], job["updated_at"], self.stale_seconds):
+                scheduled = self._schedule(job["id"], job["claimed_by"])
+            else:
+                scheduled = False
+            if scheduled:
+                recovered.append(job["id"])
+        return recovered
+
+    def start(self) -> None:
+        """heartbeat 기록과 중단된 작업 복구를 주기적으로 실행하는 백그라운드 스레드를 시작합니다."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._maintain, name="blog-job-heartbeat", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _maintain(self) -> None:
+        while not self._stopped.wait(self.heartbeat_seconds):
+            try:
+                with self._lock:
+                    running = list(self._running)
+                self.store.heartbeat(running, self.owner)
+                self.recover()
+            except Exception:
+                logger.exception("Blog job heartbeat failed")
+
+    def _execute(self, job_id: str, previous_owner: Optional[str] = None) -> None:
+        try:
+            if self.store.claim(job_id, self.owner, previous_owner):
+                with self._lock:
+                    self._running.add(job_id)
+                self._run_claimed(job_id)
+        finally:
+            with self._lock:
+                self._scheduled.discard(job_id)
+                self._running.discard(job_id)
+
+    def _run_claimed(self, job_id: str) -> None:
+        job = self.store.get(job_id)
+        try:
+            result = self.run(
+                job["conversation_id"],
+                thread_id=job["thread_id"],
+                on_stage=lambda stage: self.store.set_stage(job_id, stage),
+                run_id=job_id
+            )
+        except Exception as e:
+            logger.exception(f"Blog job {job_id} failed")
+            self.store.fail(job_id, {
+                "error": getattr(e, "message", str(e)),
+                "details": getattr(e, "details", None),
+            })
+            return
+        self.store.succeed(job_id, result)
@@ -0,0 +1,234 @@
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from langfuse.callback import CallbackHandler
+
+from app.utils import fetch_messages
+from app.subtitle_generator.subtitle_generator import SubtitleGenerator
+from app.processing_qna.qna_processor import run_pipeline
+from app.processing_qna.processed_qna_db import ProcessedQnADBHandler
+from app.writer.writer import compiled_graph, GraphState, WRITER_TOKEN_ACCOUNTING, memory as writer_memory
+from app.llm_cache import llm_cache, timing_entry
+from app.progress import ProgressReporter, RUN_STAGE
+from app.publish_to_notion import publish_blog, NotionPublishError
+
+langfuse_handler = CallbackHandler()
+
+
+class BlogGenerationError(Exception):
+    """
+    블로그 생성 단계가 실패했을 때 발생하는 예외.
+
+    Attributes:
+    - message (str): 실패한 단계 설명.
+    - details: 원인 (예외 메시지 또는 Notion 응답).
+    - thread_id (str): 블로그 작성 그래프의 thread_id. 같은 값으로 다시 실행하면 작성 단계를 이어서 진행합니다.
+    """
+
+    def __init__(self, message: str, details=None, thread_id: Optional[str] = None) -> None:
+        super().__init__(message)
+        self.message = message
+        self.details = details
+        self.thread_id = thread_id
+
+
+def format_input(input_dict):
+    # 입력된 딕셔너리의 값들을 줄바꿈으로 연결하여 하나의 문자열로 만듭니다.
+    return '\n'.join(input_dict.values())
+
+
+def get_current_datetime():
+    # 현재 날짜와 시간을 가져옵니다
+    now = datetime.now()
+    # 연-월-일 시:분 형식으로 변환합니다
+    formatted_datetime = now.strftime("%Y년 %m월 %d일 %H시 %M분")
+    return formatted_datetime
+
+
+def run_concurrent_stages(stages: Dict[str, Callable[[threading.Event], Any]], timings: dict, report_stage: Callable[[str], None],
+                          progress: ProgressReporter) -> List[Any]:
+    """
+    서로의 결과를 사용하지 않는 단계들을 동시에 실행하고, 결과를 stages의 순서대로 반환합니다.
+    한 단계가 실패하면 cancel_event를 설정해 나머지 단계가 아직 시작하지 않은 LLM 호출을 건너뛰게 하고, 처음 실패한 단계의 예외를 다시 발생시킵니다.
+    timings에는 단계별 소요 시간과 함께 stage_overlap(동시 실행 소요 시간, 단계별 소요 시간의 합, 절약한 시간)을 기록합니다.
+    LLM 응답 캐시 카운터는 worker 전체에서 공유하므로 동시에 실행된 단계의 캐시 적중 수는 서로 겹쳐서 집계됩니다.
+
+    Args:
+        stages (Dict[str, Callable[[threading.Event], Any]]): 단계 이름과, cancel_event를 받아 단계를 실행하는 함수.
+    """
+    cancel_event = threading.Event()
+
+    def run_stage(stage, run):
+        report_stage(stage)
+        progress.start(stage)
+        started_at, cache_stats = time.time(), llm_cache.snapshot()
+        try:
+            stage_result = run(cancel_event)
+        except CancelledError:
+            progress.fail(stage, "cancelled")
+            raise
+        except Exception as e:
+            cancel_event.set()
+            progress.fail(stage, str(e))
+            raise
+        timings[stage] = timing_entry(started_at, cache_stats)
+        progress.finish(stage)
+        return stage_result
+
+    started_at = time.time()
+    with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+        futures = {executor.submit(run_stage, stage, run): stage for stage, run in stages.items()}
+        # 실패한 단계를 완료 순서대로 확인해 다른 단계가 끝나기를 기다리지 않고 취소
+        error = None
+        for future in as_completed(futures):
+            exception = future.exception()
+            if exception is not None and error is None and not isinstance(exception, CancelledError):
+                error = exception
+                cancel_event.set()
+    if error is not None:
+        raise error
+
+    parallel_elapsed = round(time.time() - started_at, 2)
+    sum_of_stages = round(sum(timings[stage]["elapsed"] for stage in stages), 2)
+    timings["stage_overlap"] = {
+        "stages": list(stages),
+        "parallel_elapsed": parallel_elapsed,
+        "sum_of_stages": sum_of_stages,
+        "saved": round(sum_of_stages - parallel_elapsed, 2),
+    }
+    return [future.result() for future in futures]
+
+
+def run_blog_generation(database, conversation_id, thread_id: Optional[str] = None, on_stage: Optional[Callable[[str], None]] = None, run_id: Optional[str] = None) -> dict:
+    """
+    대화 하나로 목차 생성 -> 질문 압축 및 코드 추출 -> 블로그 작성 -> Notion 게시까지 실행합니다.
+
+    Args:
+        database: Supabase client.
+        conversation_id: 블로그로 만들 대화의 ID.
+        thread_id (str | None): 블로그 작성 그래프의 thread_id. 이전 실행이 작성 중에 실패했다면 같은 값을 넘겨 이어서 작성합니다.
+        on_stage (Callable[[str], None] | None): 각 단계를 시작할 때 단계 이름으로 호출됩니다.
+        run_id (str | None): 진행 이벤트를 기록할 ID. GET /progress/<run_id>/events로 구독합니다.
+
+    Returns:
+        dict: notion_page_id, notion_page_url, notion_page_public_url, timings, thread_id.
+
+    Raises:
+        BlogGenerationError: 블로그 작성 또는 Notion 게시가 실패한 경우.
+    """
+    progress = ProgressReporter(run_id)
+    progress.start(RUN_STAGE)
+    try:
+        result = _run_blog_generation(database, conversation_id, thread_id, on_stage, progress)
+    except Exception as e:
+        progress.fail(RUN_STAGE, getattr(e, "message", str(e)))
+        raise
+    progress.finish(RUN_STAGE, result=result)
+    return result
+
+
+def _run_blog_generation(database, conversation_id, thread_id, on_stage, progress: ProgressReporter) -> dict:
+    report_stage = on_stage or (lambda stage: None)
+    # 단계별 소요 시간 및 LLM 응답 캐시 적중 수
+    timings = {}
+
+    # 이전 요청의 블로그 작성이 중간에 실패했다면 같은 thread_id로 마지막으로 완료된 노드부터 재개
+    writer_config = {
+        "configurable": {"thread_id": thread_id or str(uuid.uuid4()), "progress_run_id": progress.run_id},
+        "callbacks": [langfuse_handler]}
+    resume = bool(thread_id) and bool(compiled_graph.get_state(writer_config).next)
+    thread_id = writer_config["configurable"]["thread_id"]
+
+    if not resume:
+        messages = fetch_messages(database, conversation_id)
+
+        # 1. 목차 생성, 2. 질문 압축 및 코드 추출
+        ## 두 단계는 서로의 결과를 사용하지 않으므로 동시에 실행
+        result, (processed_qna_list, code_documents) = run_concurrent_stages({
+            "subtitle_generation": lambda cancel_event: SubtitleGenerator(config_path = "app/configs/subtitle_generator.yaml")(
+                messages, on_progress=progress.callback("subtitle_generation"), cancel_event=cancel_event),
+            "qna_processing": lambda cancel_event: run_pipeline(
+                "solar-pro", conversation_id, on_progress=progress.callback("qna_processing"), cancel_event=cancel_event),
+        }, timings, report_stage, progress)
+
+        # 블로그 작성 모듈 이전에 목차 생성 모듈에서 나온 결과 전처리
+        ## 목차 딕셔너리의 value 리스트 내에 있는 값들을 모두 문자열로 처리
+        for key, value in result[1].items():
+            result[1][key] = [str(v) for v in value]
+
+        # 블로그 작성 모듈 이전에 질문 압축 및 코드 추출 모듈에서 나온 결과 전처리
+        ## Database 삽입 및 조회를 위한 인스턴스 생성
+        qna_db_handler = ProcessedQnADBHandler()
+        ## 질문 압축 및 코드 추출 모듈에서 나온 결과 전처리
+        processed_code_documents = qna_db_handler._format_extracted_code(code_documents)
+
+        # 3. 블로그 작성
+        ## 들어갈 graph_state를 정의
+        graph_state = GraphState(
+            preprocessed_conversations=processed_qna_list,
+            code_document=processed_code_documents,
+            message_to_index_dict=result[1],
+            final_documents=result[0]
+        )
+
+    ## graph_state를 이용하여 블로그 작성
+    report_stage("writing")
+    started_at, cache_stats = time.time(), llm_cache.snapshot()
+    try:
+        final_state = compiled_graph.invoke(None if resume else graph_state, config=writer_config)
+    except Exception as e:
+        # 체크포인트가 남아 있으므로 같은 thread_id로 다시 실행하면 이어서 작성
+        raise BlogGenerationError("Failed to write blog", details=str(e), thread_id=thread_id) from e
+    writer_memory.delete_thread(thread_id)
+    timings["writing"] = timing_entry(started_at, cache_stats)
+    draft_stats = final_state.get('draft_stats', {})
+    print(f"writer draft stats per section: {draft_stats}")
+    if WRITER_TOKEN_ACCOUNTING:
+        print(
+            "writer prompt tokens: "
+            f"sent {sum(stats['prompt_tokens'] for stats in draft_stats.values())}, "
+            f"full mode {sum(stats['prompt_tokens_full'] for stats in draft_stats.values())}, "
+            f"incremental mode {sum(stats['prompt_tokens_incremental'] for stats in draft_stats.values())}"
+        )
+
+    final_technote = format_input(final_state["final_documents"]);
+    title = get_current_datetime()
+
+
+    # 6. 노션 페이지 생성 및 게시
+    notion_title = title
+    notion_content = final_technote
+    question_type = []
+    requirements = []
+    framework_tags = []
+    language_tags = []
+    os_tags = []
+    tech_stack_tags = []
+
+
+
+
+    report_stage("publishing")
+    progress.start("publishing")
+    started_at, cache_stats = time.time(), llm_cache.snapshot()
+    try:
+        notion_page = publish_blog(notion_title, notion_content, question_type, os_tags, framework_tags, language_tags, tech_stack_tags)
+    except NotionPublishError as e:
+        progress.fail("publishing", e.details or e.message)
+        raise BlogGenerationError("Failed to publish to Notion", details=e.details or e.message, thread_id=thread_id) from e
+    finally:
+        timings["publishing"] = timing_entry(started_at, cache_stats)
+        print(f"generate-blog2 timings: {timings}")
+    progress.finish("publishing")
+
+    return {
+        "notion_page_id": notion_page['page_id'],
+        "notion_page_url": notion_page['url'],
+        "notion_page_public_url": notion_page['public_url'],
+        "timings": timings,
+        "thread_id": thread_id,
+    }
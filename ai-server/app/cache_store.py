@@ -0,0 +1,118 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+
+class SQLiteLRUStore:
+    """
+    SQLite 파일 하나에 key -> bytes 값을 저장하는 LRU 저장소.
+    gunicorn worker 여러 개가 같은 파일을 공유하며(WAL), 호출마다 connection을 새로 열지 않도록 스레드마다 connection 하나를 재사용합니다.
+
+    Attributes:
+    - path (str): SQLite 파일 경로.
+    - table (str): 값을 저장할 테이블 이름.
+    - max_entries (int | None): 저장할 최대 항목 수. 초과 시 가장 오래 사용되지 않은 항목부터 삭제합니다.
+    - max_bytes (int | None): 저장할 값들의 최대 총 크기(byte). 초과 시 가장 오래 사용되지 않은 항목부터 삭제합니다.
+    """
+
+    def __init__(self, path: str, table: str, max_entries: Optional[int] = None, max_bytes: Optional[int] = None) -> None:
+        self.path = path
+        self.table = table
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_last_access ON {self.table} (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # fork된 worker가 부모 프로세스의 connection을 쓰지 않도록 pid가 바뀌면 새로 엶
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        """key에 해당하는 값을 반환하고 사용 시각을 갱신합니다. 없으면 None을 반환합니다."""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        """여러 key를 한 번에 조회합니다. 찾은 항목만 dict로 반환합니다."""
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, bytes] = {}
+        if not keys:
+            return found
+
+        with self._lock, self._connect() as conn:
+            # SQLite의 바인딩 변수 개수 제한을 넘지 않도록 나누어 조회
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                found.update({key: value for key, value in rows})
+
+            if found:
+                now = time.time()
+                conn.executemany(
+                    f"UPDATE {self.table} SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+        return found
+
+    def set(self, key: str, value: bytes) -> None:
+        """key에 값을 저장합니다."""
+        self.set_many({key: value})
+
+    def set_many(self, items: Dict[str, bytes]) -> None:
+        """여러 항목을 한 번에 저장한 뒤 용량 제한에 맞게 오래된 항목을 삭제합니다."""
+        if not items:
+            return
+
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                [(key, sqlite3.Binary(value), len(value), now) for key, value in items.items()]
+            )
+            self._evict(conn)
+
+    def delete(self, key: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """max_entries, max_bytes를 넘는 만큼 가장 오래 사용되지 않은 항목부터 삭제합니다."""
+        if self.max_entries is not None:
+            count = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            if count > self.max_entries:
+                conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY last_access ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+        if self.max_bytes is not None:
+            total = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+            if total > self.max_bytes:
+                rows = conn.execute(f"SELECT key, size FROM {self.table} ORDER BY last_access ASC").fetchall()
+                expired: List[str] = []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    expired.append(key)
+                    total -= size
+                conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", [(key,) for key in expired])
@@ -3,6 +3,7 @@
 # from langchain import LangChain
 from openai import OpenAI
 client = OpenAI()
+from app.llm_cache import parsed_chat_completion
 from dotenv import load_dotenv
 import os
 import json
@@ -26,6 +27,16 @@ def categorize_questions():
     conversation_id = data.get('conversation_id')
     questions = data.get('questions')
 
+    response = {
+        "categorized_questions": run_categorize_questions(questions)
+    }
+    
+    print("categorize_questions response: ", response)
+
+    return jsonify(response)
+
+def run_categorize_questions(questions):
+    # 질문마다 태그와 질문 유형을 분류하고 sequence_number와 질문 원문을 함께 반환
     categorized_questions = []
 
     for question in questions:
@@ -40,13 +51,7 @@ def categorize_questions():
 
         categorized_questions.append(categorized_question)
 
-    response = {
-        "categorized_questions": categorized_questions
-    }
-    
-    print("categorize_questions response: ", response)
-
-    return jsonify(response)
+    return categorized_questions
 
 def categorize_question(question_text):
     prompt = f"""
@@ -64,7 +69,10 @@ def categorize_question(question_text):
         "requirements": [extracted requirements]
     }}
     """
-    response = client.chat.completions.create(
+    # 잘린 JSON 응답은 캐시에 저장하지 않고 attempt를 바꿔 다시 요청
+    return parsed_chat_completion(
+        client,
+        parse=parse_json_response,
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You are an assistant that helps to categorize questions and should output a valid JSON object."},
@@ -73,17 +81,14 @@ def categorize_question(question_text):
         response_format={ "type": "json_object" },
         max_tokens=150
     )
-    
-    result = response.choices[0].message.content
-    
+
+def parse_json_response(result):
     # Ensure the result is valid JSON
     try:
-        json_result = json.loads(result)
+        return json.loads(result)
     except json.JSONDecodeError as e:
         print(f"JSON decode error: {e}")
         raise ValueError(f"Failed to parse JSON response: {result}")
-    
-    return json_result
 
 def parse_result(result):
     return result  # 이미 JSON 객체이므로 그대로 반환
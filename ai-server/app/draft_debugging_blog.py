@@ -3,6 +3,7 @@
 from flask import Blueprint, request, jsonify
 from openai import OpenAI
 client = OpenAI()
+from app.llm_cache import cached_chat_completion
 from dotenv import load_dotenv
 import os
 import json
@@ -22,28 +23,33 @@ draft_debugging_blog_bp = Blueprint('draft_debugging_blog', __name__)
 def draft_debugging_blog():
     data = request.json
     
-    # 데이터 형식 확인
-    if not isinstance(data, list):
-        return jsonify({"error": "Invalid input format, expected a list"}), 400
+    try:
+        response = create_debugging_draft(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    summarized_questions_answers = data
+    print("Response: ", response)
+    return jsonify(response)
+
+def create_debugging_draft(summarized_questions_answers):
+    # 요약된 Q&A 리스트로 초안을 작성하고 review_and_finalize_blog가 사용하는 input/output 형식으로 반환
+    # 데이터 형식 확인
+    if not isinstance(summarized_questions_answers, list):
+        raise ValueError("Invalid input format, expected a list")
     
     draft_content = ""
 
     for item in summarized_questions_answers:
         if not isinstance(item, dict):
-            return jsonify({"error": f"Invalid item format, expected a dictionary but got {type(item)}"}), 400
+            raise ValueError(f"Invalid item format, expected a dictionary but got {type(item)}")
         draft_content += generate_debugging_blog_draft(item)
 
-    response = {
+    return {
         "input": summarized_questions_answers,
         "output": {
             "draft_content": draft_content
         }
     }
-    
-    print("Response: ", response)
-    return jsonify(response)
 
 def generate_debugging_blog_draft(item):
     prompt = f"""
@@ -76,7 +82,8 @@ def generate_debugging_blog_draft(item):
     
     Answer:
     """
-    response = client.chat.completions.create(
+    draft_content = cached_chat_completion(
+        client,
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You are an assistant that helps to write expert development error fixing and debugging blog draft."},
@@ -84,7 +91,6 @@ def generate_debugging_blog_draft(item):
         ],        
         max_tokens=1000
     )
-    draft_content = response.choices[0].message.content
     
     print("draft_debugging_blog response: ", draft_content)
 
@@ -0,0 +1,71 @@
+import hashlib
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.cache_store import SQLiteLRUStore
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+
+
+class EmbeddingCache:
+    """
+    (모델 이름, 텍스트 해시)를 key로 임베딩을 float32 배열로 저장하는 캐시.
+    같은 대화로 노트를 다시 생성할 때 임베딩 API 호출을 생략하기 위해 사용합니다.
+
+    Attributes:
+    - store (SQLiteLRUStore): 임베딩을 저장하는 LRU 저장소.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: Optional[int] = 100000) -> None:
+        self.store = SQLiteLRUStore(path, table="embeddings", max_entries=max_entries)
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model}:{text_hash}"
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[str, np.ndarray]:
+        """캐시에 있는 텍스트의 임베딩만 {텍스트: 임베딩} 형태로 반환합니다."""
+        keys = {self.make_key(model, text): text for text in texts}
+        found = self.store.get_many(keys.keys())
+        return {keys[key]: np.frombuffer(value, dtype=np.float32) for key, value in found.items()}
+
+    def set_many(self, model: str, embeddings: Dict[str, np.ndarray]) -> None:
+        self.store.set_many({
+            self.make_key(model, text): np.asarray(embedding, dtype=np.float32).tobytes()
+            for text, embedding in embeddings.items()
+        })
+
+
+def embed_with_cache(embedding_model, model_name: str, texts: List[str], cache: Optional[EmbeddingCache] = None, batch_size: int = 100) -> np.ndarray:
+    """
+    texts의 임베딩을 (N, dim) float32 배열로 반환합니다.
+    캐시에 없는 고유 텍스트만 batch_size 단위로 나누어 embed_documents를 호출하고, 결과를 캐시에 저장합니다.
+
+    Args:
+        embedding_model: embed_documents를 제공하는 임베딩 모델 인스턴스.
+        model_name (str): 캐시 key에 사용할 모델 이름.
+        texts (List[str]): 임베딩할 텍스트 리스트.
+        cache (EmbeddingCache | None): 사용할 캐시. None이면 캐시 없이 호출합니다.
+        batch_size (int): 한 번의 embed_documents 요청에 넣을 최대 텍스트 수.
+
+    Returns:
+        np.ndarray: texts 순서와 같은 순서의 임베딩 배열.
+    """
+    unique_texts = list(dict.fromkeys(texts))
+    embeddings = cache.get_many(model_name, unique_texts) if cache is not None else {}
+
+    missing = [text for text in unique_texts if text not in embeddings]
+    for start in range(0, len(missing), batch_size):
+        chunk = missing[start:start + batch_size]
+        computed = {
+            text: np.asarray(embedding, dtype=np.float32)
+            for text, embedding in zip(chunk, embedding_model.embed_documents(chunk))
+        }
+        embeddings.update(computed)
+        if cache is not None:
+            cache.set_many(model_name, computed)
+
+    return np.stack([embeddings[text] for text in texts]) if texts else np.empty((0, 0), dtype=np.float32)
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from langchain_core.messages import AIMessage
+
+from app.cache_store import SQLiteLRUStore
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_responses.sqlite3")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# 응답을 파싱하지 못했을 때 attempt를 바꿔 다시 호출하는 최대 횟수
+LLM_PARSE_RETRIES = int(os.getenv("LLM_PARSE_RETRIES", 3))
+
+
+class LLMResponseCache:
+    """
+    (provider, model, params, prompt 해시, attempt)를 key로 LLM 응답을 저장하는 캐시.
+    같은 conversation_id로 노트를 다시 생성할 때 이미 받은 응답을 재사용합니다.
+
+    attempt는 재시도 루프의 몇 번째 호출인지를 나타냅니다. 재시도마다 다른 key를 사용하므로
+    캐시가 재시도 루프를 무력화하지 않고, 재실행 시에는 같은 순서의 응답이 재생됩니다.
+
+    Attributes:
+    - enabled (bool): False이면 항상 모델을 호출합니다.
+    - stats (dict): hits / misses / bypassed 카운터.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_bytes: Optional[int] = LLM_CACHE_MAX_BYTES, enabled: bool = LLM_CACHE_ENABLED) -> None:
+        self.enabled = enabled
+        self.store = SQLiteLRUStore(path, table="llm_responses", max_bytes=max_bytes) if enabled else None
+        self.stats = {"hits": 0, "misses": 0, "bypassed": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(provider: str, model: str, params: dict, prompt, attempt: int = 0) -> str:
+        payload = json.dumps(
+            {"provider": provider, "model": model, "params": params, "prompt": prompt, "attempt": attempt},
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def get_or_call(self, provider: str, model: str, params: dict, prompt, call: Callable[[], str], attempt: int = 0,
+                    bypass_cache: bool = False, parse: Optional[Callable[[str], Any]] = None):
+        """
+        캐시에 응답이 있으면 반환하고, 없으면 call()을 실행해 결과를 저장합니다.
+        call()이 예외를 던지면 아무것도 저장하지 않습니다.
+
+        parse가 주어지면 parse(응답)을 반환하고, 파싱에 성공한 응답만 저장합니다.
+        잘린 JSON처럼 파싱에 실패한 응답은 저장하지 않고 예외를 그대로 던지므로, 재실행할 때 같은 응답이 재생되지 않습니다.
+        이전 버전에서 저장된 응답이 파싱에 실패하면 삭제하고 모델을 다시 호출합니다.
+        """
+        parse = parse or (lambda response: response)
+        if not self.enabled or bypass_cache:
+            self._count("bypassed")
+            return parse(call())
+
+        key = self.make_key(provider, model, params, prompt, attempt)
+        cached = self.store.get(key)
+        if cached is not None:
+            try:
+                parsed = parse(cached.decode("utf-8"))
+            except Exception:
+                self.store.delete(key)
+            else:
+                self._count("hits")
+                return parsed
+
+        self._count("misses")
+        response = call()
+        parsed = parse(response)
+        self.store.set(key, response.encode("utf-8"))
+        return parsed
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
+
+
+llm_cache = LLMResponseCache()
+
+
+def timing_entry(started_at: float, stats_before: dict) -> dict:
+    """단계별 소요 시간과 해당 단계의 LLM 캐시 적중/미스 수를 반환합니다."""
+    stats_after = llm_cache.snapshot()
+    return {
+        "elapsed": round(time.time() - started_at, 2),
+        "cache_hits": stats_after["hits"] - stats_before["hits"],
+        "cache_misses": stats_after["misses"] - stats_before["misses"],
+    }
+
+
+class CachedChatModel:
+    """
+    ChatUpstage / ChatOpenAI 같은 LangChain chat model을 감싸 invoke 결과를 캐싱합니다.
+    invoke 외의 속성은 감싼 모델로 그대로 전달합니다.
+    response_format 같은 invoke kwargs는 모델 호출에 그대로 전달하고 캐시 key에도 포함합니다.
+    """
+
+    CACHE_KEY_PARAMS = ("temperature", "max_tokens", "top_p")
+
+    def __init__(self, model, cache: LLMResponseCache = llm_cache) -> None:
+        self.model = model
+        self.cache = cache
+        self.provider = type(model).__name__
+        self.model_name = getattr(model, "model_name", None) or getattr(model, "model", None)
+        self.params = {name: getattr(model, name, None) for name in self.CACHE_KEY_PARAMS}
+
+    def invoke(self, prompt, attempt: int = 0, bypass_cache: bool = False, parse: Optional[Callable[[str], Any]] = None, **kwargs):
+        # parse가 주어지면 AIMessage 대신 파싱 결과를 반환하고, 파싱에 성공한 응답만 캐시에 저장
+        result = self.cache.get_or_call(
+            self.provider, self.model_name, dict(self.params, **kwargs) if kwargs else self.params, prompt,
+            call=lambda: self.model.invoke(prompt, **kwargs).content,
+            attempt=attempt,
+            bypass_cache=bypass_cache,
+            parse=parse
+        )
+        return result if parse is not None else AIMessage(content=result)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+def cached_chat_completion(client, attempt: int = 0, bypass_cache: bool = False, cache: LLMResponseCache = llm_cache,
+                           parse: Optional[Callable[[str], Any]] = None, **kwargs):
+    """
+    OpenAI client의 chat.completions.create를 캐시를 거쳐 호출하고 응답 메시지 내용을 반환합니다.
+    parse가 주어지면 파싱 결과를 반환하며, 파싱에 성공한 응답만 캐시에 저장합니다.
+    kwargs는 chat.completions.create에 그대로 전달됩니다.
+    """
+    params = {key: value for key, value in kwargs.items() if key not in ("model", "messages")}
+    return cache.get_or_call(
+        "openai", kwargs.get("model"), params, kwargs.get("messages"),
+        call=lambda: client.chat.completions.create(**kwargs).choices[0].message.content,
+        attempt=attempt,
+        bypass_cache=bypass_cache,
+        parse=parse
+    )
+
+
+def parsed_chat_completion(client, parse: Callable[[str], Any], retries: int = LLM_PARSE_RETRIES, **kwargs):
+    """
+    cached_chat_completion을 호출해 parse(응답)을 반환합니다.
+    파싱에 실패하면(ValueError, KeyError, TypeError) attempt=i로 최대 retries번 다시 호출하고, 모두 실패하면 마지막 예외를 던집니다.
+    """
+    for i in range(retries):
+        try:
+            return cached_chat_completion(client, attempt=i, parse=parse, **kwargs)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Failed to parse LLM response (attempt {i + 1}/{retries}): {e}")
+            last_error = e
+    raise last_error
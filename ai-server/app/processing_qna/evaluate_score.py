@@ -1,4 +1,8 @@
+import os
 import re
+import threading
+from functools import lru_cache
+import numpy as np
 from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
 from rouge_score import rouge_scorer
 from deepeval.metrics import SummarizationMetric
@@ -9,45 +13,91 @@ from deepeval.test_case import LLMTestCase, LLMTestCaseParams
 ##To discuss : 비교 대상, 혹은 점수 기준. 만약 일정 점수 이상 넘지 못하면 다시 generate 하는걸로?
 
 
+class ScoringEngine:
+    """
+    BLEU / ROUGE / recall을 함께 계산하는 채점기.
+    RougeScorer와 SmoothingFunction은 프로세스당 한 번만 만들고, 같은 텍스트는 한 번만 토큰화(및 stemming)합니다.
+    백틱 처리 루프처럼 하나의 긴 원문(reference)을 여러 후보와 비교할 때 원문 전처리를 재사용합니다.
+
+    토큰 재사용은 rouge_score의 비공개 함수(_tokenizer, _create_ngrams, _score_ngrams, _score_lcs)에 의존하므로
+    requirements.txt에서 rouge-score 버전을 고정하고, tests/test_evaluate_score.py에서 RougeScorer.score와 결과가 같은지 확인합니다.
+    비공개 함수가 없는 버전에서는 공개 API인 RougeScorer.score로 계산합니다.
+    """
+    ROUGE_TYPES = ['rouge1', 'rouge2', 'rougeL']
+    ROUGE_INTERNALS = ('_create_ngrams', '_score_ngrams', '_score_lcs')
+
+    def __init__(self, cache_size=256):
+        self._rouge_scorer = rouge_scorer.RougeScorer(self.ROUGE_TYPES, use_stemmer=True)
+        self._smoothie = SmoothingFunction().method4
+        self._prepare = lru_cache(maxsize=cache_size)(self._prepare_text)
+        self.reuse_rouge_tokens = hasattr(self._rouge_scorer, '_tokenizer') and all(hasattr(rouge_scorer, name) for name in self.ROUGE_INTERNALS)
+
+    def _prepare_text(self, text):
+        """한 텍스트에 대해 세 지표가 사용하는 토큰을 모두 미리 계산."""
+        words = text.split()
+        prepared = {"words": words, "word_set": frozenset(words)}
+        if self.reuse_rouge_tokens:
+            rouge_tokens = self._rouge_scorer._tokenizer.tokenize(text)
+            prepared["rouge_tokens"] = rouge_tokens
+            prepared["rouge_ngrams"] = {n: rouge_scorer._create_ngrams(rouge_tokens, n) for n in (1, 2)}
+        return prepared
+
+    def bleu(self, reference, hypothesis):
+        return sentence_bleu([self._prepare(reference)["words"]], self._prepare(hypothesis)["words"], smoothing_function=self._smoothie)
+
+    def rouge(self, reference, hypothesis):
+        if not self.reuse_rouge_tokens:
+            return self._rouge_scorer.score(reference, hypothesis)
+        prepared_reference, prepared_hypothesis = self._prepare(reference), self._prepare(hypothesis)
+        return {
+            "rouge1": rouge_scorer._score_ngrams(prepared_reference["rouge_ngrams"][1], prepared_hypothesis["rouge_ngrams"][1]),
+            "rouge2": rouge_scorer._score_ngrams(prepared_reference["rouge_ngrams"][2], prepared_hypothesis["rouge_ngrams"][2]),
+            "rougeL": rouge_scorer._score_lcs(prepared_reference["rouge_tokens"], prepared_hypothesis["rouge_tokens"]),
+        }
+
+    def recall(self, reference, hypothesis):
+        ref_ngrams = self._prepare(reference)["word_set"]
+        hyp_ngrams = self._prepare(hypothesis)["word_set"]
+        if len(ref_ngrams) == 0:
+            return 0.0
+        return len(ref_ngrams & hyp_ngrams) / len(ref_ngrams)
+
+    def score(self, reference, hypothesis):
+        """하나의 (reference, hypothesis) 쌍에 대한 BLEU, ROUGE, recall."""
+        return {
+            "bleu": self.bleu(reference, hypothesis),
+            "rouge": self.rouge(reference, hypothesis),
+            "recall": self.recall(reference, hypothesis)
+        }
+
+    def score_many(self, reference, hypotheses):
+        """하나의 reference와 여러 hypothesis를 비교. reference는 한 번만 전처리됩니다."""
+        return [self.score(reference, hypothesis) for hypothesis in hypotheses]
+
+    def score_pairs(self, pairs):
+        """여러 (reference, hypothesis) 쌍을 채점."""
+        return [self.score(reference, hypothesis) for reference, hypothesis in pairs]
+
+
+scoring_engine = ScoringEngine()
+
+
 def evaluate_bleu(reference, hypothesis):
     """Evaluates BLEU score between reference and hypothesis."""
-    reference_tokens = reference.split()
-    hypothesis_tokens = hypothesis.split()
-
-    smoothie = SmoothingFunction().method4
-    score = sentence_bleu([reference_tokens], hypothesis_tokens, smoothing_function=smoothie)
-    return score
+    return scoring_engine.bleu(reference, hypothesis)
 
 def evaluate_rouge(reference, hypothesis):
     """Evaluates ROUGE scores between reference and hypothesis."""
-    scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
-    scores = scorer.score(reference, hypothesis)
-    return scores
+    return scoring_engine.rouge(reference, hypothesis)
 
 def evaluate_recall(reference, hypothesis):
     """Computes recall as overlap of n-grams between reference and hypothesis."""
-    ref_ngrams = set(reference.split())
-    hyp_ngrams = set(hypothesis.split())
-    if len(ref_ngrams) == 0:
-        return 0.0
-    recall = len(ref_ngrams & hyp_ngrams) / len(ref_ngrams)
-    return recall
+    return scoring_engine.recall(reference, hypothesis)
 
 def evaluate_processed_answer(original_answer, processed_answer):
     """Evaluates BLEU, ROUGE, and recall scores between the original and processed answer."""
-    bleu_score = evaluate_bleu(original_answer, processed_answer)
-    rouge_scores = evaluate_rouge(original_answer, processed_answer)
-    recall_score = evaluate_recall(original_answer, processed_answer)
-
-    #print(f"BLEU Score: {bleu_score:.4f}")
-    #print(f"ROUGE Scores: {rouge_scores}")
-    #print(f"Recall Score: {recall_score:.4f}")
+    return scoring_engine.score(original_answer, processed_answer)
 
-    return {
-        "bleu": bleu_score,
-        "rouge": rouge_scores,
-        "recall": recall_score
-    }
 def evaluate_coherence(original_question, summarized_question):
     """Evaluates the quality of the summarization using GEval Coherence."""
     if not original_question or not summarized_question:
@@ -77,6 +127,138 @@ def evaluate_coherence(original_question, summarized_question):
     }
 
 
+# 원문과 요약의 임베딩 유사도가 ACCEPT_EDGE 이상이면 통과, REJECT_EDGE 이하이면 탈락으로 판정하고 GEval은 그 사이 구간에서만 호출
+# 임베딩을 계산하지 못하면(API 오류 등) 로컬에서 판정하지 않고 GEval로 평가
+COHERENCE_ACCEPT_EDGE = float(os.getenv("COHERENCE_ACCEPT_EDGE", 0.85))
+COHERENCE_REJECT_EDGE = float(os.getenv("COHERENCE_REJECT_EDGE", 0.35))
+# 로컬 통과에 필요한 최소 content_coverage. 주제는 같지만 원문의 요구사항을 빠뜨린 요약을 걸러냄
+COHERENCE_MIN_COVERAGE = float(os.getenv("COHERENCE_MIN_COVERAGE", 0.2))
+# 요약 길이 / 원문 길이가 이 범위를 벗어나면 로컬에서 통과시키지 않음 (한두 단어 조각, 원문보다 긴 요약)
+COHERENCE_MIN_LENGTH_RATIO = float(os.getenv("COHERENCE_MIN_LENGTH_RATIO", 0.1))
+COHERENCE_MAX_LENGTH_RATIO = float(os.getenv("COHERENCE_MAX_LENGTH_RATIO", 1.2))
+COHERENCE_EMBEDDING_MODEL = os.getenv("COHERENCE_EMBEDDING_MODEL", "solar-embedding-1-large-passage")
+
+tiered_evaluation_stats = {"total": 0, "accepted_locally": 0, "rejected_locally": 0, "geval": 0}
+_stats_lock = threading.Lock()
+_embedding_lock = threading.Lock()
+_embedding_model = None
+_embedding_cache = None
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def _get_embedding_backend():
+    """프로세스 공용 임베딩 모델과 임베딩 캐시를 처음 사용할 때 한 번만 만듭니다."""
+    global _embedding_model, _embedding_cache
+    with _embedding_lock:
+        if _embedding_model is None:
+            from langchain_upstage import UpstageEmbeddings
+            from app.embedding_cache import EmbeddingCache
+            _embedding_cache = EmbeddingCache()
+            _embedding_model = UpstageEmbeddings(model=COHERENCE_EMBEDDING_MODEL)
+        return _embedding_model, _embedding_cache
+
+
+def embedding_similarity(original_question, summarized_question):
+    """
+    원문과 요약의 코사인 유사도. 두 텍스트를 embed_with_cache로 한 번에 임베딩하며(캐시에 없는 텍스트만 요청),
+    원문 임베딩은 같은 질문의 다른 후보를 평가할 때 캐시에서 재사용됩니다. 임베딩에 실패하면 None을 반환.
+    """
+    from app.embedding_cache import embed_with_cache
+    try:
+        embedding_model, embedding_cache = _get_embedding_backend()
+        a, b = embed_with_cache(embedding_model, COHERENCE_EMBEDDING_MODEL, [original_question, summarized_question], cache=embedding_cache)
+    except Exception as e:
+        print(f"Embedding failed, falling back to GEval: {e}")
+        return None
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def _character_bigrams(text):
+    # 공백을 제거한 글자 bigram. 한국어 조사가 붙어 공백 단위 토큰이 달라져도 어간이 같으면 겹침
+    compact = _WHITESPACE_PATTERN.sub("", text.lower())
+    return {compact[i:i + 2] for i in range(len(compact) - 1)}
+
+
+def content_coverage(original_question, summarized_question):
+    """원문의 글자 bigram 중 요약에 포함된 비율. 원문 내용을 요약이 얼마나 담고 있는지를 나타냅니다."""
+    original_bigrams = _character_bigrams(original_question)
+    if not original_bigrams:
+        return 0.0
+    return len(original_bigrams & _character_bigrams(summarized_question)) / len(original_bigrams)
+
+
+def local_coherence_score(original_question, summarized_question):
+    """
+    GEval 없이 프로세스 내에서 계산하는 요약 점수(0~1).
+    - score: 원문과 요약의 임베딩 유사도 (embedding_similarity), 임베딩에 실패하면 None
+    - coverage: 원문 내용 중 요약에 담긴 비율 (content_coverage), 로컬 통과의 최소 조건으로만 사용
+    - length_ratio: 요약이 너무 짧거나(COHERENCE_MIN_LENGTH_RATIO 미만) 원문보다 길거나, 원문을 그대로 복사했다면 degenerate로 표시하고 로컬에서 통과시키지 않음
+    """
+    length_ratio = len(summarized_question) / max(len(original_question), 1)
+    coverage = content_coverage(original_question, summarized_question)
+    similarity = embedding_similarity(original_question, summarized_question)
+    verbatim = _WHITESPACE_PATTERN.sub(" ", summarized_question).strip() == _WHITESPACE_PATTERN.sub(" ", original_question).strip()
+    degenerate = verbatim or not (COHERENCE_MIN_LENGTH_RATIO <= length_ratio <= COHERENCE_MAX_LENGTH_RATIO)
+
+    return {
+        "score": similarity,
+        "length_ratio": length_ratio,
+        "coverage": coverage,
+        "embedding_similarity": similarity,
+        "verbatim": verbatim,
+        "degenerate": degenerate
+    }
+
+
+def _count(key):
+    with _stats_lock:
+        tiered_evaluation_stats["total"] += 1
+        tiered_evaluation_stats[key] += 1
+
+
+def evaluate_coherence_tiered(original_question, summarized_question, accept_edge=COHERENCE_ACCEPT_EDGE, reject_edge=COHERENCE_REJECT_EDGE):
+    """
+    임베딩 유사도로 명확한 후보는 바로 판정하고, 애매한 구간(reject_edge, accept_edge)의 후보만 GEval로 평가합니다.
+    로컬 통과에는 degenerate가 아니고 coverage가 COHERENCE_MIN_COVERAGE 이상이어야 하며, 임베딩에 실패하면 항상 GEval로 평가합니다.
+    반환 형식은 evaluate_coherence와 같으며, 판정 경로를 나타내는 tier 값("local" 또는 "geval")이 추가됩니다.
+    로컬 점수와 GEval 점수는 척도가 다르므로 후보를 비교할 때는 tier를 함께 고려해야 합니다.
+    """
+    if not original_question or not summarized_question:
+        return evaluate_coherence(original_question, summarized_question)
+
+    signals = local_coherence_score(original_question, summarized_question)
+    if signals["score"] is not None and not signals["degenerate"] and signals["score"] >= accept_edge and signals["coverage"] >= COHERENCE_MIN_COVERAGE:
+        _count("accepted_locally")
+        return {"coherence_score": signals["score"], "reason": f"Accepted by local metrics: {signals}", "tier": "local"}
+    if signals["score"] is not None and signals["score"] <= reject_edge:
+        _count("rejected_locally")
+        return {"coherence_score": signals["score"], "reason": f"Rejected by local metrics: {signals}", "tier": "local"}
+
+    _count("geval")
+    result = evaluate_coherence(original_question, summarized_question)
+    result["tier"] = "geval"
+    return result
+
+
+def snapshot_tiered_evaluation_stats():
+    """현재까지의 evaluate_coherence_tiered 판정 수. get_tiered_evaluation_report(since=...)에 넘겨 한 실행의 판정 수만 집계합니다."""
+    with _stats_lock:
+        return dict(tiered_evaluation_stats)
+
+
+def get_tiered_evaluation_report(since=None):
+    """
+    evaluate_coherence_tiered 호출 중 GEval 호출을 생략한 비율을 반환.
+    since(snapshot_tiered_evaluation_stats 결과)가 주어지면 그 이후의 호출만 집계합니다.
+    """
+    report = snapshot_tiered_evaluation_stats()
+    if since is not None:
+        report = {key: value - since.get(key, 0) for key, value in report.items()}
+    report["geval_avoided_ratio"] = (report["total"] - report["geval"]) / report["total"] if report["total"] else 0.0
+    return report
+
+
+
 
 
 
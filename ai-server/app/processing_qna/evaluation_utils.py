@@ -129,9 +129,10 @@ class EvaluationUtils:
 
 
 
-# 함수 실행
-evaluation_utils = EvaluationUtils()
-# messages = evaluation_utils.get_messages_by_conversation_id(EXAMPLE1_CONVERSATION_ID)
-# data = evaluation_utils.get_indices_by_conversation_id(EXAMPLE1_CONVERSATION_ID)
+# 함수 실행 (모듈을 import할 때 DB를 조회하지 않도록 직접 실행할 때만)
+if __name__ == "__main__":
+  evaluation_utils = EvaluationUtils()
+  # messages = evaluation_utils.get_messages_by_conversation_id(EXAMPLE1_CONVERSATION_ID)
+  # data = evaluation_utils.get_indices_by_conversation_id(EXAMPLE1_CONVERSATION_ID)
 
-data = evaluation_utils.get_message_to_index_dict_by_conversation_id(EXAMPLE1_CONVERSATION_ID)
+  data = evaluation_utils.get_message_to_index_dict_by_conversation_id(EXAMPLE1_CONVERSATION_ID)
@@ -1,9 +1,12 @@
+import hashlib
 import os
 import re
+import threading
 import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
 
 from dotenv import load_dotenv
-from typing import Annotated, List, Tuple
+from typing import Annotated, Callable, Dict, List, Optional, Tuple
 from tqdm import tqdm
 
 # langchin
@@ -17,23 +20,33 @@ from langgraph.graph import END, START, StateGraph, MessagesState
 from langgraph.prebuilt import ToolNode
 
 # langfuse
-from langfuse import Langfuse
+from app.prompt_registry import get_prompt
 from langfuse.callback import CallbackHandler
 
 # 평가 함수 불러오기
 from app.processing_qna.evaluation_utils import EvaluationUtils
-from app.processing_qna.evaluate_score import evaluate_processed_answer, evaluate_coherence  
+from app.processing_qna.evaluate_score import evaluate_processed_answer, evaluate_coherence_tiered, get_tiered_evaluation_report, snapshot_tiered_evaluation_stats
 
 from app.type import CodeStorage, QA, QAProcessorGraphState as GraphState
 from app.constants import CONVERSATION_ID
 from app.processing_qna.processed_qna_db import ProcessedQnADBHandler
+from app.llm_cache import CachedChatModel
 
 langfuse_handler = CallbackHandler()
-langfuse = Langfuse()
 
 load_dotenv()
 openai_api_key = os.getenv("OPENAI_API_KEY")
 
+CODE_PATTERN = re.compile(r"```(.*?)```", re.DOTALL)
+
+# 질문 요약/백틱 처리에서 한 라운드에 동시에 생성하고 평가할 후보 수 (1이면 생성 -> 평가 -> 재생성 순차 루프)
+# 값을 키우면 한 쌍의 최악 지연 시간은 MAX_ITERATION 라운드에서 약 MAX_ITERATION / 후보 수 라운드로 줄지만,
+# 첫 후보가 기준점을 넘는 경우에도 라운드의 후보를 모두 생성하고 평가하므로 LLM 호출이 늘어납니다.
+# 특히 백틱 처리 후보는 매번 답변 전체를 다시 보내므로 긴 답변이 많은 대화에서는 토큰 비용이 후보 수만큼 커집니다.
+QNA_NUM_CANDIDATES = int(os.getenv("QNA_NUM_CANDIDATES", 1))
+# 후보 비교 시 평가 tier 우선순위. 로컬 지표 점수는 GEval 점수와 척도가 달라 같은 조건이면 GEval 점수를 우선
+TIER_PRIORITY = {"geval": 1, "local": 0}
+
 
 class QnAProcessor:
     """
@@ -44,9 +57,11 @@ class QnAProcessor:
     - pair_list (List[QA]): 처리할 Q&A 쌍의 리스트.
     - model: LLM 모델 인스턴스.
     - code_documents (List[CodeStorage]): 각 Q&A 쌍에 대한 코드 문서 정보를 저장하는 리스트.
+    - code_descriptions (Dict[str, str]): 코드 해시별 코드 설명. 같은 코드는 한 번만 설명을 생성합니다.
+    - code_index_by_hash (Dict[str, str]): 코드 해시별 Code_Snippet 번호. 같은 코드는 하나의 CodeStorage 항목을 공유합니다.
 
     Methods:
-    - process_qna_pair(): Q&A 쌍을 처리하고 코드 스니펫을 설명으로 대체하며, 최종 Q&A 쌍과 코드 문서 리스트를 반환합니다.
+    - process_qna_pair(graph_state, MAX_ITERATION, max_workers): Q&A 쌍을 (병렬로) 처리하고 코드 스니펫을 설명으로 대체하며, 최종 Q&A 쌍과 코드 문서 리스트를 반환합니다.
     - extract_code_and_replace_with_description(qna_pair): 질문과 답변에서 코드를 추출하고 설명으로 대체합니다.
     - backtick_process_with_llm(answer): 답변 내 코드에 백틱(```)을 추가하여 명확하게 표시합니다.
     - describe_code_with_llm(code_snippet): LLM을 사용하여 주어진 코드 스니펫에 대한 설명을 생성합니다.
@@ -57,65 +72,47 @@ class QnAProcessor:
         self.qna_list = qna_list
         self.model = model
         self.code_documents: List[CodeStorage] = []
+        self.code_descriptions: Dict[str, str] = {}    # 코드 해시 -> 코드 설명
+        self.code_index_by_hash: Dict[str, str] = {}   # 코드 해시 -> Code_Snippet 번호
     
-    def process_qna_pair(self, graph_state:GraphState, MAX_ITERATION:int=3) -> Tuple[List[QA], List[CodeStorage]]:
-        """Q&A 쌍을 처리하고 코드 스니펫을 설명으로 대체하며, 최종 Q&A 쌍과 코드 문서 리스트를 반환"""
-        for qna_pair in tqdm(self.qna_list, desc="Processing Q&A Pairs", unit="pair"):
+    def process_qna_pair(self, graph_state:GraphState, MAX_ITERATION:int=3, max_workers:int=1, num_candidates:int=1, on_progress:Optional[Callable[[int, int], None]]=None, cancel_event:Optional[threading.Event]=None) -> Tuple[List[QA], List[CodeStorage]]:
+        """
+        Q&A 쌍을 처리하고 코드 스니펫을 설명으로 대체하며, 최종 Q&A 쌍과 코드 문서 리스트를 반환.
+        max_workers가 1보다 크면 Q&A 쌍들을 최대 max_workers개까지 병렬로 처리합니다.
+        Code_Snippet 번호는 LLM 호출이 끝난 뒤 대화 순서대로 부여하므로 직렬 처리 결과와 동일합니다.
+        num_candidates는 질문 요약/백틱 처리에서 한 번에 생성하고 평가할 후보 수입니다.
+        on_progress가 주어지면 Q&A 쌍 하나의 처리가 끝날 때마다 on_progress(처리한 수, 전체 수)를 호출합니다.
+        cancel_event가 설정되면 아직 시작하지 않은 Q&A 쌍과 코드 설명 생성은 LLM을 호출하지 않고 CancelledError를 발생시킵니다.
+        """
+        def check_cancelled():
+            if cancel_event is not None and cancel_event.is_set():
+                raise CancelledError("Q&A processing was cancelled")
+
+        def refine(qna_pair):
+            check_cancelled()
+            return self._refine_qna_pair(qna_pair, MAX_ITERATION, num_candidates)
+        report = on_progress or (lambda done, total: None)
+        refined_pairs = []
+        if max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for refined_pair in tqdm(executor.map(refine, self.qna_list), total=len(self.qna_list), desc="Processing Q&A Pairs", unit="pair"):
+                    refined_pairs.append(refined_pair)
+                    report(len(refined_pairs), len(self.qna_list))
+        else:
+            for qna_pair in tqdm(self.qna_list, desc="Processing Q&A Pairs", unit="pair"):
+                refined_pairs.append(refine(qna_pair))
+                report(len(refined_pairs), len(self.qna_list))
+
+        # 대화 전체의 코드 블록 중 중복을 제거한 스니펫만 설명 생성
+        check_cancelled()
+        code_snippets = [snippet for question, answer in refined_pairs for snippet in self._find_code_blocks(question, answer)]
+        self._describe_unique_snippets(code_snippets, max_workers)
+
+        # 코드 스니펫 번호 부여 및 치환은 대화 순서대로 수행
+        for qna_pair, (question, answer) in zip(self.qna_list, refined_pairs):
             graph_state["processing_data"] = qna_pair
 
-            question = qna_pair["q"]
-            answer = qna_pair["a"]
-
-            coherent_score = 0
-            best_summarized_question = "" 
-            for i in range(MAX_ITERATION):
-                summarized_question = self.summarize_question_with_llm(question)
-                coherence_result = evaluate_coherence(question, summarized_question)
-                
-                current_score  = coherence_result.get("coherence_score")
-                coherent_reason = coherence_result.get("reason")
-                
-                print(f"Iteration {i + 1}/{MAX_ITERATION}")
-                print(f"Coherent score: {current_score }")
-                print(f"Coherent reason: {coherent_reason}")
-
-                if current_score > coherent_score:
-                    coherent_score = current_score
-                    best_summarized_question = summarized_question 
-                
-                if coherent_score >= 0.8:
-                    print("Coherent score 기준점을 넘음. 반복 종료.")
-                    break
-                else:
-                    print("Coherent score 기준점을 넘지 못하여 다시 summarize 실행 중...")
-            
-            # coherent_score >= 0.8 이면 summarized_question 반영 
-            graph_state["processing_data"]["q"] = best_summarized_question
-
-
-            recall_score = 0
-            best_processed_answer = ""
-            for i in range(MAX_ITERATION):
-                processed_answer = self.backtick_process_with_llm(answer)
-                evaluation_results = evaluate_processed_answer(answer, processed_answer)
-                
-                current_recall_score = evaluation_results.get("recall")
-                print(f"Iteration {i + 1}/{MAX_ITERATION}")
-                print(f"Recall score: {current_recall_score}")
-
-                if current_recall_score > recall_score:
-                    recall_score = current_recall_score
-                    best_processed_answer = processed_answer  
-                
-                if recall_score >= 0.90:
-                    print("Recall score 기준점을 넘음. 반복 종료.")
-                    break
-                else:
-                    print("Recall score 기준점을 넘지 못하여 다시 backtick 처리 실행 중...")
-
-            graph_state["processing_data"]["a"] = best_processed_answer
-            
-            question_without_code, answer_without_code = self.extract_code_and_replace_with_description(summarized_question, processed_answer)            
+            question_without_code, answer_without_code = self._replace_code_blocks(question, answer)
             graph_state["code_documents"] = self.code_documents
             qna_pair["q"] = question_without_code
             qna_pair["a"] = answer_without_code
@@ -124,72 +121,182 @@ class QnAProcessor:
             graph_state["processed_conversations"].append(qna_pair)
 
         return self.qna_list, self.code_documents
-    
-    
-    def extract_code_and_replace_with_description(self, question:str, answer:str, description_prefix="Code_Snippet") -> Tuple[str, str]:
-        """질문과 답변에서 코드 스니펫을 추출하고 설명으로 대체"""
-
-        code_pattern = r"```(.*?)```"
-        code_index_counter = len(self.code_documents)
 
+    def _refine_qna_pair(self, qna_pair:QA, MAX_ITERATION:int=3, num_candidates:int=1) -> Tuple[str, str]:
+        """
+        질문 요약과 답변 백틱 처리를 평가 점수가 기준을 넘을 때까지 반복하고 질문과 답변을 반환.
+        num_candidates=1이면 기존처럼 마지막으로 생성된 질문과 답변을, 2 이상이면 가장 점수가 높은 질문과 답변을 반환합니다.
+        """
+        question = qna_pair["q"]
+        answer = qna_pair["a"]
+
+        def _score_summary(summarized_question):
+            coherence_result = evaluate_coherence_tiered(question, summarized_question)
+            print(f"Coherent score: {coherence_result.get('coherence_score')}")
+            print(f"Coherent reason: {coherence_result.get('reason')}")
+            return coherence_result.get("coherence_score"), coherence_result.get("tier")
+
+        def _score_processed_answer(processed_answer):
+            current_recall_score = evaluate_processed_answer(answer, processed_answer).get("recall")
+            print(f"Recall score: {current_recall_score}")
+            return current_recall_score, None
+
+        best_summarized_question = self._select_best_candidate(
+            generate=lambda attempt: self.summarize_question_with_llm(question, attempt=attempt),
+            score=_score_summary,
+            threshold=0.8,
+            MAX_ITERATION=MAX_ITERATION,
+            num_candidates=num_candidates,
+            label="Coherent score"
+        )
+        best_processed_answer = self._select_best_candidate(
+            generate=lambda attempt: self.backtick_process_with_llm(answer, attempt=attempt),
+            score=_score_processed_answer,
+            threshold=0.90,
+            MAX_ITERATION=MAX_ITERATION,
+            num_candidates=num_candidates,
+            label="Recall score"
+        )
+        return best_summarized_question, best_processed_answer
+
+    @staticmethod
+    def _select_best_candidate(generate, score, threshold:float, MAX_ITERATION:int, num_candidates:int=1, label:str="Score") -> str:
+        """
+        후보를 num_candidates개씩 동시에 생성하고 평가하여 가장 점수가 높은 후보를 반환.
+        라운드의 최고 점수가 threshold 이상이면 조기 종료하며, 후보는 최대 MAX_ITERATION개까지 생성합니다.
+        num_candidates=1이면 기존의 생성 → 평가 → 재생성 순차 루프와 같으며, 기존 동작대로 마지막으로 생성된 후보를 반환합니다.
+        로컬 지표 점수와 GEval 점수는 척도가 다르므로, 후보는 (기준점 통과 여부, 평가 tier 우선순위, 점수) 순서로 비교합니다.
+        기준점 통과 여부가 같으면 GEval로 평가한 후보를 로컬 지표로만 평가한 후보보다 우선합니다.
+
+        Args:
+            generate (Callable[[int], str]): attempt 번호를 받아 후보를 생성하는 함수.
+            score (Callable[[str], Tuple[float | None, str | None]]): 후보의 (점수, 평가 tier)를 계산하는 함수.
+        """
+        def _generate_and_score(attempt):
+            candidate = generate(attempt)
+            current_score, tier = score(candidate)
+            current_score = current_score or 0
+            return candidate, current_score, (current_score >= threshold, TIER_PRIORITY.get(tier, 0), current_score)
+
+        best_candidate, best_score, best_rank, last_candidate = None, -1, None, None
+        for round_start in range(0, MAX_ITERATION, num_candidates):
+            attempts = range(round_start, min(round_start + num_candidates, MAX_ITERATION))
+            print(f"Iteration {attempts[-1] + 1}/{MAX_ITERATION}")
+            if len(attempts) > 1:
+                with ThreadPoolExecutor(max_workers=len(attempts)) as executor:
+                    results = list(executor.map(_generate_and_score, attempts))
+            else:
+                results = [_generate_and_score(attempts[0])]
+
+            for candidate, current_score, rank in results:
+                last_candidate = candidate
+                if best_rank is None or rank > best_rank:
+                    best_candidate, best_score, best_rank = candidate, current_score, rank
+
+            if best_score >= threshold:
+                print(f"{label} 기준점을 넘음. 반복 종료.")
+                break
+            else:
+                print(f"{label} 기준점을 넘지 못하여 다시 생성 중...")
+
+        return best_candidate if num_candidates > 1 else last_candidate
+
+    def extract_code_and_replace_with_description(self, question:str, answer:str, description_prefix="Code_Snippet", max_workers:int=1) -> Tuple[str, str]:
+        """질문과 답변에서 코드 스니펫을 추출하고 설명으로 대체"""
+        self._describe_unique_snippets(self._find_code_blocks(question, answer), max_workers)
+        return self._replace_code_blocks(question, answer, description_prefix)
+
+    @staticmethod
+    def _find_code_blocks(question:str, answer:str) -> List[str]:
+        """질문, 답변 순서로 등장하는 코드 블록을 반환"""
+        return [match.group(1).strip() for text in (question, answer) for match in CODE_PATTERN.finditer(text)]
+
+    @staticmethod
+    def _code_hash(code_snippet:str) -> str:
+        """줄 끝 공백과 앞뒤 공백을 무시한 코드 내용의 해시"""
+        normalized = "\n".join(line.rstrip() for line in code_snippet.strip().splitlines())
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def _describe_unique_snippets(self, code_snippets:List[str], max_workers:int=1) -> None:
+        """아직 설명이 없는 고유 코드 스니펫만 LLM으로 설명을 생성해 self.code_descriptions에 저장"""
+        unique_snippets = {}
+        for code_snippet in code_snippets:
+            code_hash = self._code_hash(code_snippet)
+            if code_hash not in self.code_descriptions and code_hash not in unique_snippets:
+                unique_snippets[code_hash] = code_snippet
+
+        describe = lambda code_snippet: self.describe_code_with_llm(code_snippet=code_snippet)
+        if max_workers > 1 and len(unique_snippets) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                descriptions = list(executor.map(describe, unique_snippets.values()))
+        else:
+            descriptions = [describe(code_snippet) for code_snippet in unique_snippets.values()]
+        self.code_descriptions.update(zip(unique_snippets.keys(), descriptions))
+
+    def _replace_code_blocks(self, question:str, answer:str, description_prefix="Code_Snippet") -> Tuple[str, str]:
+        """
+        코드 블록을 미리 생성한 설명으로 대체하고, 처음 등장한 순서대로 번호를 매겨 code_documents에 저장.
+        내용이 같은 코드 블록은 같은 Code_Snippet 번호와 CodeStorage 항목을 공유합니다.
+        """
         def _replace_code_with_placeholder(match):
-            nonlocal code_index_counter
             code_snippet = match.group(1).strip()
-            # LLM 호출로 코드 설명 생성
-            code_description = self.describe_code_with_llm(code_snippet=code_snippet)
-            code_index_counter +=1
-            code_index = f"{description_prefix}_{code_index_counter}"
-            
-            placeholder = f"{code_index}: {code_description}"
-
-            # 코드 저장
-            code_storage = CodeStorage(
-                code_snippet=code_snippet,
-                code_index=code_index,
-                code_description=code_description,
-            )
-            self.code_documents.append(code_storage)
+            code_hash = self._code_hash(code_snippet)
+            code_description = self.code_descriptions[code_hash]
+
+            code_index = self.code_index_by_hash.get(code_hash)
+            if code_index is None:
+                code_index = f"{description_prefix}_{len(self.code_documents) + 1}"
+                self.code_index_by_hash[code_hash] = code_index
+
+                # 코드 저장
+                code_storage = CodeStorage(
+                    code_snippet=code_snippet,
+                    code_index=code_index,
+                    code_description=code_description,
+                )
+                self.code_documents.append(code_storage)
 
+            placeholder = f"{code_index}: {code_description}"
             return f"<-- {placeholder} -->"
 
-        question_without_code = re.sub(code_pattern, _replace_code_with_placeholder, question, flags=re.DOTALL)
-        answer_without_code = re.sub(code_pattern, _replace_code_with_placeholder, answer, flags=re.DOTALL)
+        question_without_code = CODE_PATTERN.sub(_replace_code_with_placeholder, question)
+        answer_without_code = CODE_PATTERN.sub(_replace_code_with_placeholder, answer)
         return question_without_code, answer_without_code
     
-    def backtick_process_with_llm(self, answer):
-        """LLM을 사용하여 코드에 백틱 추가."""
-        backtick_processor: Annotated[str, HumanMessage] = langfuse.get_prompt("backtick_processor")
+    def backtick_process_with_llm(self, answer, attempt:int=0):
+        """LLM을 사용하여 코드에 백틱 추가. attempt는 재시도 순번으로 응답 캐시 key에 사용."""
+        backtick_processor: Annotated[str, HumanMessage] = get_prompt("backtick_processor")
         prompt = backtick_processor.compile(answer=answer)
-        response = self.model.invoke(prompt)
+        response = self.model.invoke(prompt, attempt=attempt)
         return response.content.strip()
 
 
     def describe_code_with_llm(self, code_snippet:str) -> str:
         """LLM을 사용하여 코드 설명 생성."""
-        short_code_description: Annotated[str, HumanMessage] = langfuse.get_prompt("short_code_description")
+        short_code_description: Annotated[str, HumanMessage] = get_prompt("short_code_description")
         prompt = short_code_description.compile(code_snippet=code_snippet)
         response = self.model.invoke(prompt)
         return response.content.strip()
     
     
-    def summarize_question_with_llm(self, question):
-        """LLM을 사용하여 질문 요약."""
-        question_summarizer: Annotated[str, HumanMessage] = langfuse.get_prompt("question_summarizer")
+    def summarize_question_with_llm(self, question, attempt:int=0):
+        """LLM을 사용하여 질문 요약. attempt는 재시도 순번으로 응답 캐시 key에 사용."""
+        question_summarizer: Annotated[str, HumanMessage] = get_prompt("question_summarizer")
         prompt = question_summarizer.compile(question=question)
-        response = self.model.invoke(prompt)
+        response = self.model.invoke(prompt, attempt=attempt)
         return response.content.strip()
 
 
 
-def run_pipeline(model_name, conversation_id) :
+def run_pipeline(model_name, conversation_id, max_workers=4, num_candidates=QNA_NUM_CANDIDATES, on_progress=None, cancel_event=None) :
     # 평가시에 gpt-4o-mini 모델 사용
     if model_name == "gpt-4o-mini":
-        model= ChatOpenAI(model='gpt-4o-mini', temperature=0, max_tokens=None,
+        model= CachedChatModel(ChatOpenAI(model='gpt-4o-mini', temperature=0, max_tokens=None,
             timeout=None,
             max_retries=1,
             api_key = openai_api_key
-        )
-    else : model = ChatUpstage(model='solar-pro')
+        ))
+    else : model = CachedChatModel(ChatUpstage(model='solar-pro'))
 
     evaulation_utils = EvaluationUtils()
     conversation_data = evaulation_utils.get_messages_by_conversation_id(conversation_id)
@@ -204,9 +311,10 @@ def run_pipeline(model_name, conversation_id) :
 
     # Start the timer
     start_time = time.time()
+    evaluation_stats = snapshot_tiered_evaluation_stats()
 
     # Process Q&A pairs with a progress bar
-    processed_qna_list, code_documents = qna_processor.process_qna_pair(graph_state=init_graph_state)
+    processed_qna_list, code_documents = qna_processor.process_qna_pair(graph_state=init_graph_state, max_workers=max_workers, num_candidates=num_candidates, on_progress=on_progress, cancel_event=cancel_event)
 
     # Stop the timer
     end_time = time.time()
@@ -214,6 +322,7 @@ def run_pipeline(model_name, conversation_id) :
     # Calculate elapsed time
     elapsed_time = end_time - start_time
     print(f"Execution Time: {elapsed_time:.2f} seconds")
+    print(f"Coherence evaluation: {get_tiered_evaluation_report(since=evaluation_stats)}")
 
     return processed_qna_list, code_documents
 
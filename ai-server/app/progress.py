@@ -0,0 +1,155 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterator, List, Optional
+
+from app.llm_cache import llm_cache
+
+PROGRESS_DB_PATH = os.getenv("PROGRESS_DB_PATH", ".cache/progress.sqlite3")
+# 이 시간(초)보다 오래된 진행 이벤트는 새 이벤트를 기록할 때 삭제
+PROGRESS_RETENTION_SECONDS = float(os.getenv("PROGRESS_RETENTION_SECONDS", 24 * 3600))
+
+# SSE 스트림 하나를 열어 두는 최대 시간(초). 연결이 끊긴 클라이언트의 worker thread를 돌려받고, 클라이언트는 Last-Event-ID 재연결로 이어서 받음
+PROGRESS_STREAM_MAX_SECONDS = float(os.getenv("PROGRESS_STREAM_MAX_SECONDS", 55))
+# run_id의 이벤트가 하나도 없을 때 스트림을 닫기 전까지의 조회 횟수(기본 0.5초 간격으로 약 10초)
+PROGRESS_STREAM_MAX_IDLE_POLLS = int(os.getenv("PROGRESS_STREAM_MAX_IDLE_POLLS", 20))
+# 스트림이 닫힌 뒤 클라이언트가 재연결하기까지 기다리는 시간(초), SSE retry 필드로 전달
+PROGRESS_STREAM_RETRY_SECONDS = float(os.getenv("PROGRESS_STREAM_RETRY_SECONDS", 1))
+
+RUN_STAGE = "run"
+TERMINAL_STATUSES = ("finished", "failed")
+
+
+class ProgressStore:
+    """
+    파이프라인 진행 이벤트를 run_id별로 저장하는 SQLite 테이블.
+    파이프라인을 실행하는 worker와 SSE로 이벤트를 보내는 worker가 달라도 같은 파일을 통해 이벤트를 공유합니다.
+
+    Attributes:
+    - path (str): SQLite 파일 경로.
+    """
+
+    def __init__(self, path: str = PROGRESS_DB_PATH, retention_seconds: float = PROGRESS_RETENTION_SECONDS) -> None:
+        self.path = path
+        self.retention_seconds = retention_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS progress_events ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT NOT NULL, event TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS progress_events_run ON progress_events (run_id, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS progress_events_created_at ON progress_events (created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def append(self, run_id: str, event: dict) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO progress_events (run_id, event, created_at) VALUES (?, ?, ?)",
+                (run_id, json.dumps(event, ensure_ascii=False, default=str), now)
+            )
+            conn.execute("DELETE FROM progress_events WHERE created_at < ?", (now - self.retention_seconds,))
+
+    def events_after(self, run_id: str, seq: int = 0) -> List[dict]:
+        """run_id의 이벤트 중 seq보다 뒤의 이벤트를 순서대로 반환합니다. 각 이벤트에는 seq가 포함됩니다."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT seq, event FROM progress_events WHERE run_id = ? AND seq > ? ORDER BY seq", (run_id, seq)
+            ).fetchall()
+        return [{"seq": row_seq, **json.loads(event)} for row_seq, event in rows]
+
+
+progress_store = ProgressStore()
+
+
+class ProgressReporter:
+    """
+    파이프라인 실행 하나의 단계별 진행 이벤트를 기록합니다.
+    이벤트에는 단계 시작 이후 경과 시간과 LLM 호출 수(캐시 미스 + 캐시 미사용 호출), 캐시 적중 수가 포함됩니다.
+    LLM 호출 수는 worker 전체 카운터의 차이로 계산하므로, 같은 worker에서 동시에 실행 중인 다른 요청의 호출도 함께 집계될 수 있습니다.
+
+    Attributes:
+    - run_id (str | None): 진행 이벤트를 구독할 때 사용하는 ID. None이면 아무것도 기록하지 않습니다.
+    """
+
+    def __init__(self, run_id: Optional[str], store: Optional[ProgressStore] = None) -> None:
+        self.run_id = run_id
+        self.store = store or progress_store
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def _emit(self, stage: str, status: str, **fields) -> None:
+        if self.run_id is None:
+            return
+        with self._lock:
+            started_at, stats_before = self._stages.get(stage, (time.time(), llm_cache.snapshot()))
+        stats_after = llm_cache.snapshot()
+        event = {
+            "run_id": self.run_id,
+            "stage": stage,
+            "status": status,
+            "elapsed": round(time.time() - started_at, 2),
+            "llm_calls": (stats_after["misses"] + stats_after["bypassed"]) - (stats_before["misses"] + stats_before["bypassed"]),
+            "llm_cache_hits": stats_after["hits"] - stats_before["hits"],
+            "timestamp": time.time(),
+            **fields,
+        }
+        self.store.append(self.run_id, event)
+
+    def start(self, stage: str, total: Optional[int] = None) -> None:
+        with self._lock:
+            self._stages[stage] = (time.time(), llm_cache.snapshot())
+        self._emit(stage, "started", total=total)
+
+    def advance(self, stage: str, done: int, total: int) -> None:
+        self._emit(stage, "progress", done=done, total=total)
+
+    def finish(self, stage: str, **fields) -> None:
+        self._emit(stage, "finished", **fields)
+
+    def fail(self, stage: str, error: str) -> None:
+        self._emit(stage, "failed", error=error)
+
+    def callback(self, stage: str):
+        """(done, total)를 받는 진행 콜백을 반환합니다. 각 모듈의 on_progress 인자로 넘깁니다."""
+        return lambda done, total: self.advance(stage, done, total)
+
+
+def stream_events(run_id: str, last_seq: int = 0, store: Optional[ProgressStore] = None, poll_interval: float = 0.5,
+                  keepalive_seconds: float = 15, timeout_seconds: float = PROGRESS_STREAM_MAX_SECONDS,
+                  max_idle_polls: int = PROGRESS_STREAM_MAX_IDLE_POLLS) -> Iterator[str]:
+    """
+    run_id의 진행 이벤트를 Server-Sent Events 형식 문자열로 내보냅니다.
+    실행 전체(stage "run")가 끝나거나 실패하면, 또는 timeout_seconds가 지나면 종료합니다.
+    run_id의 이벤트가 하나도 없는 채로 max_idle_polls번 조회하면 종료합니다(잘못된 run_id 등).
+    종료 후 클라이언트(EventSource)는 Last-Event-ID로 재연결해 이어서 받습니다.
+    """
+    store = store or progress_store
+    started_at = last_sent_at = time.monotonic()
+    idle_polls = 0
+    # 재연결까지 기다리는 시간(ms)
+    yield f"retry: {int(PROGRESS_STREAM_RETRY_SECONDS * 1000)}\n\n"
+    while time.monotonic() - started_at < timeout_seconds:
+        for event in store.events_after(run_id, last_seq):
+            last_seq = event["seq"]
+            last_sent_at = time.monotonic()
+            yield f"id: {last_seq}\nevent: {event['stage']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if event["stage"] == RUN_STAGE and event["status"] in TERMINAL_STATUSES:
+                return
+        if last_seq == 0:
+            idle_polls += 1
+            if idle_polls >= max_idle_polls:
+                return
+        if time.monotonic() - last_sent_at >= keepalive_seconds:
+            last_sent_at = time.monotonic()
+            yield ": keepalive\n\n"
+        time.sleep(poll_interval)
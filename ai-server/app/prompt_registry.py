@@ -0,0 +1,106 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# langfuse
+from langfuse import Langfuse
+
+logger = logging.getLogger(__name__)
+
+PROMPT_CACHE_TTL = float(os.getenv("PROMPT_CACHE_TTL", 300))
+
+
+class PromptRegistry:
+    """
+    Langfuse 프롬프트를 worker 프로세스 단위로 캐싱하는 레지스트리.
+    프롬프트는 이름마다 한 번만 가져오고 이후에는 메모리에서 반환합니다.
+    TTL이 지난 프롬프트는 우선 기존 버전을 반환하고 백그라운드에서 새로 가져오며,
+    Langfuse가 느리거나 장애일 때는 마지막으로 가져온 버전을 계속 사용합니다.
+
+    Attributes:
+    - ttl_seconds (float): 프롬프트를 새로 가져오기 전까지 유지하는 시간(초).
+    - stats (dict): hits / misses / stale_hits / refreshes / refresh_failures 카운터.
+    """
+
+    def __init__(self, client: Optional[Langfuse] = None, ttl_seconds: float = PROMPT_CACHE_TTL) -> None:
+        self._client = client
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, Tuple[object, float]] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._fetch_locks: Dict[str, threading.Lock] = {}
+        self.stats = {"hits": 0, "misses": 0, "stale_hits": 0, "refreshes": 0, "refresh_failures": 0}
+
+    @property
+    def client(self) -> Langfuse:
+        if self._client is None:
+            self._client = Langfuse()
+        return self._client
+
+    def get(self, name: str):
+        """name에 해당하는 프롬프트를 반환합니다. 캐시에 없을 때만 Langfuse를 동기 호출합니다."""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                prompt, fetched_at = entry
+                if time.monotonic() - fetched_at < self.ttl_seconds:
+                    self.stats["hits"] += 1
+                else:
+                    self.stats["stale_hits"] += 1
+                    self._schedule_refresh(name)
+                return prompt
+            fetch_lock = self._fetch_locks.setdefault(name, threading.Lock())
+
+        # 같은 프롬프트를 여러 스레드가 동시에 요청해도 한 번만 가져오도록 이름별로 잠금
+        with fetch_lock:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is not None:
+                    self.stats["hits"] += 1
+                    return entry[0]
+                self.stats["misses"] += 1
+            prompt = self.client.get_prompt(name)
+            with self._lock:
+                self._entries[name] = (prompt, time.monotonic())
+            return prompt
+
+    def _schedule_refresh(self, name: str) -> None:
+        # self._lock을 잡은 상태에서 호출됩니다.
+        if name in self._refreshing:
+            return
+        self._refreshing.add(name)
+        threading.Thread(target=self._refresh, args=(name,), daemon=True).start()
+
+    def _refresh(self, name: str) -> None:
+        try:
+            prompt = self.client.get_prompt(name)
+            with self._lock:
+                self._entries[name] = (prompt, time.monotonic())
+                self.stats["refreshes"] += 1
+        except Exception as e:
+            # 마지막으로 가져온 버전을 계속 사용하고 TTL 이후에 다시 시도
+            logger.warning(f"Failed to refresh prompt '{name}', keeping the last known version: {e}")
+            with self._lock:
+                prompt, _ = self._entries[name]
+                self._entries[name] = (prompt, time.monotonic())
+                self.stats["refresh_failures"] += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(name)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, "cached_prompts": sorted(self._entries)}
+
+
+prompt_registry = PromptRegistry()
+
+
+def get_prompt(name: str):
+    """프로세스 공용 레지스트리에서 프롬프트를 가져옵니다."""
+    return prompt_registry.get(name)
@@ -5,6 +5,7 @@ from dotenv import load_dotenv
 load_dotenv()
 from openai import OpenAI
 client = OpenAI()
+from app.llm_cache import parsed_chat_completion
 import json
 import re
 
@@ -112,7 +113,10 @@ def format_content(content):
             "content": [Final combined and polished blog post in Markdown]
         }}
         """
-        response = client.chat.completions.create(
+        # 잘린 JSON 응답은 캐시에 저장하지 않고 attempt를 바꿔 다시 요청
+        json_result = parsed_chat_completion(
+            client,
+            parse=json.loads,
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "You are an assistant that helps to review and ghost write the blog drafts and merge them into a professional developer blog post."},
@@ -121,10 +125,6 @@ def format_content(content):
             response_format={ "type": "json_object" },        
             max_tokens=8000
         )
-        result = response.choices[0].message.content
-        
-        
-        json_result = json.loads(result)
 
         title = json_result.get("title", "No Title Found")
         content = json_result.get("content", "No Content Found").strip()
@@ -182,29 +182,57 @@ def create_notion_page(title, content, question_type, os_tags, framework_tags, l
     response = requests.post(url, headers=headers, json=data)
     return response.json()
 
-publish_to_notion_bp = Blueprint('publish_to_notion', __name__)
-
-@publish_to_notion_bp.route('/publish-to-notion', methods=['POST'])
-def publish_to_notion():
-    data = request.json
-    title = data.get('title')
-    content = data.get('content')
-    question_type = data.get('question_type', [])
-    os_tags = data.get('os_tags', [])
-    framework_tags = data.get('framework_tags', [])
-    language_tags = data.get('language_tags', [])
-    tech_stack_tags = data.get('tech_stack_tags', [])
+class NotionPublishError(Exception):
+    """
+    Notion 페이지 게시가 실패했을 때 발생하는 예외.
+
+    Attributes:
+    - message (str): 실패 원인 설명.
+    - details: Notion API 응답. 게시 요청 전에 실패했다면 None.
+    - status_code (int): /publish-to-notion이 반환할 HTTP 상태 코드.
+    """
+
+    def __init__(self, message, details=None, status_code=500):
+        super().__init__(message)
+        self.message = message
+        self.details = details
+        self.status_code = status_code
+
+def publish_blog(title, content, question_type, os_tags, framework_tags, language_tags, tech_stack_tags):
+    # 태그가 하나도 없으면 본문을 다시 정리한 뒤 Notion 페이지를 만들고 page_id, url, public_url을 반환
+    formatted_title, formatted_content = title, content
     try:
         if (os_tags.__len__() == 0 and framework_tags.__len__() == 0 and language_tags.__len__() == 0 and tech_stack_tags.__len__() == 0):
             formatted_title, formatted_content = format_content(content)
     except Exception as e:
         print("")
     if not formatted_title or not formatted_content:
-        return jsonify({"error": "Title and content are required"}), 400
+        raise NotionPublishError("Title and content are required", status_code=400)
 
     response = create_notion_page(formatted_title, formatted_content, question_type, os_tags, framework_tags, language_tags, tech_stack_tags)
     print("hihi", response)
-    if 'id' in response:
-        return jsonify({"message": "Notion page created successfully", "page_id": response['id'], "url": response['url'], "public_url": response['public_url']}), 200
-    else:
-        return jsonify({"error": "Failed to create Notion page", "details": response}), 500
+    if 'id' not in response:
+        raise NotionPublishError("Failed to create Notion page", details=response)
+    return {"page_id": response['id'], "url": response['url'], "public_url": response['public_url']}
+
+publish_to_notion_bp = Blueprint('publish_to_notion', __name__)
+
+@publish_to_notion_bp.route('/publish-to-notion', methods=['POST'])
+def publish_to_notion():
+    data = request.json
+    try:
+        page = publish_blog(
+            data.get('title'),
+            data.get('content'),
+            question_type=data.get('question_type', []),
+            os_tags=data.get('os_tags', []),
+            framework_tags=data.get('framework_tags', []),
+            language_tags=data.get('language_tags', []),
+            tech_stack_tags=data.get('tech_stack_tags', [])
+        )
+    except NotionPublishError as e:
+        body = {"error": e.message}
+        if e.details is not None:
+            body["details"] = e.details
+        return jsonify(body), e.status_code
+    return jsonify({"message": "Notion page created successfully", **page}), 200
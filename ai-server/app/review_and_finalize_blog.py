@@ -3,6 +3,7 @@
 from flask import Blueprint, request, jsonify
 from openai import OpenAI
 client = OpenAI()
+from app.llm_cache import parsed_chat_completion
 from dotenv import load_dotenv
 import os
 import json
@@ -24,24 +25,28 @@ def review_and_finalize_blog():
     data = request.json
     drafts = data.get('drafts')
 
-    title, content, question_types, requirements, framework_tags, language_tags, os_tags, tech_stack_tags = generate_final_blog(drafts)
-
     response = {
         "input": drafts,
-        "output": {
-            "title": title,
-            "content": content,
-            "question_type": question_types,
-            "requirements": requirements,
-            "framework_tags": framework_tags,
-            "language_tags": language_tags,
-            "os_tags": os_tags,
-            "tech_stack_tags": tech_stack_tags
-        }
+        "output": finalize_blog(drafts)
     }
     
     return jsonify(response)
 
+def finalize_blog(drafts):
+    # 초안들을 하나의 블로그 글로 합치고 Notion 게시에 필요한 제목, 본문, 태그를 반환
+    title, content, question_types, requirements, framework_tags, language_tags, os_tags, tech_stack_tags = generate_final_blog(drafts)
+
+    return {
+        "title": title,
+        "content": content,
+        "question_type": question_types,
+        "requirements": requirements,
+        "framework_tags": framework_tags,
+        "language_tags": language_tags,
+        "os_tags": os_tags,
+        "tech_stack_tags": tech_stack_tags
+    }
+
 def generate_final_blog(drafts):
     draft_texts = "\n\n".join(draft['output']['draft_content'] for draft in drafts)
 
@@ -81,7 +86,10 @@ def generate_final_blog(drafts):
         "content": [Final combined and polished blog post in Markdown]
     }}
     """
-    response = client.chat.completions.create(
+    # 잘린 JSON 응답은 캐시에 저장하지 않고 attempt를 바꿔 다시 요청
+    json_result = parsed_chat_completion(
+        client,
+        parse=json.loads,
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You are an assistant that helps to review and ghost write the blog drafts and merge them into a professional developer blog post."},
@@ -90,10 +98,6 @@ def generate_final_blog(drafts):
         response_format={ "type": "json_object" },        
         max_tokens=3000
     )
-    result = response.choices[0].message.content
-    
-    
-    json_result = json.loads(result)
 
     title = json_result.get("title", "No Title Found")
     content = json_result.get("content", "No Content Found").strip()
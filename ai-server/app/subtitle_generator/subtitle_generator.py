@@ -4,8 +4,8 @@ import sys
 import yaml
 
 import numpy as np
+from concurrent.futures import CancelledError, ThreadPoolExecutor
 from sklearn.cluster import KMeans
-from sklearn.metrics.pairwise import euclidean_distances
 from tqdm import tqdm
 
 import logging
@@ -19,10 +19,9 @@ from langchain_core.messages import HumanMessage
 from typing import Annotated
 
 # langfuse
-from langfuse import Langfuse
+from app.prompt_registry import get_prompt
 from langfuse.callback import CallbackHandler
 langfuse_handler = CallbackHandler()
-langfuse = Langfuse()
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -33,6 +32,8 @@ from utils import (
     fetch_messages
 )
 from db_client import get_db_client
+from app.embedding_cache import EmbeddingCache, embed_with_cache
+from app.llm_cache import CachedChatModel
 
 class SubtitleGenerator():
     def __init__(self, config_path="subtitle_generator.yaml"):
@@ -42,16 +43,20 @@ class SubtitleGenerator():
         
         # Load configurations
         logging.info(f'Subtitle generator configuration: {config}')
-        self.model = ChatUpstage(model=config.get('model'))
-        self.embedding_model = UpstageEmbeddings(model=config.get('embedding_model'))
+        self.model = CachedChatModel(ChatUpstage(model=config.get('model')))
+        self.embedding_model_name = config.get('embedding_model')
+        self.embedding_model = UpstageEmbeddings(model=self.embedding_model_name)
+        self.embedding_batch_size = config.get('embedding_batch_size', 100)  # max inputs per embedding request
+        self.embedding_cache = EmbeddingCache(path=config['embedding_cache_path']) if config.get('embedding_cache_path') else None
         self.length_limit = config.get('length_limit')  
         self.merge_strategy = config.get('merge_strategy')
         self.merge_cluster_num = config.get('merge_cluster_num')  
+        self.max_concurrency = config.get('max_concurrency', 1)  # max in-flight LLM calls, 1 means serial
         self.debug = config.get('debug') 
 
     # Generate an subtitle for a single QA pair.
     def generate_subtitles(self, question, answer):
-        subtitle_generation : Annotated[str, HumanMessage] = langfuse.get_prompt("subtitle_generator")
+        subtitle_generation : Annotated[str, HumanMessage] = get_prompt("subtitle_generator")
         prompt = subtitle_generation.compile(question = question, answer=answer)
         response = self.model.invoke(prompt)
         return response.content.strip()
@@ -120,6 +125,20 @@ class SubtitleGenerator():
 
         return subtitle_dict, qa_index_dict
 
+    def _merge_cluster(self, subtitles):
+        """
+        Merges the subtitles of a single cluster into one subtitle.
+        A cluster holding a single distinct subtitle is returned as is without calling the LLM.
+        """
+        distinct_subtitles = list(dict.fromkeys(subtitle.strip() for subtitle in subtitles))
+        if len(distinct_subtitles) == 1:
+            return distinct_subtitles[0]
+
+        subtitle_merge_prompt : Annotated[str, HumanMessage] = get_prompt("subtitle_generator_merge")
+        prompt = subtitle_merge_prompt.compile(subtitles=str(subtitles))
+        response = self.model.invoke(prompt)
+        return response.content.strip()
+
     def merge_subtitle(self, subtitle_list):
         """
         Merges generated subtitles from each QA pair into a finite set of distinct subtitles.
@@ -140,22 +159,27 @@ class SubtitleGenerator():
         
         elif self.merge_strategy == 'embedding':
             
-            subtitle_embedding_list = [] # list(list(float)): each subtitle embeddings
-            subtitle_embedding_numpy = [] # list(float) -> np.array: np array to calculate kMeans
+            subtitle_embedding_list = [] # list(np.array): each subtitle embeddings
             subtitle_index = [] # list(list(int)) Index to which the subtitle belongs
 
-            # Calculate embeddings of subtitles
+            # Calculate embeddings of every subtitle in the conversation at once (cached ones are not requested again)
+            flat_subtitles = [subtitle for subtitles in subtitle_list for subtitle in subtitles]
+            subtitle_embedding_numpy = embed_with_cache(
+                self.embedding_model,
+                self.embedding_model_name,
+                flat_subtitles,
+                cache=self.embedding_cache,
+                batch_size=self.embedding_batch_size
+            ) # (N, 4096) float32
+
+            # split the embeddings back per QA pair
+            offset = 0
             for subtitles in subtitle_list:
-                subtitle_embedding = self._get_sentence_embedding(subtitles)
-                subtitle_embedding_list.append(subtitle_embedding)
-            
-            # concatenate all subtitle embedding lists into one list to make it as numpy vector
-            for subtitle_embedding in subtitle_embedding_list:
-                subtitle_embedding_numpy.extend(subtitle_embedding)
-            subtitle_embedding_numpy = np.array(subtitle_embedding_numpy) # (N, 4096)
+                subtitle_embedding_list.append(subtitle_embedding_numpy[offset:offset + len(subtitles)])
+                offset += len(subtitles)
 
-            # Ensure the number of clusters does not exceed the number of data points
-            n_samples = subtitle_embedding_numpy.shape[0]  # 데이터 포인트의 개수
+            # Ensure the number of clusters does not exceed the number of distinct data points
+            n_samples = len(set(flat_subtitles))  # 서로 다른 데이터 포인트의 개수
             n_clusters = min(n_samples, self.merge_cluster_num)  # 클러스터 수가 샘플 수를 초과하지 않도록 조정
             
             # Cluster the embeddings using KMeans
@@ -163,31 +187,25 @@ class SubtitleGenerator():
             kmeans = KMeans(n_clusters=n_clusters, random_state=42)
             kmeans.fit(subtitle_embedding_numpy)
 
-            # Compute the Euclidean distance between the given embedding and each cluster center
-            logging.info('Find closest kMean point for each subtitle embeddings...')
+            # kmeans.labels_ already holds the closest cluster of each subtitle embedding, split it back per QA pair
+            labels = kmeans.labels_.tolist()
+            offset = 0
             for subtitle_embedding in subtitle_embedding_list:
-                subtitle_index_sublist = []
-                for subtitle_single_embedding in subtitle_embedding:
-                    distances = euclidean_distances([subtitle_single_embedding], kmeans.cluster_centers_)
-                    subtitle_index_sublist.append(np.argmin(distances))
-                subtitle_index.append(subtitle_index_sublist)
+                subtitle_index.append(labels[offset:offset + len(subtitle_embedding)])
+                offset += len(subtitle_embedding)
             if self.debug:
                 print(subtitle_index)
             
             # Sum up subtitles with same clusters and merge them into a single subtitle with an LLM 
             subtitle_clustered = [[] for _ in range(n_clusters)]
-            for i, (subtitles) in enumerate(subtitle_list):
-                for j, (single_subtitle) in enumerate(subtitles):
-                    subtitle_clustered[subtitle_index[i][j]].append(single_subtitle)
+            for subtitle, label in zip(flat_subtitles, labels):
+                subtitle_clustered[label].append(subtitle)
             if self.debug:
                 print(subtitle_clustered)
 
             logging.info(f'Merging subtitles into {n_clusters} subtitle...')
-            for i in range(n_clusters):
-                subtitle_merge_prompt : Annotated[str, HumanMessage] = langfuse.get_prompt("subtitle_generator_merge")
-                prompt = subtitle_merge_prompt.compile(subtitles=str(subtitle_clustered[i]))
-                response = self.model.invoke(prompt)
-                result.append(response.content.strip())
+            with ThreadPoolExecutor(max_workers=max(1, self.max_concurrency)) as executor:
+                result = list(executor.map(self._merge_cluster, subtitle_clustered))
 
             if self.debug:
                 print(result, [sorted(set(sublist)) for sublist in subtitle_index])
@@ -197,39 +215,68 @@ class SubtitleGenerator():
         else:
             raise ValueError("specified merge_strategy is invalid.")
 
-    def generate(self, conversation):
-         
-        subtitle_list = []
-        conversation_data = format_message(conversation)
+    def _generate_single(self, idx, conversation, cancel_event=None):
+        """
+        Generates the subtitle list for a single QA pair.
+        Raises CancelledError without calling the model once cancel_event is set.
+        """
+        if cancel_event is not None and cancel_event.is_set():
+            raise CancelledError("subtitle generation was cancelled")
 
-        # generate subtitlees per each QA pairs 
-        for idx, conversation in tqdm(enumerate(conversation_data), total=len(conversation_data), desc="Generating Subtitles"):
-            conversation = conversation_data[idx]
-            
-            # Trim if the conversations are too long
-            if (len(conversation['q']) > self.length_limit):
-                conversation['q'] = conversation['q'][:self.length_limit]
-            if (len(conversation['a']) > self.length_limit):
-                conversation['a'] = conversation['a'][:self.length_limit]
+        # Trim if the conversations are too long
+        if (len(conversation['q']) > self.length_limit):
+            conversation['q'] = conversation['q'][:self.length_limit]
+        if (len(conversation['a']) > self.length_limit):
+            conversation['a'] = conversation['a'][:self.length_limit]
 
-            # Generate a subtitle per each QA pairs 
-            subtitle_result = self.generate_subtitles(conversation['q'], conversation['a'])
+        # Generate a subtitle per each QA pairs 
+        subtitle_result = self.generate_subtitles(conversation['q'], conversation['a'])
 
-            # parse the answer and make them into a list
-            subtitle_result = subtitle_result.splitlines()
-            subtitle_result = [line for line in subtitle_result if line.strip()] # remove if a line is empty
+        # parse the answer and make them into a list
+        subtitle_result = subtitle_result.splitlines()
+        subtitle_result = [line for line in subtitle_result if line.strip()] # remove if a line is empty
 
-            if self.debug:
-                tqdm.write(f"Processed subtitles for QA pair {idx + 1}: {subtitle_result}")
+        if self.debug:
+            tqdm.write(f"Processed subtitles for QA pair {idx + 1}: {subtitle_result}")
+
+        return subtitle_result
+
+    def generate(self, conversation, on_progress=None, cancel_event=None):
+        """
+        Generates the subtitle list for every QA pair.
+        on_progress, if given, is called as on_progress(done, total) after each QA pair.
+        Setting cancel_event stops the remaining QA pairs from calling the model and raises CancelledError.
+        """
+        conversation_data = format_message(conversation)
+        report = on_progress or (lambda done, total: None)
+        generate_single = lambda idx, conversation: self._generate_single(idx, conversation, cancel_event)
 
-            #print('converted_subtitle', subtitle_result)
-            subtitle_list.append(subtitle_result)
+        # generate subtitlees per each QA pairs 
+        if self.max_concurrency > 1:
+            # QA pairs are independent, so up to max_concurrency requests are kept in flight.
+            # executor.map yields results in input order, so subtitle_list keeps the QA order.
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                subtitle_list = []
+                for subtitle_result in tqdm(
+                    executor.map(generate_single, range(len(conversation_data)), conversation_data),
+                    total=len(conversation_data),
+                    desc="Generating Subtitles"
+                ):
+                    subtitle_list.append(subtitle_result)
+                    report(len(subtitle_list), len(conversation_data))
+        else:
+            subtitle_list = []
+            for idx, conversation in tqdm(enumerate(conversation_data), total=len(conversation_data), desc="Generating Subtitles"):
+                subtitle_list.append(generate_single(idx, conversation))
+                report(len(subtitle_list), len(conversation_data))
         logging.info('generating subtitles is done.')
 
         return subtitle_list
     
-    def __call__(self, conversation):
-        subtitle_list = self.generate(conversation)
+    def __call__(self, conversation, on_progress=None, cancel_event=None):
+        subtitle_list = self.generate(conversation, on_progress=on_progress, cancel_event=cancel_event)
+        if cancel_event is not None and cancel_event.is_set():
+            raise CancelledError("subtitle generation was cancelled")
         subtitle_list, qa_indices = self.merge_subtitle(subtitle_list)
         subtitle_list, qa_indices = self._reorder_subtitles(subtitle_list=subtitle_list,qa_index=qa_indices)
         return self._format_data(subtitle_list, qa_indices)
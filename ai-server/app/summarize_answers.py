@@ -1,6 +1,7 @@
 # from langchain import LangChain
 from openai import OpenAI
 client = OpenAI()
+from app.llm_cache import parsed_chat_completion
 from dotenv import load_dotenv
 import os
 import json
@@ -23,7 +24,18 @@ def summarize_answers():
     data = request.json
     categorized_questions = data.get('categorized_questions')
     answers = data.get('answers')
+
+    response = {
+        "summarized_answers": run_summarize_answers(categorized_questions, answers)
+    }
+    
+    print("summarize_answers response: ", response)
+
     
+
+    return jsonify(response)
+
+def run_summarize_answers(categorized_questions, answers):
     # 답변을 sequence_number 기준으로 매핑
     answers_dict = {answer['sequence_number']: answer['question_text'] for answer in answers}
     
@@ -48,15 +60,7 @@ def summarize_answers():
 
         summarized_answers.append(flattened_answer)
 
-    response = {
-        "summarized_answers": summarized_answers
-    }
-    
-    print("summarize_answers response: ", response)
-
-    
-
-    return jsonify(response)
+    return summarized_answers
 
 def summarize_answer(question, answer_text):
     prompt = f"""
@@ -75,7 +79,10 @@ def summarize_answer(question, answer_text):
     Answer:
 
     """
-    response = client.chat.completions.create(
+    # 잘린 JSON 응답은 캐시에 저장하지 않고 attempt를 바꿔 다시 요청
+    return parsed_chat_completion(
+        client,
+        parse=parse_json_response,
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "You are an assistant that helps to analyze and summarize the ChatGPT generated answers into 'the situation and the provided solution', find the 'essential code blocks for the requirements' and 'key explanations from provided answers' by ChatGPT."},
@@ -84,13 +91,11 @@ def summarize_answer(question, answer_text):
         response_format={ "type": "json_object" },        
         max_tokens=500
     )
-    result = response.choices[0].message.content
-    
+
+def parse_json_response(result):
     # Ensure the result is valid JSON
     try:
-        json_result = json.loads(result)
+        return json.loads(result)
     except json.JSONDecodeError as e:
         print(f"JSON decode error: {e}")
         raise ValueError(f"Failed to parse JSON response: {result}")
-    
-    return json_result
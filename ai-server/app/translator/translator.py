@@ -1,27 +1,48 @@
 
+import hashlib
+import json
 import os
+import re
+import threading
+from functools import lru_cache
 import requests
 from dotenv import load_dotenv
-from langfuse import Langfuse
-from langfuse.callback import CallbackHandler
-from langchain_upstage import ChatUpstage, UpstageEmbeddings
-from langchain_core.messages import HumanMessage
-from typing import List, TypedDict, Annotated
+from langchain_upstage import UpstageEmbeddings
+from typing import List, Optional, Tuple, TypedDict, Annotated
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from evaluation_utils import EvaluationUtils
+from app.llm_cache import llm_cache
+from app.cache_store import SQLiteLRUStore
 
 load_dotenv()
 
-# Initialize Langfuse and models
-langfuse_handler = CallbackHandler()
-langfuse = Langfuse()
-model = ChatUpstage(model="solar-pro")
-passage_embeddings = UpstageEmbeddings(model="solar-embedding-1-large-passage")
-evaluation_utils = EvaluationUtils()
+PASSAGE_EMBEDDING_MODEL = "solar-embedding-1-large-passage"
+
+@lru_cache(maxsize=None)
+def get_passage_embeddings():
+    # import만으로 API 클라이언트를 만들지 않도록 처음 사용할 때 생성
+    return UpstageEmbeddings(model=PASSAGE_EMBEDDING_MODEL)
 
 API_URL = "https://api.upstage.ai/v1/solar/chat/completions"
 HEADERS = {"Authorization": f"Bearer {os.getenv('UPSTAGE_API_KEY')}"}
 
+MAX_TRANSLATION_ATTEMPTS = 5
+# 라운드마다 동시에 요청해 한 번의 embed_documents로 함께 검증할 번역 후보 수
+# 1이면 번역 -> 검증 -> 재번역 순차 루프. 값을 키우면 재시도가 필요한 청크의 지연 시간은 줄지만 첫 번역이 통과해도 후보 수만큼 API를 호출합니다.
+TRANSLATION_CANDIDATES_PER_ROUND = int(os.getenv("TRANSLATION_CANDIDATES_PER_ROUND", 1))
+# 대화/필드/청크/후보 단위 스레드 풀이 중첩되므로, 프로세스 전체에서 동시에 보내는 번역·임베딩 API 요청 수를 이 값으로 제한
+TRANSLATION_MAX_CONCURRENT_REQUESTS = int(os.getenv("TRANSLATION_MAX_CONCURRENT_REQUESTS", 8))
+SIMILARITY_THRESHOLD = 0.5
+CHUNK_MAX_CHARS = 1500      # 한 번에 번역할 문단 청크의 최대 길이
+CHUNK_MAX_WORKERS = 4       # 텍스트 하나에서 동시에 번역할 최대 청크 수
+FENCED_CODE_PATTERN = re.compile(r"```.*?```", re.DOTALL)
+INLINE_CODE_PATTERN = re.compile(r"`[^`\n]+`")
+SENTENCE_SPLIT_PATTERN = re.compile(r"((?<=[.!?])[ \t]+|\n+)")
+SENTENCE_END_PATTERN = re.compile(r"[.!?]*$")
+TRANSLATION_MEMORY_PATH = os.getenv("TRANSLATION_MEMORY_PATH", ".cache/translation_memory.sqlite3")
+
+_api_request_slots = threading.BoundedSemaphore(max(1, TRANSLATION_MAX_CONCURRENT_REQUESTS))
+
 class q_and_a(TypedDict):
     q: str
     a: str
@@ -30,7 +51,11 @@ def contains_korean(text: str) -> bool:
     return any('가' <= char <= '힣' for char in text)
 
 def embed_text(text: str, embedding_model):
-    return embedding_model.embed_documents([text])
+    return embed_documents(embedding_model, [text])
+
+def embed_documents(embedding_model, texts: List[str]):
+    with _api_request_slots:
+        return embedding_model.embed_documents(texts)
 
 def calculate_similarity(embedded_query, embedded_documents):
     embedded_query = np.array(embedded_query)
@@ -38,7 +63,18 @@ def calculate_similarity(embedded_query, embedded_documents):
     similarity = np.dot(embedded_query, embedded_documents.T)
     return np.squeeze(similarity)
 
-def translate_text_with_api(text: str, model: str) -> str:
+class TranslationAPIError(Exception):
+    pass
+
+def _request_translation(data: dict) -> str:
+    with _api_request_slots:
+        response = requests.post(API_URL, headers=HEADERS, json=data)
+    if response.status_code != 200:
+        raise TranslationAPIError(f"{response.status_code}, {response.text}")
+    return response.json()["choices"][0]["message"]["content"]
+
+def translate_text_with_api(text: str, model: str, attempt: int = 0) -> str:
+    # attempt: 재시도 순번, 응답 캐시가 재시도마다 다른 번역을 저장하도록 key에 사용
 
     data = {
         "model": model,
@@ -46,78 +82,270 @@ def translate_text_with_api(text: str, model: str) -> str:
         "stream": False
     }
 
-    response = requests.post(API_URL, headers=HEADERS, json=data)
-    
-    if response.status_code == 200:
-        return response.json()["choices"][0]["message"]["content"]
-    else:
-        print(f"Translation API error: {response.status_code}, {response.text}")
+    try:
+        # 실패한 응답은 캐시에 저장되지 않음
+        return llm_cache.get_or_call("upstage", model, {}, data["messages"], call=lambda: _request_translation(data), attempt=attempt)
+    except TranslationAPIError as e:
+        print(f"Translation API error: {e}")
         return text
 
-def translate_q_and_a(conversation_list: List[q_and_a], translation_model: str, passage_embeddings):
-    translated_conversations = []
-    
-    for conversation in conversation_list:
-        question = conversation['q']
-        answer = conversation['a']
-
-        # Translate the question if it contains Korean
-        if contains_korean(question):
-            attempts = 0  
-            similarity_q = 0.0
-            translated_q = question
-
-            while (similarity_q < 0.5 or contains_korean(translated_q)) and attempts < 5:
-                translated_q = translate_text_with_api(question, translation_model)
-
-                # Calculate similarity between original and translated question
-                embedded_query = passage_embeddings.embed_documents([question])
-                embedded_translated_q = passage_embeddings.embed_documents([translated_q])
-                similarity_q = calculate_similarity(embedded_query, embedded_translated_q)
-                #print(f"질문 번역 유사도 (시도 {attempts + 1}): {similarity_q:.4f}")
-                #print(f"질문 번역에 한국어 포함 여부: {contains_korean(translated_q)}")
-                attempts += 1
-
-            if attempts == 5:
-                #print(f"최대 재시도 횟수 도달. 질문 최종 번역: {translated_q}")
-        else:
-            translated_q = question  # If the question is already in English, no translation needed
-
-        # Translate the answer if it contains Korean
-        if contains_korean(answer):
-            attempts = 0 
-            similarity_a = 0.0
-            translated_a = answer
-
-            while (similarity_a < 0.5 or contains_korean(translated_a)) and attempts < 5:
-                translated_a = translate_text_with_api(answer, translation_model)
-
-                # Calculate similarity between original and translated answer
-                embedded_answer = passage_embeddings.embed_documents([answer])
-                embedded_translated_a = passage_embeddings.embed_documents([translated_a])
-                similarity_a = calculate_similarity(embedded_answer, embedded_translated_a)
-                #print(f"답변 번역 유사도 (시도 {attempts + 1}): {similarity_a:.4f}")
-                #print(f"답변 번역에 한국어 포함 여부: {contains_korean(translated_a)}")
-                attempts += 1
-
-            if attempts == 5:
-                #print(f"최대 재시도 횟수 도달. 답변 최종 번역: {translated_a}")
+class TranslationMemory:
+    """
+    검증(유사도/한국어 검사)을 통과한 번역을 (원문 해시 -> 번역, 유사도) 형태로 저장하는 번역 메모리.
+    "이 코드 설명해줘", "에러가 나요"처럼 반복되는 문장은 Upstage API를 호출하지 않고 저장된 번역을 사용합니다.
+    로컬 SQLite 파일에 저장되며 max_entries를 넘으면 가장 오래 사용되지 않은 항목부터 삭제합니다.
+
+    Attributes:
+    - stats (dict): lookups / hits 카운터.
+    """
+
+    def __init__(self, path: str = TRANSLATION_MEMORY_PATH, max_entries: int = 200000) -> None:
+        self.store = SQLiteLRUStore(path, table="translation_memory", max_entries=max_entries)
+        self.stats = {"lookups": 0, "hits": 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _split_sentence_end(text: str) -> Tuple[str, str]:
+        """앞뒤 공백을 제거한 텍스트를 (본문, 끝의 문장 부호)로 나눕니다. "에러가 나요."와 "에러가 나요"는 같은 본문을 가집니다."""
+        core = text.strip()
+        sentence_end = SENTENCE_END_PATTERN.search(core).group()
+        return core[:len(core) - len(sentence_end)], sentence_end
+
+    @classmethod
+    def _key(cls, translation_model: str, source: str) -> str:
+        source_hash = hashlib.sha256(cls._split_sentence_end(source)[0].encode("utf-8")).hexdigest()
+        return f"{translation_model}:{source_hash}"
+
+    @classmethod
+    def _restore(cls, found: bytes, source: str) -> str:
+        """저장된 번역을 반환하되, 저장할 때의 원문과 끝 문장 부호가 다르면 번역의 끝 문장 부호를 source에 맞춥니다."""
+        entry = json.loads(found)
+        sentence_end = cls._split_sentence_end(source)[1]
+        if entry.get("source_end", sentence_end) == sentence_end:
+            return entry["translation"]
+        return cls._split_sentence_end(entry["translation"])[0] + sentence_end
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            self.stats["lookups"] += 1
+            self.stats["hits"] += int(hit)
+
+    def lookup(self, translation_model: str, source: str) -> Optional[str]:
+        """
+        source 전체의 번역이 있으면 반환합니다. 없으면 문장 단위로 나누어 한국어 문장이 모두 저장되어 있을 때
+        문장별 번역을 이어 붙여 반환하고, 그렇지 않으면 None을 반환합니다.
+        """
+        found = self.store.get(self._key(translation_model, source))
+        if found is not None:
+            self._count(True)
+            return self._restore(found, source)
+
+        # 문장과 구분자가 번갈아 나오는 리스트: [문장, 구분자, 문장, ...]
+        pieces = SENTENCE_SPLIT_PATTERN.split(source)
+        sentences = [piece for piece in pieces[::2] if contains_korean(piece)]
+        # 인라인 코드 자리표시자 번호는 청크마다 달라지므로 자리표시자가 없는 문장만 문장 단위로 조합
+        if len(pieces) > 1 and sentences and not any("[[CODE" in sentence for sentence in sentences):
+            keys = {sentence: self._key(translation_model, sentence) for sentence in sentences}
+            found = self.store.get_many(keys.values())
+            if all(key in found for key in keys.values()):
+                for i in range(0, len(pieces), 2):
+                    if contains_korean(pieces[i]):
+                        pieces[i] = self._restore(found[keys[pieces[i]]], pieces[i])
+                self._count(True)
+                return "".join(pieces)
+
+        self._count(False)
+        return None
+
+    def add(self, translation_model: str, source: str, translation: str, similarity: float) -> None:
+        """
+        검증을 통과한 번역을 저장합니다. 원문과 번역의 문장 수가 같으면 한국어 문장별 번역도 함께 저장해
+        같은 문장이 다른 청크에 섞여 나와도 lookup의 문장 단위 조합으로 재사용할 수 있게 합니다.
+        문장별 항목의 similarity는 청크 전체의 유사도입니다.
+        """
+        entry = lambda text, original: json.dumps(
+            {"translation": text, "similarity": similarity, "source_end": self._split_sentence_end(original)[1]}, ensure_ascii=False
+        ).encode("utf-8")
+        items = {self._key(translation_model, source): entry(translation, source)}
+        for source_sentence, translated_sentence in self._align_sentences(source, translation):
+            items.setdefault(self._key(translation_model, source_sentence), entry(translated_sentence, source_sentence))
+        self.store.set_many(items)
+
+    @staticmethod
+    def _align_sentences(source: str, translation: str) -> List[Tuple[str, str]]:
+        """원문과 번역을 SENTENCE_SPLIT_PATTERN으로 나누어 문장 수가 같을 때만 같은 위치의 (한국어 문장, 번역 문장) 쌍을 반환합니다."""
+        source_sentences = SENTENCE_SPLIT_PATTERN.split(source)[::2]
+        translated_sentences = SENTENCE_SPLIT_PATTERN.split(translation)[::2]
+        if len(source_sentences) < 2 or len(source_sentences) != len(translated_sentences):
+            return []
+        return [
+            (source_sentence, translated_sentence)
+            for source_sentence, translated_sentence in zip(source_sentences, translated_sentences)
+            # 인라인 코드 자리표시자 번호는 청크마다 달라지므로 자리표시자가 있는 문장은 저장하지 않음
+            if contains_korean(source_sentence) and "[[CODE" not in source_sentence
+            and translated_sentence.strip() and not contains_korean(translated_sentence)
+        ]
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.stats)
+
+
+translation_memory = TranslationMemory()
+
+def _split_prose(prose: str) -> List[str]:
+    """문단 단위로 나누고 CHUNK_MAX_CHARS를 넘지 않게 묶습니다. 반환된 청크를 그대로 이어 붙이면 원문과 같습니다."""
+    pieces = re.split(r"(\n\s*\n)", prose)  # [문단, 구분자, 문단, 구분자, ...]
+    chunks = []
+    current = ""
+    for i in range(0, len(pieces), 2):
+        piece = pieces[i] + (pieces[i + 1] if i + 1 < len(pieces) else "")
+        if current and len(current) + len(piece) > CHUNK_MAX_CHARS:
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def segment_text(text: str) -> List[Tuple[str, bool]]:
+    """텍스트를 (조각, 코드 여부) 리스트로 나눕니다. fenced 코드 블록은 그대로 두고 나머지는 문단 청크로 나눕니다."""
+    segments = []
+    last_end = 0
+    for match in FENCED_CODE_PATTERN.finditer(text):
+        segments.extend((chunk, False) for chunk in _split_prose(text[last_end:match.start()]))
+        segments.append((match.group(0), True))
+        last_end = match.end()
+    segments.extend((chunk, False) for chunk in _split_prose(text[last_end:]))
+    return segments
+
+def _mask_inline_code(chunk: str) -> Tuple[str, List[str]]:
+    """인라인 코드를 [[CODE0]] 형태의 자리표시자로 바꿔 번역되지 않도록 합니다."""
+    inline_codes = []
+
+    def _replace(match):
+        inline_codes.append(match.group(0))
+        return f"[[CODE{len(inline_codes) - 1}]]"
+
+    return INLINE_CODE_PATTERN.sub(_replace, chunk), inline_codes
+
+def _unmask_inline_code(text: str, inline_codes: List[str]) -> str:
+    for i, inline_code in enumerate(inline_codes):
+        text = text.replace(f"[[CODE{i}]]", inline_code, 1)
+    return text
+
+def _translate_chunk(chunk: str, translation_model: str, passage_embeddings, candidates_per_round: int = TRANSLATION_CANDIDATES_PER_ROUND) -> Tuple[str, int]:
+    """
+    문단 청크 하나를 번역하고 (번역 결과, 번역 API 호출 횟수)를 반환합니다.
+    번역 메모리에 있는 청크는 API를 호출하지 않습니다. 원문은 한 번만 임베딩하고, 라운드마다 candidates_per_round개의 번역을 동시에 요청해 한 번의 embed_documents로 임베딩합니다.
+    유사도가 SIMILARITY_THRESHOLD 이상이고, 한국어가 남지 않고, 인라인 코드 자리표시자가 모두 남아 있는 첫 번역을 채택합니다.
+    MAX_TRANSLATION_ATTEMPTS번 안에 찾지 못하면 마지막 번역을 반환하되, 자리표시자가 빠졌다면 코드가 사라지지 않도록 원문을 반환합니다.
+    """
+    # 앞뒤 공백(문단 구분자)은 번역하지 않고 그대로 유지
+    core = chunk.strip()
+    leading = chunk[:len(chunk) - len(chunk.lstrip())]
+    trailing = chunk[len(chunk.rstrip()):]
+
+    masked, inline_codes = _mask_inline_code(core)
+    placeholders = [f"[[CODE{i}]]" for i in range(len(inline_codes))]
+    has_placeholders = lambda candidate: all(placeholder in candidate for placeholder in placeholders)
+
+    # 번역 메모리에 있으면 API를 호출하지 않음
+    remembered = translation_memory.lookup(translation_model, masked)
+    if remembered is not None and has_placeholders(remembered):
+        return leading + _unmask_inline_code(remembered, inline_codes) + trailing, 0
+
+    embedded_original = embed_documents(passage_embeddings, [masked])
+    attempts = 0
+    translated = masked
+
+    while attempts < MAX_TRANSLATION_ATTEMPTS:
+        round_attempts = range(attempts, min(attempts + candidates_per_round, MAX_TRANSLATION_ATTEMPTS))
+        if len(round_attempts) > 1:
+            with ThreadPoolExecutor(max_workers=len(round_attempts)) as executor:
+                candidates = list(executor.map(lambda attempt: translate_text_with_api(masked, translation_model, attempt=attempt), round_attempts))
         else:
-            translated_a = answer  # If the answer is already in English, no translation needed
+            candidates = [translate_text_with_api(masked, translation_model, attempt=attempts)]
+        attempts += len(candidates)
+
+        # Calculate similarity between original and translated candidates
+        similarities = np.atleast_1d(calculate_similarity(embedded_original, embed_documents(passage_embeddings, candidates)))
+        for candidate, similarity in zip(candidates, similarities):
+            translated = candidate
+            if similarity >= SIMILARITY_THRESHOLD and not contains_korean(candidate) and has_placeholders(candidate):
+                translation_memory.add(translation_model, masked, candidate, float(similarity))
+                return leading + _unmask_inline_code(candidate, inline_codes) + trailing, attempts
+
+    #print(f"최대 재시도 횟수 도달. 최종 번역: {translated}")
+    if not has_placeholders(translated):
+        return chunk, attempts
+    return leading + _unmask_inline_code(translated, inline_codes) + trailing, attempts
 
+def translate_field(text: str, translation_model: str, passage_embeddings, candidates_per_round: int = TRANSLATION_CANDIDATES_PER_ROUND) -> Tuple[str, int]:
+    """
+    한국어가 포함된 텍스트를 번역하고 (번역 결과, 번역 API 호출 횟수)를 반환합니다.
+    fenced 코드 블록과 인라인 코드는 번역하지 않고, 나머지를 문단 청크로 나누어 한국어가 있는 청크만 동시에 번역합니다.
+    재시도는 실패한 청크에 대해서만 일어납니다.
+    """
+    if not contains_korean(text):
+        return text, 0  # If the text is already in English, no translation needed
+
+    segments = segment_text(text)
+    targets = [i for i, (segment, is_code) in enumerate(segments) if not is_code and contains_korean(segment)]
+    translate = lambda i: _translate_chunk(segments[i][0], translation_model, passage_embeddings, candidates_per_round)
+
+    with ThreadPoolExecutor(max_workers=CHUNK_MAX_WORKERS) as executor:
+        results = dict(zip(targets, executor.map(translate, targets)))
+
+    translated = "".join(results[i][0] if i in results else segment for i, (segment, _) in enumerate(segments))
+    attempts = sum(chunk_attempts for _, chunk_attempts in results.values())
+    return translated, attempts
+
+def translate_conversations(conversation_list: List[q_and_a], translation_model: str, passage_embeddings, max_workers: int = 4, candidates_per_round: int = TRANSLATION_CANDIDATES_PER_ROUND) -> Tuple[List[q_and_a], List[dict]]:
+    """
+    대화의 질문/답변을 최대 max_workers개까지 동시에 번역합니다.
+    번역 결과 리스트와 함께 항목별 번역 API 호출 횟수({"index", "q_attempts", "a_attempts"}) 리스트를 반환합니다.
+    """
+    fields = [(index, key) for index in range(len(conversation_list)) for key in ("q", "a")]
+    translate = lambda field: translate_field(conversation_list[field[0]][field[1]], translation_model, passage_embeddings, candidates_per_round)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = dict(zip(fields, executor.map(translate, fields)))
+
+    translated_conversations = []
+    attempt_report = []
+    for index in range(len(conversation_list)):
+        translated_q, q_attempts = results[(index, "q")]
+        translated_a, a_attempts = results[(index, "a")]
         translated_conversations.append(q_and_a(q=translated_q, a=translated_a))
+        attempt_report.append({"index": index, "q_attempts": q_attempts, "a_attempts": a_attempts})
+
+    return translated_conversations, attempt_report
+
+def translate_q_and_a(conversation_list: List[q_and_a], translation_model: str, passage_embeddings, max_workers: int = 4, candidates_per_round: int = TRANSLATION_CANDIDATES_PER_ROUND):
+    memory_stats = translation_memory.snapshot()
+    translated_conversations, attempt_report = translate_conversations(conversation_list, translation_model, passage_embeddings, max_workers, candidates_per_round)
+
+    total_attempts = sum(item["q_attempts"] + item["a_attempts"] for item in attempt_report)
+    print(f"Translation attempts: total {total_attempts}, per item {attempt_report}")
+
+    lookups = translation_memory.stats["lookups"] - memory_stats["lookups"]
+    hits = translation_memory.stats["hits"] - memory_stats["hits"]
+    print(f"Translation memory: {hits}/{lookups} hits ({hits / lookups if lookups else 0:.0%})")
 
     return translated_conversations
 
 if __name__ == "__main__":
+    from evaluation_utils import EvaluationUtils
+
     EXAMPLE1_CONVERSATION_ID = 162
     try:
-        conversation_data = evaluation_utils.get_messages_by_conversation_id(EXAMPLE1_CONVERSATION_ID)
+        conversation_data = EvaluationUtils().get_messages_by_conversation_id(EXAMPLE1_CONVERSATION_ID)
     except Exception as e:
         print(f"Error fetching conversation data: {e}")
         conversation_data = []
 
-    translated_result = translate_q_and_a(conversation_data, "solar-1-mini-translate-koen", passage_embeddings)
+    translated_result = translate_q_and_a(conversation_data, "solar-1-mini-translate-koen", get_passage_embeddings())
 
     for idx, conversation in enumerate(translated_result):
         print(f"번역된 질문 {idx+1}: {conversation['q']}")
@@ -0,0 +1,203 @@
+import os
+import random
+import sqlite3
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langgraph.checkpoint.base import WRITES_IDX_MAP, BaseCheckpointSaver, CheckpointTuple, get_checkpoint_id
+from langgraph.checkpoint.serde.types import TASKS
+
+WRITER_CHECKPOINT_DB_PATH = os.getenv("WRITER_CHECKPOINT_DB_PATH", ".cache/writer_checkpoints.sqlite3")
+WRITER_CHECKPOINT_TTL = float(os.getenv("WRITER_CHECKPOINT_TTL", 3600))
+WRITER_CHECKPOINT_MAX_THREADS = int(os.getenv("WRITER_CHECKPOINT_MAX_THREADS", 100))
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver):
+    """
+    블로그 작성 그래프의 체크포인트를 SQLite 파일에 저장하는 checkpointer.
+    gunicorn worker 여러 개가 같은 파일을 공유하므로, 실패하거나 중단된 실행을 다른 worker(또는 재시작된 worker)에서도
+    같은 thread_id로 마지막으로 완료된 노드부터 재개할 수 있습니다.
+    요청마다 다른 thread_id를 사용해도 파일이 계속 커지지 않도록 ttl_seconds 동안 사용되지 않은 thread와,
+    max_threads를 넘는 가장 오래 사용되지 않은 thread의 체크포인트를 새 체크포인트를 저장할 때 삭제합니다.
+
+    Attributes:
+    - path (str): SQLite 파일 경로.
+    - ttl_seconds (float): 마지막 사용 이후 thread의 체크포인트를 보관하는 시간(초).
+    - max_threads (int): 보관할 최대 thread 수.
+    """
+
+    def __init__(self, path: str = WRITER_CHECKPOINT_DB_PATH, ttl_seconds: float = WRITER_CHECKPOINT_TTL,
+                 max_threads: int = WRITER_CHECKPOINT_MAX_THREADS, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_threads = max_threads
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS writer_checkpoints ("
+                "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, parent_checkpoint_id TEXT, "
+                "checkpoint_type TEXT, checkpoint BLOB, metadata_type TEXT, metadata BLOB, "
+                "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS writer_checkpoint_writes ("
+                "thread_id TEXT NOT NULL, checkpoint_ns TEXT NOT NULL, checkpoint_id TEXT NOT NULL, task_id TEXT NOT NULL, "
+                "idx INTEGER NOT NULL, channel TEXT NOT NULL, value_type TEXT, value BLOB, "
+                "PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx))"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS writer_checkpoint_threads (thread_id TEXT PRIMARY KEY, last_used REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS writer_checkpoint_threads_last_used ON writer_checkpoint_threads (last_used)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _touch(self, conn: sqlite3.Connection, thread_id: str) -> None:
+        # thread의 마지막 사용 시각을 갱신하고, 보관 기간이 지났거나 개수 제한을 넘는 다른 thread를 삭제
+        now = time.time()
+        conn.execute("INSERT OR REPLACE INTO writer_checkpoint_threads (thread_id, last_used) VALUES (?, ?)", (thread_id, now))
+        expired = [row[0] for row in conn.execute(
+            "SELECT thread_id FROM writer_checkpoint_threads WHERE thread_id != ? AND last_used < ?",
+            (thread_id, now - self.ttl_seconds)
+        )]
+        # 최근 사용 순서로 max_threads - 1개(현재 thread 제외)를 남기고 나머지를 삭제
+        expired += [row[0] for row in conn.execute(
+            "SELECT thread_id FROM writer_checkpoint_threads WHERE thread_id != ? AND last_used >= ? "
+            "ORDER BY last_used DESC LIMIT -1 OFFSET ?",
+            (thread_id, now - self.ttl_seconds, max(self.max_threads - 1, 0))
+        )]
+        for key in expired:
+            self._delete_thread(conn, key)
+
+    @staticmethod
+    def _delete_thread(conn: sqlite3.Connection, thread_id: str) -> None:
+        for table in ("writer_checkpoints", "writer_checkpoint_writes", "writer_checkpoint_threads"):
+            conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def delete_thread(self, thread_id) -> None:
+        """thread_id의 체크포인트와 중간 결과(writes)를 모두 삭제합니다."""
+        with self._connect() as conn:
+            self._delete_thread(conn, str(thread_id))
+
+    def has_checkpoint(self, thread_id) -> bool:
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM writer_checkpoints WHERE thread_id = ? LIMIT 1", (str(thread_id),)).fetchone() is not None
+
+    def _make_tuple(self, conn: sqlite3.Connection, row) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint, metadata_type, metadata = row
+        writes = conn.execute(
+            "SELECT task_id, channel, value_type, value FROM writer_checkpoint_writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id)
+        ).fetchall()
+        sends = conn.execute(
+            "SELECT value_type, value FROM writer_checkpoint_writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? AND channel = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, parent_checkpoint_id, TASKS)
+        ).fetchall() if parent_checkpoint_id else []
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint={
+                **self.serde.loads_typed((checkpoint_type, checkpoint)),
+                "pending_sends": [self.serde.loads_typed(send) for send in sends],
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config={
+                "configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_checkpoint_id}
+            } if parent_checkpoint_id else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed((value_type, value))) for task_id, channel, value_type, value in writes],
+        )
+
+    def get_tuple(self, config) -> Optional[CheckpointTuple]:
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        with self._connect() as conn:
+            if checkpoint_id:
+                row = conn.execute(
+                    "SELECT * FROM writer_checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id)
+                ).fetchone()
+            else:
+                row = conn.execute(
+                    "SELECT * FROM writer_checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns)
+                ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE writer_checkpoint_threads SET last_used = ? WHERE thread_id = ?", (time.time(), thread_id))
+            checkpoint_tuple = self._make_tuple(conn, row)
+        if checkpoint_id:
+            # 요청한 config를 그대로 돌려줌 (MemorySaver와 동일)
+            checkpoint_tuple = checkpoint_tuple._replace(config=config)
+        return checkpoint_tuple
+
+    def list(self, config, *, filter: Optional[Dict[str, Any]] = None, before=None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        conditions, params = [], []
+        if config:
+            conditions.append("thread_id = ?")
+            params.append(str(config["configurable"]["thread_id"]))
+            if config["configurable"].get("checkpoint_ns") is not None:
+                conditions.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                conditions.append("checkpoint_id = ?")
+                params.append(get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            conditions.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        results = []
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT * FROM writer_checkpoints {where} ORDER BY thread_id, checkpoint_ns, checkpoint_id DESC", params).fetchall()
+            for row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                # metadata는 직렬화되어 있으므로 불러온 뒤 비교
+                metadata = self.serde.loads_typed((row[6], row[7]))
+                if filter and not all(metadata.get(key) == value for key, value in filter.items()):
+                    continue
+                results.append(self._make_tuple(conn, row))
+        return iter(results)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        saved = checkpoint.copy()
+        saved.pop("pending_sends")
+        checkpoint_type, checkpoint_blob = self.serde.dumps_typed(saved)
+        metadata_type, metadata_blob = self.serde.dumps_typed(metadata)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO writer_checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 checkpoint_type, checkpoint_blob, metadata_type, metadata_blob)
+            )
+            self._touch(conn, thread_id)
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes: List[Tuple[str, Any]], task_id: str) -> None:
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            value_type, value_blob = self.serde.dumps_typed(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx), channel, value_type, value_blob))
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO writer_checkpoint_writes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._touch(conn, thread_id)
+
+    def get_next_version(self, current, channel) -> str:
+        # MemorySaver와 같은 문자열 버전 (정렬 가능한 증가 값)
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
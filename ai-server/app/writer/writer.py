@@ -1,4 +1,6 @@
 from operator import not_
+import json
+import logging
 import os
 import re
 from tabnanny import check
@@ -11,15 +13,25 @@ load_dotenv()
 from langchain_upstage import ChatUpstage
 from langchain_core.messages import HumanMessage
 from langchain_core.tools import tool
+# 노드의 LangChain 실행 context(callbacks 등)를 작업 스레드에 복사해 병렬 호출도 같은 Langfuse trace에 기록
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import END, START, StateGraph, MessagesState
 from langgraph.prebuilt import ToolNode
 from typing import Annotated, Literal, TypedDict
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+from functools import lru_cache
+import tiktoken
 
 # langfuse
-from langfuse import Langfuse
+from app.prompt_registry import get_prompt
+from app.llm_cache import CachedChatModel
+from app.writer.checkpointer import SQLiteCheckpointSaver
+from app.progress import ProgressReporter
 from langfuse.callback import CallbackHandler
 
+logger = logging.getLogger(__name__)
+
 class q_and_a(TypedDict):
     q: str
     a: str
@@ -29,16 +41,18 @@ class GraphState(TypedDict):
     code_document: dict
     message_to_index_dict: dict
     final_documents: dict
+    draft_stats: dict
     '''
     Writing 모듈 실행을 위해 필요한 Inputs
     1. preprocessed_conversations -> 서현님 모듈에서 전처리된 QA 세트: list[q_and_a] 
     2. code_document -> 서현님 모듈에서 만든 코드 딕셔너리 dict{'Code_Snippet_1': 'code'}
     3. message_to_index_dict -> 지환님 모듈에서 만든 각 QA 세트에 해당하는 indices: dict['0': [1-1, 1-2, 1-3]] ('0'은 첫 번째 QA 세트를 지칭)
     4. final_documents -> 작성 중인 문서들: dict['1-1': '## 1-1) heading']
+    Writing 모듈 실행 후 추가되는 Outputs
+    5. draft_stats -> 목차별 초안 작성 중 로컬 복구/재생성 횟수와 프롬프트 토큰 수: dict['1-1': {'repaired': 1, 'regenerated': 0, 'prompt_tokens': 1234, ...}]
     '''
 
 langfuse_handler = CallbackHandler()
-langfuse = Langfuse()
 
 import re
 
@@ -91,14 +105,76 @@ def overall_precision_recall(generated_doc, gt_doc):
 
 ##########################블로그 초안 작성하는 노드와 관련 함수 정의###############################
 
-model = ChatUpstage(model="solar-pro")
-
-def write(model, q_and_a, document):
-    writing_prompt = langfuse.get_prompt("writing_prompt")
-    prompt = writing_prompt.compile(q=q_and_a['q'], a=q_and_a['a'], document=document)
-    updated_doc = model.invoke(prompt)
+model = CachedChatModel(ChatUpstage(model="solar-pro"))
+
+# 블로그 초안 작성 시 동시에 작성할 최대 목차 수
+WRITER_MAX_CONCURRENCY = int(os.getenv("WRITER_MAX_CONCURRENCY", 4))
+# 초안 작성 방식: full(매번 목차 전체를 다시 작성) / incremental(목차 요약과 끝부분만 보내고 새 내용을 이어 붙임)
+WRITER_DRAFT_MODE = os.getenv("WRITER_DRAFT_MODE", "full")
+# incremental 방식에서 프롬프트에 그대로 넣는 목차 끝부분의 최대 길이, 이보다 짧은 목차는 full 방식으로 작성
+WRITER_TAIL_CHARS = int(os.getenv("WRITER_TAIL_CHARS", 2000))
+# True이면 QA 세트 하나가 여러 목차에 해당할 때 한 번의 호출로 모든 목차를 작성
+WRITER_MULTI_SECTION = os.getenv("WRITER_MULTI_SECTION", "false").lower() in ("1", "true", "yes")
+# True이면 draft_stats에 프롬프트 토큰 수를 집계. QA마다 두 방식의 프롬프트를 추가로 만들고 토큰화하므로 방식 비교할 때만 켬
+WRITER_TOKEN_ACCOUNTING = os.getenv("WRITER_TOKEN_ACCOUNTING", "false").lower() in ("1", "true", "yes")
+
+@lru_cache(maxsize=None)
+def get_token_encoding():
+    # cl100k_base는 처음 사용할 때 내려받으므로, 실패하면 None을 캐싱해 집계만 건너뛰고 블로그 작성은 계속함
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Token encoding unavailable, skipping prompt token accounting: {e}")
+        return None
+
+def count_tokens(text):
+    # 프롬프트 토큰 수 집계용 (solar 토크나이저와 정확히 같지는 않지만 방식 간 비교에 사용), 집계하지 않으면 0
+    encoding = get_token_encoding() if WRITER_TOKEN_ACCOUNTING else None
+    return len(encoding.encode(text)) if encoding is not None else 0
+
+def make_writing_prompt(q_and_a, document):
+    writing_prompt = get_prompt("writing_prompt")
+    return writing_prompt.compile(q=q_and_a['q'], a=q_and_a['a'], document=document)
+
+def write(model, q_and_a, document, attempt=0):
+    # attempt: 재시도 순번, 응답 캐시가 재시도마다 다른 응답을 저장하도록 key에 사용
+    prompt = make_writing_prompt(q_and_a, document)
+    updated_doc = model.invoke(prompt, attempt=attempt)
     return updated_doc, prompt
 
+def make_section_outline(text, max_items=40):
+    # 문단마다 첫 줄만 남긴 목차 요약. 제목 외에는 최근 max_items개 문단만 남겨 길이를 제한
+    headings, items = [], []
+    for paragraph in text.split('\n\n'):
+        first_line = paragraph.strip().split('\n')[0]
+        if first_line.startswith('## '):
+            headings.append(first_line)
+        elif first_line:
+            items.append('- ' + first_line[:80])
+    return '\n'.join(headings + items[-max_items:])
+
+def split_section_tail(document, tail_chars=WRITER_TAIL_CHARS):
+    # 목차 문서를 (앞부분, 끝부분)으로 나눔. 끝부분은 tail_chars 이하이며 문단 경계에서 시작
+    if len(document) <= tail_chars:
+        return '', document
+    boundary = document.find('\n\n', len(document) - tail_chars)
+    if boundary == -1:
+        boundary = len(document) - tail_chars
+    return document[:boundary], document[boundary:].lstrip('\n')
+
+def make_incremental_prompt(q_and_a, document):
+    head, tail = split_section_tail(document)
+    used_snippets = ', '.join(snippet[len('<-- '):snippet.index(':')] for snippet in find_code_snippets(head)) or 'None'
+    incremental_writing_prompt = get_prompt("incremental_writing_prompt")
+    return incremental_writing_prompt.compile(
+        outline=make_section_outline(head), used_snippets=used_snippets, tail=tail, q=q_and_a['q'], a=q_and_a['a'])
+
+def write_incremental(model, q_and_a, document, attempt=0):
+    # 목차 전체 대신 요약과 끝부분만 보내 프롬프트 길이를 일정하게 유지하고, 새 내용을 목차 끝에 이어 붙임
+    prompt = make_incremental_prompt(q_and_a, document)
+    addition = model.invoke(prompt, attempt=attempt)
+    return document.rstrip() + '\n\n' + addition.content.strip(), prompt
+
 def remove_after_second_hashes(text):
     # '##'를 기준으로 문자열을 나누기
     parts = text.split('##')
@@ -108,24 +184,219 @@ def remove_after_second_hashes(text):
         return '## ' + parts[1].strip()  # '##' 포함 첫 번째 부분만 반환
     return text  # '##'가 두 번 이상 없을 때는 원래 문자열 반환
 
-def make_final_documents(state: GraphState):
+FENCED_BLOCK_PATTERN = re.compile(r"```(.*?)```", re.DOTALL)
+PLACEHOLDERS_ONLY_PATTERN = re.compile(r"(?:\s*<-- \w+: .*? -->)+\s*")
+# 언어 표시만 있는 빈 코드 블록 (```python\n```)
+LANGUAGE_ONLY_PATTERN = re.compile(r"[\w+#.-]*\n\s*")
+
+def strip_language_line(code):
+    # 코드 블록 첫 줄의 언어 표시(python 등)를 제거
+    first_line, newline, rest = code.strip().partition("\n")
+    if newline and re.fullmatch(r"[\w+#.-]*", first_line.strip()):
+        return rest
+    return code
+
+def normalize_code(code):
+    # 앞뒤 공백, 줄 끝 공백, 언어 표시를 무시하고 코드를 비교하기 위한 정규화
+    return "\n".join(line.rstrip() for line in strip_language_line(code).strip().splitlines())
+
+def repair_section_output(text, qa, code_document):
+    # 모델 출력의 흔한 규칙 위반을 LLM 호출 없이 고침. 고칠 수 없으면 None 반환
+    # 1. [Q], [A] 표시 제거
+    # 2. placeholder만 감싼 코드 블록, 빈 코드 블록은 펜스를 제거
+    # 3. QA에 placeholder로 들어 있던 코드를 그대로 옮겨 적은 코드 블록은 원래 placeholder로 되돌림
+    text = re.sub(r"\[[QA]\] ?", "", text)
+
+    code_to_placeholder = {}
+    for placeholder in find_code_snippets(qa['q'] + '\n' + qa['a']):
+        code_id = placeholder[len("<-- "):placeholder.index(":")]
+        if code_id in code_document:
+            code_to_placeholder.setdefault(normalize_code(code_document[code_id]), placeholder)
+
+    unrepairable = False
+    def repair_block(match):
+        nonlocal unrepairable
+        body = match.group(1)
+        if not body.strip() or LANGUAGE_ONLY_PATTERN.fullmatch(body):
+            return ""
+        if PLACEHOLDERS_ONLY_PATTERN.fullmatch(strip_language_line(body)):
+            return strip_language_line(body).strip()
+        placeholder = code_to_placeholder.get(normalize_code(body))
+        if placeholder is None:
+            unrepairable = True
+            return match.group(0)
+        return placeholder
+
+    text = FENCED_BLOCK_PATTERN.sub(repair_block, text)
+    if unrepairable or '```' in text or '[Q]' in text:
+        return None
+    return text
+
+def new_draft_stats():
+    # prompt_tokens: 실제로 보낸 프롬프트 토큰 수 (재시도 포함, 여러 목차를 한 번에 작성한 호출은 목차 수로 나눠 집계)
+    # prompt_tokens_full / prompt_tokens_incremental: QA마다 두 방식의 첫 프롬프트 토큰 수 (방식 간 비교용)
+    # 토큰 수는 WRITER_TOKEN_ACCOUNTING이 켜져 있을 때만 집계하고, 꺼져 있으면 0으로 남음
+    # batched: 여러 목차를 한 번에 작성한 호출에서 그대로 채택된 횟수
+    return {'repaired': 0, 'regenerated': 0, 'batched': 0, 'prompt_tokens': 0, 'prompt_tokens_full': 0, 'prompt_tokens_incremental': 0}
+
+def count_mode_prompt_tokens(qa, document, stats):
+    if not WRITER_TOKEN_ACCOUNTING:
+        return
+    full_prompt_tokens = count_tokens(make_writing_prompt(qa, document))
+    stats['prompt_tokens_full'] += full_prompt_tokens
+    stats['prompt_tokens_incremental'] += count_tokens(make_incremental_prompt(qa, document)) if len(document) > WRITER_TAIL_CHARS else full_prompt_tokens
+
+def validate_section_output(text, qa, code_document, stats):
+    # 모델 출력을 검사해 그대로 쓰거나 로컬에서 고친 문서를 반환. 고칠 수 없으면 None 반환
+    updated_doc = remove_after_second_hashes(text)
+    if not ('[Q]' in updated_doc) and not ('```' in updated_doc):
+        return updated_doc
+    repaired_doc = repair_section_output(updated_doc, qa, code_document)
+    if repaired_doc is not None:
+        stats['repaired'] += 1
+    return repaired_doc
+
+def draft_qa(qa, document, code_document, stats):
+    # QA 세트 하나를 목차 문서에 반영. 규칙을 어긴 출력은 먼저 로컬에서 고치고, 고칠 수 없을 때만 다시 생성
+    incremental = WRITER_DRAFT_MODE == 'incremental' and len(document) > WRITER_TAIL_CHARS
+    for i in range(10):
+        if incremental:
+            generated_text, prompt = write_incremental(model, qa, document, attempt=i)
+        else:
+            generated_doc, prompt = write(model, qa, document, attempt=i)
+            generated_text = generated_doc.content
+        stats['prompt_tokens'] += count_tokens(prompt)
+        updated_doc = validate_section_output(generated_text, qa, code_document, stats)
+        if updated_doc is not None:
+            return updated_doc
+        stats['regenerated'] += 1
+        #print('[Q] or ``` included error')
+    # 10번 모두 실패하면 마지막 출력을 사용
+    return remove_after_second_hashes(generated_text)
+
+def draft_section(qa_list, document, code_document):
+    # 하나의 목차에 해당하는 QA 세트들을 대화 순서대로 반영해 목차 문서를 갱신
+    stats = new_draft_stats()
+    for qa in qa_list:
+        count_mode_prompt_tokens(qa, document, stats)
+        document = draft_qa(qa, document, code_document, stats)
+    return document, stats
+
+SECTION_ENVELOPE_PATTERN = re.compile(r'<section id="([^"]+)">\s*(.*?)\s*</section>', re.DOTALL)
+
+def make_multi_section_prompt(q_and_a, documents):
+    sections = "\n".join(f'<section id="{index}">\n{document}\n</section>' for index, document in documents.items())
+    multi_section_writing_prompt = get_prompt("multi_section_writing_prompt")
+    return multi_section_writing_prompt.compile(q=q_and_a['q'], a=q_and_a['a'], sections=sections)
+
+def draft_qa_multi_section(qa, documents, code_document, draft_stats):
+    # QA 세트 하나를 여러 목차에 한 번의 호출로 반영하고, 결과를 파싱하지 못했거나 고칠 수 없는 목차만 목차별로 다시 작성
+    # incremental 방식으로 작성할 긴 목차는 전체 문서를 보내지 않도록 처음부터 목차별로 작성
+    for index, document in documents.items():
+        count_mode_prompt_tokens(qa, document, draft_stats[index])
+    batch = {
+        index: document for index, document in documents.items()
+        if not (WRITER_DRAFT_MODE == 'incremental' and len(document) > WRITER_TAIL_CHARS)
+    }
+    updated = {}
+    if len(batch) > 1:
+        prompt = make_multi_section_prompt(qa, batch)
+        response = model.invoke(prompt)
+        prompt_tokens = count_tokens(prompt) // len(batch)
+        parsed = dict(SECTION_ENVELOPE_PATTERN.findall(response.content))
+        for index in batch:
+            draft_stats[index]['prompt_tokens'] += prompt_tokens
+            if parsed.get(index):
+                updated_doc = validate_section_output(parsed[index], qa, code_document, draft_stats[index])
+                if updated_doc is not None:
+                    updated[index] = updated_doc
+                    draft_stats[index]['batched'] += 1
+    for index, document in documents.items():
+        if index not in updated:
+            updated[index] = draft_qa(qa, document, code_document, draft_stats[index])
+    return updated
+
+def run_ordered_tasks(tasks, run, max_workers, on_progress=None):
+    # tasks: (목차 인덱스 집합, 인자) 리스트. 같은 목차를 사용하는 작업은 리스트 순서대로, 나머지는 동시에 실행
+    # on_progress: 작업 하나가 끝날 때마다 (끝난 작업 수, 전체 작업 수)로 호출
+    report = on_progress or (lambda done, total: None)
+    completed = 0
+    pending = list(range(len(tasks)))
+    running = {}
+    busy = set()
+    with ContextThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            blocked = set(busy)
+            for task_id in list(pending):
+                keys = tasks[task_id][0]
+                if not (keys & blocked):
+                    running[executor.submit(run, *tasks[task_id][1])] = keys
+                    busy |= keys
+                    pending.remove(task_id)
+                # 앞선 작업이 기다리는 목차는 뒤의 작업이 먼저 사용하지 못하도록 막음
+                blocked |= keys
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                busy -= running.pop(future)
+                future.result()
+                completed += 1
+                report(completed, len(tasks))
+
+def get_progress_reporter(config):
+    # config["configurable"]["progress_run_id"]가 없으면 아무것도 기록하지 않는 reporter 반환
+    return ProgressReporter((config or {}).get("configurable", {}).get("progress_run_id"))
+
+def make_final_documents(state: GraphState, config=None):
+    # 서로 다른 목차는 서로의 내용을 참조하지 않으므로 목차별 QA 체인을 동시에 실행
+    # 같은 목차 안에서는 QA 세트를 대화 순서대로 반영해 순차 실행과 같은 결과를 유지
+    reporter = get_progress_reporter(config)
+    if WRITER_MULTI_SECTION:
+        return make_final_documents_multi_section(state, reporter)
+
     preprocessed_conversations = state['preprocessed_conversations']
+    qa_chains = {}
     for i in range(len(preprocessed_conversations)):
-        qa = preprocessed_conversations[i]
-        indices_for_qa = state['message_to_index_dict'][str(i)]
-        #print('QA', i, 'processing...')
-        for index in indices_for_qa:
-            document = state['final_documents'][index]
-            for i in range(10):
-                generated_doc, _ = write(model, qa, document)
-                updated_doc = remove_after_second_hashes(generated_doc.content)
-                if not ('[Q]' in updated_doc) and not ('```' in updated_doc):
-                    break
-                else:
-                    pass
-                    #print('[Q] or ``` included error')
-            state['final_documents'][index] = updated_doc
+        for index in state['message_to_index_dict'][str(i)]:
+            qa_chains.setdefault(index, []).append(preprocessed_conversations[i])
+
+    reporter.start("writing", total=len(qa_chains))
+    with ContextThreadPoolExecutor(max_workers=max(1, min(WRITER_MAX_CONCURRENCY, len(qa_chains)))) as executor:
+        futures = {
+            executor.submit(draft_section, qa_list, state['final_documents'][index], state['code_document']): index
+            for index, qa_list in qa_chains.items()
+        }
+        draft_stats = {}
+        for future in as_completed(futures):
+            index = futures[future]
+            state['final_documents'][index], draft_stats[index] = future.result()
             #print('doc', index, '...')
+            reporter.advance("writing", len(draft_stats), len(qa_chains))
+    reporter.finish("writing")
+    state['draft_stats'] = draft_stats
+    return state
+
+def make_final_documents_multi_section(state: GraphState, reporter):
+    # QA 세트마다 해당하는 모든 목차를 한 번의 호출로 작성
+    # 목차를 공유하는 QA 세트는 대화 순서대로, 목차가 겹치지 않는 QA 세트는 동시에 작성
+    documents = state['final_documents']
+    draft_stats = {}
+    tasks = []
+    for i, qa in enumerate(state['preprocessed_conversations']):
+        indices_for_qa = list(dict.fromkeys(state['message_to_index_dict'][str(i)]))
+        if not indices_for_qa:
+            continue
+        for index in indices_for_qa:
+            draft_stats.setdefault(index, new_draft_stats())
+        tasks.append((set(indices_for_qa), (qa, indices_for_qa)))
+
+    def run(qa, indices_for_qa):
+        updated = draft_qa_multi_section(qa, {index: documents[index] for index in indices_for_qa}, state['code_document'], draft_stats)
+        documents.update(updated)
+
+    reporter.start("writing", total=len(tasks))
+    run_ordered_tasks(tasks, run, max_workers=max(1, WRITER_MAX_CONCURRENCY), on_progress=reporter.callback("writing"))
+    reporter.finish("writing")
+    state['draft_stats'] = draft_stats
     return state
 
 ##########################블로그 초안 작성하는 노드와 관련 함수 정의###############################
@@ -158,62 +429,192 @@ def find_indices_and_snippet_with_code_id(code_id: str, doc_dict):
             whole_snippet = match.group().strip()
     return indices_list, heading_list, whole_snippet
 
+class CodeSnippetIndex:
+    """
+    final_documents를 한 번만 훑어 code id -> (목차 인덱스, 제목, 설명을 포함한 전체 code snippet) 역색인을 만듭니다.
+    document_refinement에서 목차를 다시 작성하면 update_section으로 해당 목차만 다시 색인합니다.
+    lookup 결과는 find_indices_and_snippet_with_code_id와 같습니다.
+    """
+
+    PLACEHOLDER_START = re.compile(r"<-- (\w+): ")
+
+    def __init__(self, doc_dict):
+        self.order = {key: position for position, key in enumerate(doc_dict)}
+        self.headings = {}
+        self.section_snippets = {}   # 목차 인덱스 -> {code id: 전체 code snippet}
+        self.code_sections = {}      # code id -> 해당 code snippet이 들어 있는 목차 인덱스 집합
+        for key in doc_dict:
+            self.update_section(key, doc_dict[key])
+
+    @classmethod
+    def find_snippets(cls, text):
+        # 목차 하나에서 code id별로 첫 번째 placeholder를 찾음 (f"<-- {code_id}: .*? -->"의 re.search와 동일)
+        snippets = {}
+        for match in cls.PLACEHOLDER_START.finditer(text):
+            code_id = match.group(1)
+            if code_id in snippets:
+                continue
+            end = text.find(" -->", match.end())
+            newline = text.find("\n", match.end())
+            if end != -1 and (newline == -1 or end < newline):
+                snippets[code_id] = text[match.start():end + len(" -->")].strip()
+        return snippets
+
+    def update_section(self, key, text):
+        for code_id in self.section_snippets.get(key, {}):
+            self.code_sections[code_id].discard(key)
+        if key not in self.order:
+            self.order[key] = len(self.order)
+        self.headings[key] = extract_heading(text)
+        self.section_snippets[key] = self.find_snippets(text)
+        for code_id in self.section_snippets[key]:
+            self.code_sections.setdefault(code_id, set()).add(key)
+
+    def lookup(self, code_id: str):
+        indices_list = sorted(self.code_sections.get(code_id, ()), key=self.order.get)
+        heading_list = [self.headings[key] for key in indices_list]
+        whole_snippet = self.section_snippets[indices_list[-1]][code_id] if indices_list else 'None'
+        return indices_list, heading_list, whole_snippet
+
 def make_heading_list_for_prompt(heading_list):
     text = ''
     for heading in heading_list:
         text = text + heading + '\n'
     return text[:-1]
 
-def document_refinement(state: GraphState):
+def make_snippet_assignment_prompt(conflicts):
+    snippet_blocks = []
+    for code_id, (indices_list, heading_list, whole_snippet) in conflicts.items():
+        sections = "\n".join(f"- {index}: {heading}" for index, heading in zip(indices_list, heading_list))
+        snippet_blocks.append(f"[{code_id}]\nsnippet: {whole_snippet}\nsections:\n{sections}")
+    snippet_assignment_prompt = get_prompt("snippet_assignment_prompt")
+    return snippet_assignment_prompt.compile(snippet_blocks="\n\n".join(snippet_blocks))
+
+def make_snippet_assignment_format(conflicts):
+    # 응답을 code id마다 해당 snippet이 들어 있는 목차 인덱스 중 하나만 고를 수 있는 JSON 객체로 제한 (structured output)
+    schema = {
+        "type": "object",
+        "properties": {code_id: {"type": "string", "enum": list(indices_list)} for code_id, (indices_list, _, _) in conflicts.items()},
+        "required": list(conflicts),
+        "additionalProperties": False,
+    }
+    return {"type": "json_schema", "json_schema": {"name": "snippet_assignment", "strict": True, "schema": schema}}
+
+def parse_snippet_assignment(text):
+    # structured output 응답을 그대로 파싱, JSON 객체가 아니면 ValueError
+    parsed = json.loads(text)
+    if not isinstance(parsed, dict):
+        raise ValueError(f"snippet assignment is not a JSON object: {text[:100]}")
+    return parsed
+
+def assign_conflicting_snippets(conflicts):
+    # 여러 목차에 들어간 code snippet들이 남을 목차를 한 번의 structured output 호출로 정함
+    # 응답 중 해당 snippet의 목차 인덱스가 아닌 값은 버리고, 끝까지 정해지지 않은 snippet은 첫 번째 목차에 남김
+    prompt = make_snippet_assignment_prompt(conflicts)
+    response_format = make_snippet_assignment_format(conflicts)
+    assignment = {}
+    for i in range(3):
+        try:
+            selections = model.invoke(prompt, attempt=i, response_format=response_format, parse=parse_snippet_assignment)
+        except ValueError as e:
+            logger.warning(f"Failed to parse snippet assignment (attempt {i + 1}/3): {e}")
+            continue
+        for code_id, selected in selections.items():
+            if code_id in conflicts and str(selected) in conflicts[code_id][0]:
+                assignment.setdefault(code_id, str(selected))
+        if len(assignment) == len(conflicts):
+            break
+    for code_id, (indices_list, _, _) in conflicts.items():
+        assignment.setdefault(code_id, indices_list[0])
+    return assignment
+
+def snippets_removed(document, rewritten, removed_ids):
+    # 다시 작성한 목차에서 지워야 할 snippet이 모두 빠지고, 나머지 snippet은 모두 남아 있는지 검사
+    before = set(CodeSnippetIndex.find_snippets(document))
+    after = set(CodeSnippetIndex.find_snippets(rewritten))
+    return not (after & removed_ids) and before - removed_ids <= after
+
+def document_refinement(state: GraphState, config=None):
     # 그래프 스테이트에서 code_list를 받아오도록 변경, 아래 코드 삭제 요함
     # code_list = list(loaded_data['EXAMPLE9']['code_document'].keys())
     code_list = list(state['code_document'].keys())
-    document_refinement_1 = langfuse.get_prompt("document_refinement_1")
-    document_refinement_2 = langfuse.get_prompt("document_refinement_2")
+    document_refinement_2 = get_prompt("document_refinement_2")
+    snippet_index = CodeSnippetIndex(state['final_documents'])
+    conflicts = {}
     for code_id in code_list:
-        #print(code_id, 'processing...')
-        indices_list, heading_list, whole_snippet = find_indices_and_snippet_with_code_id(code_id, state['final_documents'])
-        if len(indices_list) < 2:
-            #print('no founded')
-            continue        
-        indices = make_heading_list_for_prompt(heading_list)
-
-        prompt = document_refinement_1.compile(code_snippet=whole_snippet, indices=indices)
-        for i in range(10):
-            selected = model.invoke(prompt)
-            selected = selected.content
-            if selected in indices_list:
-                break
-            else:
-                pass
-                #print('selecting error')
+        indices_list, heading_list, whole_snippet = snippet_index.lookup(code_id)
+        if len(indices_list) >= 2:
+            conflicts[code_id] = (indices_list, heading_list, whole_snippet)
+    reporter = get_progress_reporter(config)
+    if not conflicts:
+        reporter.start("refinement", total=0)
+        reporter.finish("refinement")
+        return state
+
+    # 목차별로 빠져야 하는 code snippet을 모아 목차마다 한 번만 다시 작성
+    reporter.start("refinement")
+    assignment = assign_conflicting_snippets(conflicts)
+    lost_snippets = {}
+    for code_id, (indices_list, _, whole_snippet) in conflicts.items():
         for index in indices_list:
-            if selected != index:
-                #print(index, '...')
-                doc = state['final_documents'][index]
-                prompt = document_refinement_2.compile(code_snippet=whole_snippet, doc=doc)
-                updated = model.invoke(prompt)
-                state['final_documents'][index] = updated.content
+            if index != assignment[code_id]:
+                lost_snippets.setdefault(index, {})[code_id] = whole_snippet
+
+    def remove_snippets(index):
+        # 빠져야 하는 snippet이 여러 개이면 한 번에 지우고, 결과를 검사해 실패하면 snippet마다 하나씩 지움
+        document = state['final_documents'][index]
+        snippets = lost_snippets[index]
+        if len(snippets) > 1:
+            snippet_removal_prompt = get_prompt("snippet_removal_prompt")
+            prompt = snippet_removal_prompt.compile(code_snippets='\n'.join(snippets.values()), doc=document)
+            rewritten = model.invoke(prompt).content
+            if snippets_removed(document, rewritten, set(snippets)):
+                return rewritten
+            logger.info(f"Section {index}: batched snippet removal failed the check, removing snippets one at a time")
+        for whole_snippet in snippets.values():
+            prompt = document_refinement_2.compile(code_snippet=whole_snippet, doc=document)
+            document = model.invoke(prompt).content
+        return document
+
+    with ContextThreadPoolExecutor(max_workers=max(1, min(WRITER_MAX_CONCURRENCY, len(lost_snippets)))) as executor:
+        futures = {executor.submit(remove_snippets, index): index for index in lost_snippets}
+        for done, future in enumerate(as_completed(futures), start=1):
+            #print(index, '...')
+            index = futures[future]
+            state['final_documents'][index] = future.result()
+            # 다시 작성한 목차만 다시 색인
+            snippet_index.update_section(index, state['final_documents'][index])
+            reporter.advance("refinement", done, len(lost_snippets))
+    for code_id in conflicts:
+        indices_list, _, _ = snippet_index.lookup(code_id)
+        if len(indices_list) >= 2:
+            logger.warning(f"{code_id} still appears in sections {indices_list} after refinement")
+    reporter.finish("refinement")
     return state
 
 ##################블로그 초안을 받아 하나의 코드가 하나의 목차에만 들어가게 수정하는 노드와 관련 함수 정의##############
 
 ######################작성한 블로그의 코드 스니펫을 원래 코드로 교체 및 헤딩 표시(#) 지우기######################
 
-def replace_code_snippets(document, snippets_dict):
-    # Code_Snippet_1 및 Code_Snippet_2 키를 사용해 대체할 패턴을 찾음
-    for snippet_key in snippets_dict:
-        # 대체할 패턴을 정의
-        pattern = f"<-- {snippet_key}:.*?-->"
-        # document 내에서 해당 placeholder를 딕셔너리의 value로 대체
-        document = re.sub(pattern, "```" + snippets_dict[snippet_key] + "```\n", document)
-    
-    return document
+def compile_snippet_pattern(snippets_dict):
+    # snippets_dict의 모든 키에 해당하는 placeholder를 한 번에 찾는 패턴 (긴 키를 먼저 시도)
+    keys = sorted(snippets_dict, key=len, reverse=True)
+    return re.compile("<-- (" + "|".join(re.escape(key) for key in keys) + "):.*?-->")
+
+def replace_code_snippets(document, snippets_dict, pattern=None):
+    # 모든 Code_Snippet placeholder를 한 번의 탐색으로 딕셔너리의 value로 대체
+    # 코드는 re.sub의 치환 문자열로 해석하지 않고 그대로 삽입 (코드 안의 역슬래시 보존)
+    if not snippets_dict:
+        return document
+    if pattern is None:
+        pattern = compile_snippet_pattern(snippets_dict)
+    return pattern.sub(lambda match: "```" + snippets_dict[match.group(1)] + "```\n", document)
 
 def make_blog(state: GraphState):
+    pattern = compile_snippet_pattern(state['code_document']) if state['code_document'] else None
     for index in state['final_documents']:
         text = state['final_documents'][index]
-        t = replace_code_snippets(text, state['code_document'])
+        t = replace_code_snippets(text, state['code_document'], pattern)
         t = t.lstrip('#')
         t = t.lstrip(' ')
         state['final_documents'][index] = t
@@ -223,8 +624,8 @@ def make_blog(state: GraphState):
 ######################작성한 블로그의 코드 스니펫을 원래 코드로 교체 및 헤딩 표시(#) 지우기######################
 
 ##########################그래프 내의 요소(node, edge)들을 정의###############################3
-# 메모리를 정의
-memory = MemorySaver() 
+# 메모리를 정의 (worker들이 공유하는 SQLite 파일에 저장, 요청마다 thread_id가 다르므로 오래된 thread의 체크포인트는 삭제)
+memory = SQLiteCheckpointSaver()
 
 # 새로운 graph 정의
 writer_graph = StateGraph(GraphState)
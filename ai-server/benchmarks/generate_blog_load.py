@@ -0,0 +1,135 @@
+"""
+Load test: /generate-blog throughput at N concurrent requests.
+
+Before, /generate-blog called its own stage endpoints over localhost HTTP. Each
+hop needed a second gunicorn sync worker while the orchestrating request kept
+its own, so with N >= workers every worker could end up waiting on itself.
+Now the stages are plain functions called in-process.
+
+Without --url this starts a local stub server that behaves like gunicorn sync
+workers (at most --workers requests handled at once, the rest wait) and whose
+stages only sleep for --stage-latency seconds. It compares:
+  loopback    the orchestrator POSTs each stage back to the same server
+  in-process  the orchestrator calls the stage functions directly
+Requests that do not finish within --timeout count as failed (pool deadlock).
+
+With --url it sends the same concurrent load to a running server's
+/generate-blog (real LLM and Notion calls) for --conversation-id.
+
+Usage (from ai-server/):
+    python -m benchmarks.generate_blog_load --workers 4 --concurrency 1 4 8 --requests 16
+    python -m benchmarks.generate_blog_load --url http://localhost:4000 --conversation-id 1 --concurrency 1 2 --requests 4
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# /generate-blog의 단계: categorize, summarize, 유형별 draft, review, publish
+STAGES = ("categorize", "summarize", "draft", "review", "publish")
+
+
+def post(url, payload, timeout):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def make_server(workers, stage_latency, timeout):
+    # gunicorn sync worker처럼 동시에 workers개의 요청만 처리하고, 나머지 연결은 빈 worker를 기다림
+    worker_slots = threading.BoundedSemaphore(workers)
+
+    def run_stage(stage):
+        time.sleep(stage_latency)
+        return {"stage": stage}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with worker_slots:
+                try:
+                    if self.path == "/stage":
+                        result = run_stage(body["stage"])
+                    elif self.path == "/generate-blog-loopback":
+                        base_url = f"http://127.0.0.1:{self.server.server_port}"
+                        result = [post(base_url + "/stage", {"stage": stage}, timeout) for stage in STAGES]
+                    else:
+                        result = [run_stage(stage) for stage in STAGES]
+                    status, payload = 200, {"result": result}
+                except (urllib.error.URLError, OSError) as e:
+                    status, payload = 500, {"error": str(e)}
+            data = json.dumps(payload).encode()
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # timeout으로 먼저 끊긴 요청
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def measure(url, payload, concurrency, requests, timeout):
+    def send(_):
+        try:
+            post(url, payload, timeout)
+            return True
+        except (urllib.error.URLError, OSError):
+            return False
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, range(requests)))
+    elapsed = time.perf_counter() - started_at
+    succeeded = sum(results)
+    return succeeded, requests - succeeded, elapsed
+
+
+def report(label, concurrency, succeeded, failed, elapsed):
+    print(f"{label:<11} N={concurrency:<3} ok={succeeded:<4} failed={failed:<4} {elapsed:6.2f}s  {succeeded / elapsed:6.2f} req/s")
+
+
+def run(workers, concurrency_levels, requests, stage_latency, timeout):
+    for concurrency in concurrency_levels:
+        # 교착된 요청이 다음 측정에 영향을 주지 않도록 측정마다 서버를 새로 띄움
+        for label, path in (("loopback", "/generate-blog-loopback"), ("in-process", "/generate-blog")):
+            server = make_server(workers, stage_latency, timeout)
+            url = f"http://127.0.0.1:{server.server_port}{path}"
+            report(label, concurrency, *measure(url, {}, concurrency, requests, timeout))
+            server.shutdown()
+            server.server_close()
+    print(f"workers={workers} stages/request={len(STAGES)} stage latency={stage_latency}s timeout={timeout}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--stage-latency", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, help="per-request timeout in seconds (default: 5, or 600 with --url)")
+    parser.add_argument("--url", help="base URL of a running server; measures its /generate-blog instead of the stub server")
+    parser.add_argument("--conversation-id")
+    args = parser.parse_args()
+    if args.timeout is None:
+        args.timeout = 600 if args.url else 5
+    if args.url:
+        for concurrency in args.concurrency:
+            report("server", concurrency, *measure(
+                args.url.rstrip("/") + "/generate-blog", {"conversation_id": args.conversation_id},
+                concurrency, args.requests, args.timeout))
+    else:
+        run(args.workers, args.concurrency, args.requests, args.stage_latency, args.timeout)
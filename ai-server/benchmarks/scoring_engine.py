@@ -0,0 +1,93 @@
+"""
+Micro-benchmark: BLEU/ROUGE/recall scoring of long ChatGPT answers.
+
+The backtick loop scores the same long original answer against every candidate.
+This compares the previous per-call metrics (new RougeScorer and SmoothingFunction,
+and a fresh tokenization of both texts, on every call) with ScoringEngine.score_many,
+which prepares the reference once. Both must return the same scores.
+
+Usage (from ai-server/):
+    python -m benchmarks.scoring_engine --words 3000 --candidates 3 --answers 20
+"""
+import argparse
+import random
+import time
+
+from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
+from rouge_score import rouge_scorer
+
+from app.processing_qna.evaluate_score import ScoringEngine
+
+WORDS = ("the", "function", "returns", "list", "error", "value", "database", "connection", "retry", "timeout",
+         "리스트를", "정렬하면", "에러가", "발생합니다", "코드를", "수정했습니다", "self.items", "append()", "None", "await")
+
+
+def per_call_score(reference, hypothesis):
+    """ScoringEngine 이전의 evaluate_processed_answer와 같은 계산."""
+    bleu = sentence_bleu([reference.split()], hypothesis.split(), smoothing_function=SmoothingFunction().method4)
+    rouge = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True).score(reference, hypothesis)
+    ref_ngrams, hyp_ngrams = set(reference.split()), set(hypothesis.split())
+    recall = len(ref_ngrams & hyp_ngrams) / len(ref_ngrams) if ref_ngrams else 0.0
+    return {"bleu": bleu, "rouge": rouge, "recall": recall}
+
+
+def make_answer(rng, words):
+    lines, line = [], []
+    for i in range(words):
+        line.append(rng.choice(WORDS))
+        if len(line) == 12:
+            lines.append(" ".join(line))
+            line = []
+        if i % 400 == 399:
+            lines.append("```python\ndef handler(items):\n    return sorted(items, key=lambda item: item.value)\n```")
+    lines.append(" ".join(line))
+    return "\n".join(lines)
+
+
+def make_candidates(rng, answer, candidates):
+    # 백틱 처리 후보처럼 원문과 대부분 같고 일부 줄만 다른 텍스트
+    result = []
+    for _ in range(candidates):
+        lines = answer.splitlines()
+        for _ in range(len(lines) // 10):
+            index = rng.randrange(len(lines))
+            lines[index] = f"`{lines[index]}`"
+        result.append("\n".join(lines))
+    return result
+
+
+def run(words, candidates, answers, seed=0):
+    rng = random.Random(seed)
+    workload = []
+    for _ in range(answers):
+        answer = make_answer(rng, words)
+        workload.append((answer, make_candidates(rng, answer, candidates)))
+
+    started_at = time.perf_counter()
+    baseline = [[per_call_score(answer, candidate) for candidate in hypotheses] for answer, hypotheses in workload]
+    baseline_elapsed = time.perf_counter() - started_at
+
+    engine = ScoringEngine()
+    started_at = time.perf_counter()
+    batched = [engine.score_many(answer, hypotheses) for answer, hypotheses in workload]
+    engine_elapsed = time.perf_counter() - started_at
+
+    for expected_scores, actual_scores in zip(baseline, batched):
+        for expected, actual in zip(expected_scores, actual_scores):
+            assert expected["bleu"] == actual["bleu"] and expected["recall"] == actual["recall"]
+            assert all(tuple(expected["rouge"][key]) == tuple(actual["rouge"][key]) for key in expected["rouge"])
+
+    pairs = answers * candidates
+    print(f"answers={answers} words/answer={words} candidates/answer={candidates}")
+    print(f"per-call:     {baseline_elapsed:.2f}s ({baseline_elapsed / pairs * 1000:.1f} ms/pair)")
+    print(f"score_many:   {engine_elapsed:.2f}s ({engine_elapsed / pairs * 1000:.1f} ms/pair)")
+    print(f"speedup:      {baseline_elapsed / engine_elapsed:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=3000)
+    parser.add_argument("--candidates", type=int, default=3)
+    parser.add_argument("--answers", type=int, default=20)
+    args = parser.parse_args()
+    run(args.words, args.candidates, args.answers)
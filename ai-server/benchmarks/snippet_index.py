@@ -0,0 +1,64 @@
+"""
+Benchmark: code-snippet lookups in document_refinement.
+
+Synthetic final_documents with 500 Code_Snippet ids spread over 30 sections
+(some ids repeated in several sections). Compares one
+find_indices_and_snippet_with_code_id scan per id with a single
+CodeSnippetIndex build plus lookups, and times an incremental update_section
+after a section is rewritten. Both must return identical results.
+
+Usage (from ai-server/):
+    python -m benchmarks.snippet_index --snippets 500 --sections 30
+"""
+import argparse
+import random
+import time
+
+from app.writer.writer import CodeSnippetIndex, find_indices_and_snippet_with_code_id
+
+
+def make_documents(rng, snippets, sections):
+    documents = {str(section): [f"## Section {section}: heading", "Some explanation of the section."] for section in range(sections)}
+    for snippet in range(1, snippets + 1):
+        # 대부분은 한 목차에, 일부는 여러 목차에 같은 snippet이 들어감
+        for section in rng.sample(range(sections), 1 if rng.random() < 0.8 else 3):
+            documents[str(section)].append(f"<-- Code_Snippet_{snippet}: description of snippet {snippet} -->")
+            documents[str(section)].append("A paragraph of generated prose that follows the snippet. " * 3)
+    return {key: "\n".join(lines) for key, lines in documents.items()}
+
+
+def run(snippets, sections, seed=0):
+    rng = random.Random(seed)
+    documents = make_documents(rng, snippets, sections)
+    code_ids = [f"Code_Snippet_{snippet}" for snippet in range(1, snippets + 1)]
+
+    started_at = time.perf_counter()
+    expected = [find_indices_and_snippet_with_code_id(code_id, documents) for code_id in code_ids]
+    scan_elapsed = time.perf_counter() - started_at
+
+    started_at = time.perf_counter()
+    index = CodeSnippetIndex(documents)
+    actual = [index.lookup(code_id) for code_id in code_ids]
+    index_elapsed = time.perf_counter() - started_at
+    assert actual == expected, "CodeSnippetIndex results differ from find_indices_and_snippet_with_code_id"
+
+    # 목차 하나를 다시 작성한 뒤 해당 목차만 다시 색인
+    rewritten = next(iter(documents))
+    documents[rewritten] = documents[rewritten].replace("<-- Code_Snippet_", "<-- Rewritten_Snippet_", 1)
+    started_at = time.perf_counter()
+    index.update_section(rewritten, documents[rewritten])
+    update_elapsed = time.perf_counter() - started_at
+    assert [index.lookup(code_id) for code_id in code_ids] == [find_indices_and_snippet_with_code_id(code_id, documents) for code_id in code_ids]
+
+    print(f"snippets={snippets} sections={sections} document size={sum(map(len, documents.values()))} chars")
+    print(f"per-id scan:           {scan_elapsed * 1000:.1f} ms")
+    print(f"index build + lookups: {index_elapsed * 1000:.1f} ms ({scan_elapsed / index_elapsed:.1f}x)")
+    print(f"update_section:        {update_elapsed * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--snippets", type=int, default=500)
+    parser.add_argument("--sections", type=int, default=30)
+    args = parser.parse_args()
+    run(args.snippets, args.sections)
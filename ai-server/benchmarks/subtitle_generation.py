@@ -0,0 +1,64 @@
+"""
+Benchmark: serial vs concurrent per-QA subtitle generation.
+
+The model call is replaced by a stub with a fixed latency, so the numbers only
+measure how SubtitleGenerator.generate schedules the calls. With N QA pairs and
+concurrency C the wall clock should drop from about N x latency to about
+ceil(N / C) x latency, and the subtitle_list must be identical in both modes.
+
+Usage (from ai-server/):
+    python -m benchmarks.subtitle_generation --pairs 40 --latency 0.2 --concurrency 8
+"""
+import argparse
+import time
+
+from app.subtitle_generator.subtitle_generator import SubtitleGenerator
+
+
+class StubLatencySubtitleGenerator(SubtitleGenerator):
+    """SubtitleGenerator whose LLM call sleeps for a fixed latency and returns deterministic subtitles."""
+
+    def __init__(self, latency, max_concurrency):
+        self.latency = latency
+        self.max_concurrency = max_concurrency
+        self.length_limit = 3000
+        self.debug = False
+
+    def generate_subtitles(self, question, answer):
+        time.sleep(self.latency)
+        return f"{question} subtitle 1\n\n{question} subtitle 2"
+
+
+def make_conversation(pairs):
+    conversation = []
+    for i in range(pairs):
+        conversation.append({"message_content": f"question {i}"})
+        conversation.append({"message_content": f"answer {i}"})
+    return conversation
+
+
+def run(pairs, latency, concurrency):
+    conversation = make_conversation(pairs)
+    results = {}
+    for mode, max_concurrency in (("serial", 1), ("concurrent", concurrency)):
+        generator = StubLatencySubtitleGenerator(latency, max_concurrency)
+        started_at = time.perf_counter()
+        subtitle_list = generator.generate(conversation)
+        results[mode] = (time.perf_counter() - started_at, subtitle_list)
+
+    assert results["serial"][1] == results["concurrent"][1], "subtitle_list differs between serial and concurrent mode"
+    serial_elapsed, concurrent_elapsed = results["serial"][0], results["concurrent"][0]
+    print(f"pairs={pairs} latency={latency}s concurrency={concurrency}")
+    print(f"serial:     {serial_elapsed:.2f}s (expected ~{pairs * latency:.2f}s)")
+    print(f"concurrent: {concurrent_elapsed:.2f}s (expected ~{-(-pairs // concurrency) * latency:.2f}s)")
+    print(f"speedup:    {serial_elapsed / concurrent_elapsed:.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    run(args.pairs, args.latency, args.concurrency)
@@ -0,0 +1,57 @@
+"""
+Measurement: share of question-summary evaluations decided without GEval.
+
+Runs the Q&A processing pipeline (solar-pro summaries, real embeddings and
+GEval) on the CONVERSATION_ID example conversations and reports, per
+conversation and in total, how many evaluate_coherence_tiered calls were
+accepted or rejected locally and how many still went to GEval. With
+--output the report is also written as JSON so the measured numbers can be
+committed next to this script.
+
+Needs the same environment as the server (Supabase, Upstage, OpenAI keys).
+
+Usage (from ai-server/):
+    python -m benchmarks.tiered_coherence --output benchmarks/results/tiered_coherence.json
+    python -m benchmarks.tiered_coherence --examples EXAMPLE_1 EXAMPLE_1_KOR
+"""
+import argparse
+import json
+import os
+
+from app.constants import CONVERSATION_ID
+from app.processing_qna.evaluate_score import (
+    COHERENCE_ACCEPT_EDGE, COHERENCE_MIN_COVERAGE, COHERENCE_REJECT_EDGE,
+    get_tiered_evaluation_report, snapshot_tiered_evaluation_stats
+)
+from app.processing_qna.qna_processor import run_pipeline
+
+
+def run(examples, model_name="solar-pro"):
+    started = snapshot_tiered_evaluation_stats()
+    per_example = {}
+    for name in examples:
+        since = snapshot_tiered_evaluation_stats()
+        run_pipeline(model_name, CONVERSATION_ID[name])
+        per_example[name] = get_tiered_evaluation_report(since=since)
+        print(f"{name:<15} {per_example[name]}")
+    total = get_tiered_evaluation_report(since=started)
+    print(f"{'total':<15} {total}")
+    return {
+        "settings": {"accept_edge": COHERENCE_ACCEPT_EDGE, "reject_edge": COHERENCE_REJECT_EDGE, "min_coverage": COHERENCE_MIN_COVERAGE},
+        "examples": per_example,
+        "total": total,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--examples", nargs="+", default=list(CONVERSATION_ID), choices=list(CONVERSATION_ID))
+    parser.add_argument("--output", help="write the report as JSON to this path")
+    args = parser.parse_args()
+    report = run(args.examples)
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
@@ -1,9 +1,15 @@
 # gunicorn.conf.py
 import multiprocessing
+import os
 
 bind = "0.0.0.0:4000"
 workers = multiprocessing.cpu_count() * 2 + 1
 loglevel = 'info'
 errorlog = '-'  # 표준 에러를 로깅하도록 설정
 accesslog = '-'  # 표준 출력으로 액세스 로그를 보냄
+# SSE 진행 스트림(/progress/<run_id>/events)은 구독자마다 요청 하나를 계속 점유하므로 sync worker 대신 thread worker 사용
+# 스트림과 긴 블로그 생성 요청은 worker 프로세스가 아닌 thread 하나씩만 점유함 (worker마다 동시에 threads개의 요청 처리)
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 16))
+# gthread worker에서는 요청 처리 시간이 아닌 worker 프로세스의 응답 여부에 적용됨
 timeout = 120
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""
+Create (or add a new version of) the blog writer prompts in Langfuse.
+
+The writer fetches every prompt with app.prompt_registry.get_prompt, so these
+must exist in the Langfuse project before the code paths that use them run.
+Re-running adds a new version with the given label; edit the prompt in the
+Langfuse UI afterwards like the other writer prompts.
+
+Usage (from ai-server/, with LANGFUSE_* keys in the environment or .env):
+    python -m scripts.create_writer_prompts --label production
+"""
+import argparse
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from langfuse import Langfuse
+
+WRITER_PROMPTS = {
+    # writer.write_incremental, 변수: outline, used_snippets, tail, q, a
+    "incremental_writing_prompt": """You are extending one section of a technical blog post with the content of a new Q&A pair.
+The section is too long to show in full, so you are given an outline of its beginning and its most recent part.
+
+Outline of the beginning of the section:
+{{outline}}
+
+Code snippet placeholders already used in the beginning of the section: {{used_snippets}}
+
+Most recent part of the section:
+{{tail}}
+
+New Q&A pair:
+[Q] {{q}}
+[A] {{a}}
+
+Write only the new paragraphs that should be appended to the end of the section to cover the new Q&A pair.
+Do not repeat what the section already explains, do not add any heading, and do not write the [Q] or [A] markers.
+Keep code snippet placeholders such as <-- Code_Snippet_1: description --> exactly as they appear in the answer, and never write code blocks with ```.
+""",
+    # writer.draft_qa_multi_section, 변수: q, a, sections
+    "multi_section_writing_prompt": """You are writing a technical blog post that is split into sections. A new Q&A pair is relevant to several of its sections.
+Update each section below with the part of the Q&A pair that belongs to that section.
+
+New Q&A pair:
+[Q] {{q}}
+[A] {{a}}
+
+Current sections:
+{{sections}}
+
+Return every section in full after updating it, each wrapped exactly like:
+<section id="section id">
+updated section text, starting with its unchanged heading
+</section>
+Keep code snippet placeholders such as <-- Code_Snippet_1: description --> exactly as they appear in the answer, never write code blocks with ```, and do not write the [Q] or [A] markers.
+""",
+    # writer.assign_conflicting_snippets, 변수: snippet_blocks
+    "snippet_assignment_prompt": """Each code snippet below appears in more than one section of a blog post. For each snippet, choose the single section where it fits best, judging by the section headings.
+
+{{snippet_blocks}}
+
+Output format(JSON):
+{
+    "<code id>": "<section key chosen from that snippet's sections>"
+}
+Answer with a valid JSON object only, with one entry per code id.
+""",
+    # writer.document_refinement, 변수: code_snippets, doc
+    "snippet_removal_prompt": """The following section of a technical blog post contains code snippet placeholders that belong to other sections:
+{{code_snippets}}
+
+Section:
+{{doc}}
+
+Rewrite the section so that every placeholder listed above is removed, together with any sentences that only explain that code.
+Keep the heading, the rest of the text, and every other code snippet placeholder exactly as they are. Never write code blocks with ```.
+Output only the rewritten section.
+""",
+}
+
+
+def run(names, label):
+    langfuse = Langfuse()
+    for name in names:
+        langfuse.create_prompt(name=name, prompt=WRITER_PROMPTS[name], labels=[label], type="text")
+        print(f"created {name} ({label})")
+    langfuse.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--label", default="production")
+    parser.add_argument("names", nargs="*", default=list(WRITER_PROMPTS), help="prompt names to create (default: all)")
+    args = parser.parse_args()
+    run(args.names, args.label)
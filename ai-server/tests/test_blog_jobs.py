@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+# app 패키지를 import하면 app/__init__.py가 flask를 불러옴
+pytest.importorskip("flask")
+
+from app.blog_jobs import BlogJobRunner, BlogJobStore
+
+
+def make_runner(tmp_path, run=None, **kwargs):
+    store = BlogJobStore(str(tmp_path / "blog_jobs.sqlite3"))
+    return BlogJobRunner(run or (lambda conversation_id, **_: {"conversation_id": conversation_id}), store=store, **kwargs)
+
+
+def claim_as_other_host(store, conversation_id, updated_at):
+    # 교체되어 사라진 컨테이너의 worker가 선점한 running 작업
+    job_id = store.create(conversation_id)
+    assert store.claim(job_id, "replaced-container:1234")
+    with store._connect() as conn:
+        conn.execute("UPDATE blog_jobs SET updated_at = ? WHERE id = ?", (updated_at, job_id))
+    return job_id
+
+
+def wait_for_status(store, job_id, status, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if store.get(job_id)["status"] == status:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_stale_job_of_another_host_is_recovered(tmp_path):
+    runner = make_runner(tmp_path, stale_seconds=60)
+    job_id = claim_as_other_host(runner.store, "conversation", time.time() - 120)
+    assert runner.recover() == [job_id]
+    assert wait_for_status(runner.store, job_id, "succeeded")
+    assert runner.store.get(job_id)["result"] == {"conversation_id": "conversation"}
+
+
+def test_recent_job_of_another_host_is_left_running(tmp_path):
+    runner = make_runner(tmp_path, stale_seconds=60)
+    job_id = claim_as_other_host(runner.store, "conversation", time.time() - 10)
+    assert runner.recover() == []
+    assert runner.store.get(job_id)["status"] == "running"
+
+
+def test_heartbeat_keeps_running_job_from_going_stale(tmp_path):
+    release = threading.Event()
+
+    def run(conversation_id, **_):
+        release.wait(5)
+        return {}
+
+    runner = make_runner(tmp_path, run=run, heartbeat_seconds=0.05, stale_seconds=0.5)
+    runner.start()
+    try:
+        job_id = runner.submit("conversation")
+        time.sleep(1)
+        job = runner.store.get(job_id)
+        assert job["status"] == "running" and time.time() - job["updated_at"] < 0.5
+        # 다른 worker가 보아도 살아 있는 작업이므로 다시 실행하지 않음
+        assert make_runner(tmp_path, stale_seconds=0.5).recover() == []
+    finally:
+        release.set()
+        runner.stop()
+    assert wait_for_status(runner.store, job_id, "succeeded")
@@ -0,0 +1,115 @@
+from typing import TypedDict
+
+import pytest
+
+# app 패키지를 import하면 app/__init__.py가 flask를 불러옴
+pytest.importorskip("flask")
+pytest.importorskip("langgraph")
+
+from langgraph.graph import StateGraph
+
+from app.writer import checkpointer
+from app.writer.checkpointer import SQLiteCheckpointSaver
+
+
+class CountState(TypedDict):
+    steps: list
+
+
+def build_graph(saver, calls, fail_second):
+    def first(state):
+        calls.append("first")
+        return {"steps": state["steps"] + ["first"]}
+
+    def second(state):
+        calls.append("second")
+        if fail_second:
+            raise RuntimeError("LLM call failed")
+        return {"steps": state["steps"] + ["second"]}
+
+    graph = StateGraph(CountState)
+    graph.add_node("first", first)
+    graph.add_node("second", second)
+    graph.set_entry_point("first")
+    graph.add_edge("first", "second")
+    graph.set_finish_point("second")
+    return graph.compile(checkpointer=saver)
+
+
+def make_saver(tmp_path, **kwargs):
+    return SQLiteCheckpointSaver(str(tmp_path / "checkpoints.sqlite3"), **kwargs)
+
+
+def run_first_node(saver, thread_id):
+    config = {"configurable": {"thread_id": thread_id}}
+    with pytest.raises(RuntimeError):
+        build_graph(saver, [], fail_second=True).invoke({"steps": []}, config=config)
+    return config
+
+
+def test_failed_run_resumes_on_another_worker(tmp_path):
+    # 실패한 worker와 다른 worker(같은 파일을 사용하는 다른 인스턴스)에서 마지막으로 완료된 노드부터 재개
+    config = run_first_node(make_saver(tmp_path), "thread-1")
+
+    calls = []
+    graph = build_graph(make_saver(tmp_path), calls, fail_second=False)
+    assert graph.get_state(config).next == ("second",)
+    assert graph.invoke(None, config=config) == {"steps": ["first", "second"]}
+    assert calls == ["second"]
+    assert graph.get_state(config).next == ()
+
+
+def test_delete_thread_removes_checkpoints_and_writes(tmp_path):
+    saver = make_saver(tmp_path)
+    run_first_node(saver, "thread-1")
+    run_first_node(saver, "thread-2")
+    assert saver.has_checkpoint("thread-1")
+
+    saver.delete_thread("thread-1")
+    assert not saver.has_checkpoint("thread-1")
+    assert saver.get_tuple({"configurable": {"thread_id": "thread-1"}}) is None
+    with saver._connect() as conn:
+        tables = ("writer_checkpoints", "writer_checkpoint_writes", "writer_checkpoint_threads")
+        assert all(conn.execute(f"SELECT COUNT(*) FROM {table} WHERE thread_id = 'thread-1'").fetchone()[0] == 0 for table in tables)
+    assert saver.has_checkpoint("thread-2")
+
+
+def test_threads_unused_for_ttl_are_evicted(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(checkpointer.time, "time", lambda: now[0])
+    saver = make_saver(tmp_path, ttl_seconds=60)
+    run_first_node(saver, "old")
+    now[0] += 30
+    run_first_node(saver, "recent")
+
+    # old는 마지막 사용 이후 61초, recent는 31초가 지남
+    now[0] += 31
+    run_first_node(saver, "new")
+    assert not saver.has_checkpoint("old")
+    assert saver.has_checkpoint("recent") and saver.has_checkpoint("new")
+
+
+def test_reading_a_thread_keeps_it_from_expiring(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(checkpointer.time, "time", lambda: now[0])
+    saver = make_saver(tmp_path, ttl_seconds=60)
+    config = run_first_node(saver, "resumable")
+    now[0] += 50
+    assert saver.get_tuple(config) is not None
+    now[0] += 50
+    run_first_node(saver, "other")
+    assert saver.has_checkpoint("resumable")
+
+
+def test_least_recently_used_threads_over_max_are_evicted(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(checkpointer.time, "time", lambda: now[0])
+    saver = make_saver(tmp_path, max_threads=2)
+    for thread_id in ("a", "b"):
+        run_first_node(saver, thread_id)
+        now[0] += 1
+    # a를 다시 사용하면 b가 가장 오래 사용되지 않은 thread가 됨
+    saver.get_tuple({"configurable": {"thread_id": "a"}})
+    now[0] += 1
+    run_first_node(saver, "c")
+    assert [saver.has_checkpoint(thread_id) for thread_id in ("a", "b", "c")] == [True, False, True]
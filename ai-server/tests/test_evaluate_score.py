@@ -0,0 +1,125 @@
+import pytest
+
+pytest.importorskip("deepeval")
+pytest.importorskip("rouge_score")
+
+from app.processing_qna import evaluate_score
+from app.processing_qna.evaluate_score import ScoringEngine, evaluate_coherence_tiered, get_tiered_evaluation_report, snapshot_tiered_evaluation_stats
+
+QUESTION = "파이썬에서 리스트를 정렬하려고 sort()를 썼는데 TypeError가 나요. 리스트 정렬 방법과 TypeError 해결 방법을 알려주세요."
+
+
+@pytest.fixture
+def geval_calls(monkeypatch):
+    calls = []
+
+    def fake_geval(original_question, summarized_question):
+        calls.append(summarized_question)
+        return {"coherence_score": 0.5, "reason": "stub"}
+
+    monkeypatch.setattr(evaluate_score, "evaluate_coherence", fake_geval)
+    return calls
+
+
+def set_embedding_similarity(monkeypatch, similarity):
+    monkeypatch.setattr(evaluate_score, "embedding_similarity", lambda original, summary: similarity)
+
+
+@pytest.mark.parametrize("summary", ["파이썬에서", QUESTION])
+def test_fragment_or_copy_is_not_accepted_locally(monkeypatch, geval_calls, summary):
+    set_embedding_similarity(monkeypatch, None)
+    result = evaluate_coherence_tiered(QUESTION, summary)
+    assert result["tier"] == "geval"
+    assert geval_calls == [summary]
+
+
+def test_good_summary_is_not_rejected_without_embeddings(monkeypatch, geval_calls):
+    set_embedding_similarity(monkeypatch, None)
+    result = evaluate_coherence_tiered(QUESTION, "리스트 정렬 방법과 TypeError 해결")
+    assert result["tier"] == "geval"
+
+
+def test_embedding_similarity_decides_clear_cases_locally(monkeypatch, geval_calls):
+    set_embedding_similarity(monkeypatch, 0.05)
+    rejected = evaluate_coherence_tiered(QUESTION, "자바스크립트 프로미스 체이닝")
+    assert rejected["tier"] == "local" and rejected["coherence_score"] == 0.05
+
+    set_embedding_similarity(monkeypatch, 0.92)
+    accepted = evaluate_coherence_tiered(QUESTION, "리스트 sort() 정렬 시 TypeError 해결 방법")
+    assert accepted["tier"] == "local" and accepted["coherence_score"] == 0.92
+    assert geval_calls == []
+
+
+@pytest.mark.parametrize("summary", ["파이썬에서", QUESTION, "정렬 문제"])
+def test_similar_but_degenerate_or_low_coverage_summary_goes_to_geval(monkeypatch, geval_calls, summary):
+    # 조각, 원문 복사, 원문 내용을 거의 담지 않은 요약은 임베딩 유사도가 높아도 로컬에서 통과시키지 않음
+    set_embedding_similarity(monkeypatch, 0.95)
+    assert evaluate_coherence_tiered(QUESTION, summary)["tier"] == "geval"
+
+
+class StubEmbeddings:
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[1.0, float(len(text) % 7)] for text in texts]
+
+
+def test_pair_is_embedded_in_one_batch_and_original_is_reused(monkeypatch, tmp_path):
+    from app.embedding_cache import EmbeddingCache
+
+    embeddings = StubEmbeddings()
+    monkeypatch.setattr(evaluate_score, "_get_embedding_backend", lambda: (embeddings, EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))))
+    evaluate_score.embedding_similarity(QUESTION, "리스트 정렬")
+    evaluate_score.embedding_similarity(QUESTION, "리스트 정렬 방법")
+    assert embeddings.calls == [[QUESTION, "리스트 정렬"], ["리스트 정렬 방법"]]
+
+
+def test_embedding_failure_falls_back_to_geval(monkeypatch, geval_calls):
+    def fail():
+        raise RuntimeError("embedding API unavailable")
+
+    monkeypatch.setattr(evaluate_score, "_get_embedding_backend", fail)
+    assert evaluate_coherence_tiered(QUESTION, "리스트 sort() 정렬 시 TypeError 해결 방법")["tier"] == "geval"
+
+
+def test_report_counts_only_calls_after_snapshot(monkeypatch, geval_calls):
+    set_embedding_similarity(monkeypatch, None)
+    evaluate_coherence_tiered(QUESTION, "리스트 정렬")
+    since = snapshot_tiered_evaluation_stats()
+    evaluate_coherence_tiered(QUESTION, "리스트 정렬 방법과 TypeError 해결")
+    report = get_tiered_evaluation_report(since=since)
+    assert report["total"] == 1 and report["geval"] == 1 and report["geval_avoided_ratio"] == 0.0
+
+
+ANSWER = "리스트를 정렬하려면 sorted(items)를 사용하세요.\nThe sort() method returns None, so `items = items.sort()` loses the list.\n```python\nitems.sort(key=len)\n```"
+CANDIDATES = [
+    ANSWER,
+    ANSWER.replace("sorted(items)", "`sorted(items)`"),
+    "The sort() method sorts in place and returns None.",
+    "",
+]
+
+
+@pytest.mark.parametrize("hypothesis", CANDIDATES)
+def test_rouge_matches_public_rouge_scorer(hypothesis):
+    # ScoringEngine은 rouge_score의 비공개 함수로 토큰을 재사용하므로, 공개 API 결과와 같아야 함
+    from rouge_score import rouge_scorer
+
+    expected = rouge_scorer.RougeScorer(ScoringEngine.ROUGE_TYPES, use_stemmer=True).score(ANSWER, hypothesis)
+    engine = ScoringEngine()
+    assert engine.reuse_rouge_tokens
+    actual = engine.score_many(ANSWER, [hypothesis])[0]["rouge"]
+    assert {key: tuple(value) for key, value in actual.items()} == {key: tuple(value) for key, value in expected.items()}
+
+
+def test_rouge_falls_back_to_public_api_without_internals(monkeypatch):
+    from rouge_score import rouge_scorer
+
+    # 비공개 함수가 없는 버전에서는 토큰을 재사용하지 않음
+    monkeypatch.setattr(ScoringEngine, "ROUGE_INTERNALS", ("_removed_in_new_version",))
+    engine = ScoringEngine()
+    assert not engine.reuse_rouge_tokens
+    expected = rouge_scorer.RougeScorer(ScoringEngine.ROUGE_TYPES, use_stemmer=True).score(ANSWER, CANDIDATES[1])
+    assert engine.rouge(ANSWER, CANDIDATES[1]) == expected
@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+# app 패키지를 import하면 app/__init__.py가 flask를 불러옴
+pytest.importorskip("flask")
+pytest.importorskip("langchain_core")
+
+from app.llm_cache import LLMResponseCache, cached_chat_completion, parsed_chat_completion
+
+
+class StubClient:
+    """chat.completions.create 호출마다 responses를 순서대로 반환하는 OpenAI client."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        content = self.responses.pop(0)
+        return type("Completion", (), {"choices": [type("Choice", (), {"message": type("Message", (), {"content": content})})]})
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMResponseCache(str(tmp_path / "llm.sqlite3"), max_bytes=None)
+
+
+REQUEST = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "categorize"}], "max_tokens": 150}
+
+
+def test_unparseable_response_is_not_cached(cache):
+    client = StubClient(['{"os_tags": ['])
+    with pytest.raises(ValueError):
+        cached_chat_completion(client, cache=cache, parse=json.loads, **REQUEST)
+    assert cache.store.get(cache.make_key("openai", "gpt-4o-mini", {"max_tokens": 150}, REQUEST["messages"])) is None
+
+    # 재실행하면 저장된 잘린 응답을 재생하지 않고 다시 호출
+    client.responses.append('{"os_tags": []}')
+    assert cached_chat_completion(client, cache=cache, parse=json.loads, **REQUEST) == {"os_tags": []}
+    assert len(client.calls) == 2
+
+
+def test_parsed_response_is_cached(cache):
+    client = StubClient(['{"os_tags": ["linux"]}'])
+    for _ in range(2):
+        assert cached_chat_completion(client, cache=cache, parse=json.loads, **REQUEST) == {"os_tags": ["linux"]}
+    assert len(client.calls) == 1
+    assert cache.snapshot() == {"hits": 1, "misses": 1, "bypassed": 0}
+
+
+def test_previously_cached_bad_response_is_dropped(cache):
+    # 파싱 검사 없이 저장된 잘린 응답
+    cached_chat_completion(StubClient(['{"os_tags": [']), cache=cache, **REQUEST)
+    client = StubClient(['{"os_tags": []}'])
+    assert cached_chat_completion(client, cache=cache, parse=json.loads, **REQUEST) == {"os_tags": []}
+    assert len(client.calls) == 1
+
+
+def test_parse_failure_retries_with_next_attempt(cache):
+    client = StubClient(['{"title": "tr', '{"title": "t", "content": "c"}'])
+    assert parsed_chat_completion(client, parse=json.loads, cache=cache, **REQUEST) == {"title": "t", "content": "c"}
+    assert len(client.calls) == 2
+
+    # 재실행하면 attempt 0은 다시 호출하고(저장되지 않았으므로), 파싱에 성공한 attempt 1 응답은 캐시에서 재생
+    client.responses.append('{"title": "again')
+    assert parsed_chat_completion(client, parse=json.loads, cache=cache, **REQUEST) == {"title": "t", "content": "c"}
+    assert len(client.calls) == 3
+
+
+def test_all_attempts_failing_raises_the_parse_error(cache):
+    client = StubClient(["not json"] * 3)
+    with pytest.raises(ValueError):
+        parsed_chat_completion(client, parse=json.loads, retries=3, cache=cache, **REQUEST)
+    assert len(client.calls) == 3
+
+
+class StubChatModel:
+    model_name = "solar-pro"
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def invoke(self, prompt, **kwargs):
+        self.calls.append(kwargs)
+        return type("Message", (), {"content": self.responses.pop(0)})
+
+
+def test_chat_model_passes_kwargs_and_keys_cache_on_them(cache):
+    from app.llm_cache import CachedChatModel
+
+    stub = StubChatModel(['{"a": 1}', '{"a": 2}'])
+    model = CachedChatModel(stub, cache=cache)
+    json_mode = {"type": "json_object"}
+    assert model.invoke("prompt", response_format=json_mode, parse=json.loads) == {"a": 1}
+    assert model.invoke("prompt", response_format=json_mode, parse=json.loads) == {"a": 1}
+    # response_format이 다른 호출은 같은 프롬프트라도 캐시를 공유하지 않음
+    assert model.invoke("prompt").content == '{"a": 2}'
+    assert stub.calls == [{"response_format": json_mode}, {}]
@@ -0,0 +1,42 @@
+import os
+import runpy
+import time
+
+import pytest
+
+# app 패키지를 import하면 app/__init__.py가 flask를 불러옴
+pytest.importorskip("flask")
+
+from app.progress import ProgressReporter, ProgressStore, RUN_STAGE, stream_events
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProgressStore(str(tmp_path / "progress.sqlite3"))
+
+
+def test_stream_closes_after_idle_polls_for_unknown_run(store):
+    started_at = time.monotonic()
+    messages = list(stream_events("unknown-run", store=store, poll_interval=0.01, max_idle_polls=5))
+    assert time.monotonic() - started_at < 1
+    assert messages == ["retry: 1000\n\n"]
+
+
+def test_stream_closes_before_worker_timeout_and_resumes_from_last_event_id(store):
+    progress = ProgressReporter("run-1", store=store)
+    progress.start(RUN_STAGE)
+    first = list(stream_events("run-1", store=store, poll_interval=0.01, timeout_seconds=0.1))
+    assert [message.split("\n")[0] for message in first] == ["retry: 1000", "id: 1"]
+
+    # 재연결하면 Last-Event-ID 이후의 이벤트만 받고, 실행이 끝나면 바로 종료
+    progress.finish(RUN_STAGE)
+    second = list(stream_events("run-1", last_seq=1, store=store, poll_interval=0.01, timeout_seconds=5))
+    assert [message.split("\n")[0] for message in second] == ["retry: 1000", "id: 2"]
+    assert '"status": "finished"' in second[-1]
+
+
+def test_gunicorn_serves_streams_on_threads():
+    # SSE 구독자마다 sync worker 프로세스 하나를 점유하지 않도록 thread worker 사용
+    config = runpy.run_path(os.path.join(os.path.dirname(__file__), "..", "gunicorn.conf.py"))
+    assert config["worker_class"] == "gthread"
+    assert config["threads"] > 1
@@ -0,0 +1,122 @@
+import copy
+import json
+import time
+import zlib
+
+import pytest
+
+pytest.importorskip("langchain_upstage")
+pytest.importorskip("deepeval")
+
+from app.processing_qna import qna_processor
+from app.processing_qna.qna_processor import QnAProcessor
+
+
+class StubPrompt:
+    def __init__(self, name):
+        self.name = name
+
+    def compile(self, **kwargs):
+        return self.name, kwargs
+
+
+class StubMessage:
+    def __init__(self, content):
+        self.content = content
+
+
+class StubModel:
+    """프롬프트 내용만으로 응답이 정해지는 모델. 입력마다 지연 시간을 달리해 병렬 처리 시 완료 순서가 섞이도록 합니다."""
+
+    def invoke(self, prompt, attempt=0):
+        name, kwargs = prompt
+        text = next(iter(kwargs.values()))
+        time.sleep(zlib.crc32(text.encode("utf-8")) % 5 * 0.005)
+        if name == "question_summarizer":
+            return StubMessage(f"{text}\n(summary attempt {attempt})")
+        if name == "backtick_processor":
+            return StubMessage(f"{text}\n(backtick attempt {attempt})")
+        if name == "short_code_description":
+            return StubMessage(f"describes {text.splitlines()[0]}")
+        raise ValueError(f"unexpected prompt: {name}")
+
+
+def score_by_attempt(candidate):
+    # 첫 번째 후보는 기준점 미달, 그 이후 후보는 통과
+    return 0.5 if candidate.endswith("attempt 0)") else 0.95
+
+
+@pytest.fixture(autouse=True)
+def stub_llm_dependencies(monkeypatch):
+    monkeypatch.setattr(qna_processor, "get_prompt", StubPrompt)
+    monkeypatch.setattr(qna_processor, "evaluate_coherence_tiered",
+                        lambda question, summary: {"coherence_score": score_by_attempt(summary), "reason": "stub", "tier": "geval"})
+    monkeypatch.setattr(qna_processor, "evaluate_processed_answer",
+                        lambda answer, processed: {"recall": score_by_attempt(processed)})
+
+
+def make_conversation():
+    shared_code = "```python\nprint('shared')\n```"
+    conversation = []
+    for i in range(8):
+        question = f"question {i}" + (f"\n```python\nx = {i}\n```" if i % 3 == 0 else "")
+        answer = f"answer {i}\n```python\ndef f_{i}():\n    return {i}\n```\n" + (shared_code if i % 2 else "no shared code")
+        conversation.append({"q": question, "a": answer})
+    return conversation
+
+
+def run_processor(max_workers, num_candidates=1):
+    conversation = make_conversation()
+    graph_state = {
+        "not_processed_conversations": copy.deepcopy(conversation),
+        "processing_data": None,
+        "processed_conversations": [],
+        "code_documents": []
+    }
+    processor = QnAProcessor(conversation, StubModel())
+    qna_list, code_documents = processor.process_qna_pair(graph_state, max_workers=max_workers, num_candidates=num_candidates)
+    return json.dumps([qna_list, code_documents], ensure_ascii=False)
+
+
+@pytest.mark.parametrize("num_candidates", [1, 3])
+def test_parallel_output_is_byte_identical_to_serial(num_candidates):
+    serial = run_processor(max_workers=1, num_candidates=num_candidates)
+    parallel = run_processor(max_workers=4, num_candidates=num_candidates)
+    assert parallel == serial
+
+
+def test_snippets_are_numbered_in_conversation_order():
+    qna_list, code_documents = json.loads(run_processor(max_workers=4))
+    code_indices = [code_document["code_index"] for code_document in code_documents]
+    assert code_indices == [f"Code_Snippet_{i}" for i in range(1, len(code_documents) + 1)]
+    # 질문의 코드가 답변의 코드보다 먼저 번호를 받고, 같은 코드는 하나의 번호를 공유
+    assert code_documents[0]["code_snippet"] == "python\nx = 0"
+    assert sum(code_document["code_snippet"] == "python\nprint('shared')" for code_document in code_documents) == 1
+    assert all("```" not in qna["q"] + qna["a"] for qna in qna_list)
+
+
+def test_geval_scored_candidate_is_preferred_over_local_score():
+    # 둘 다 기준점 미달이면 로컬 점수가 더 높아도 GEval로 평가한 후보를 선택
+    scores = {"local": (0.7, "local"), "geval": (0.6, "geval")}
+    best = QnAProcessor._select_best_candidate(
+        generate=lambda attempt: ["local", "geval"][attempt],
+        score=lambda candidate: scores[candidate],
+        threshold=0.8,
+        MAX_ITERATION=2,
+        num_candidates=2
+    )
+    assert best == "geval"
+
+
+@pytest.mark.parametrize("num_candidates, expected", [(1, "third"), (3, "first")])
+def test_single_candidate_keeps_last_iteration_output(num_candidates, expected):
+    # 기준점을 넘지 못하면 num_candidates=1은 기존처럼 마지막 출력을, 후보 여러 개는 가장 점수가 높은 후보를 반환
+    scores = {"first": 0.7, "second": 0.5, "third": 0.3}
+    best = QnAProcessor._select_best_candidate(
+        generate=lambda attempt: ["first", "second", "third"][attempt],
+        score=lambda candidate: (scores[candidate], "geval"),
+        threshold=0.8,
+        MAX_ITERATION=3,
+        num_candidates=num_candidates
+    )
+    assert best == expected
@@ -0,0 +1,90 @@
+import re
+
+import pytest
+
+# app 패키지를 import하면 app/__init__.py가 flask를 불러옴
+pytest.importorskip("flask")
+pytest.importorskip("langchain_upstage")
+pytest.importorskip("requests")
+
+from app.translator import translator
+from app.translator.translator import CHUNK_MAX_CHARS, TranslationMemory, segment_text, translate_field
+
+MODEL = "solar-1-mini-translate-koen"
+FENCE_PATTERN = re.compile(r"```.*?```", re.DOTALL)
+
+TEXT = (
+    "리스트를 정렬하는 방법을 알려주세요.\n\n"
+    "`items.sort()`를 썼는데 `None`이 반환돼요. 이유가 뭔가요?\n\n"
+    "```python\n# 한국어 주석은 번역하지 않음\nitems = items.sort()\n```\n"
+    "그리고 이 코드도 봐주세요.\n\n\n"
+    "```\n```\n"
+    + "\n\n".join(f"긴 문단 {i}번입니다. " * 20 for i in range(8))
+    + "\n\n마지막 문장  \n"
+)
+
+
+class StubEmbeddings:
+    """모든 텍스트에 같은 벡터를 반환해 유사도가 항상 1인 임베딩 모델."""
+
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+
+@pytest.fixture
+def api_calls(monkeypatch, tmp_path):
+    calls = []
+
+    def fake_translate(text, model, attempt=0):
+        calls.append(text)
+        return re.sub(r"[가-힣]+", "word", text)
+
+    monkeypatch.setattr(translator, "translate_text_with_api", fake_translate)
+    monkeypatch.setattr(translator, "translation_memory", TranslationMemory(str(tmp_path / "memory.sqlite3")))
+    return calls
+
+
+def test_segments_round_trip_byte_for_byte():
+    segments = segment_text(TEXT)
+    assert "".join(segment for segment, _ in segments) == TEXT
+    assert [segment for segment, is_code in segments if is_code] == [
+        "```python\n# 한국어 주석은 번역하지 않음\nitems = items.sort()\n```",
+        "```\n```",
+    ]
+    assert all(len(segment) <= CHUNK_MAX_CHARS for segment, is_code in segments if not is_code)
+
+
+def test_fenced_and_inline_code_are_not_translated(api_calls):
+    translated, attempts = translate_field(TEXT, MODEL, StubEmbeddings())
+    assert "```python\n# 한국어 주석은 번역하지 않음\nitems = items.sort()\n```" in translated
+    assert "`items.sort()`word word `None`word word." in translated
+    assert not translator.contains_korean(FENCE_PATTERN.sub("", translated))
+    # 번역 요청에는 코드 블록이 없고 인라인 코드는 자리표시자로 바뀜
+    assert all("```" not in call and "`" not in call for call in api_calls)
+    assert any("[[CODE0]]" in call for call in api_calls)
+    assert attempts == len(api_calls)
+
+
+def test_chunk_is_kept_when_translation_drops_a_placeholder(monkeypatch, api_calls):
+    monkeypatch.setattr(translator, "translate_text_with_api", lambda text, model, attempt=0: api_calls.append(text) or "dropped the code")
+    chunk = "`items.sort()`를 썼는데 에러가 나요."
+    translated, attempts = translate_field(chunk, MODEL, StubEmbeddings())
+    assert translated == chunk
+    assert attempts == translator.MAX_TRANSLATION_ATTEMPTS
+
+
+def test_memory_hit_makes_no_api_calls(api_calls):
+    first, _ = translate_field(TEXT, MODEL, StubEmbeddings())
+    calls_after_first = len(api_calls)
+    second, attempts = translate_field(TEXT, MODEL, StubEmbeddings())
+    assert second == first
+    assert attempts == 0 and len(api_calls) == calls_after_first
+
+
+def test_sentence_level_memory_reuses_sentences_across_chunks(api_calls):
+    translate_field("이 코드 설명해줘. 에러가 나요.", MODEL, StubEmbeddings())
+    api_calls.clear()
+    # 다른 청크에 같은 문장이 순서와 끝 문장 부호만 바뀌어 나오면 문장별 번역을 조합해 API를 호출하지 않음
+    translated, attempts = translate_field("에러가 나요! 이 코드 설명해줘.", MODEL, StubEmbeddings())
+    assert translated == "word word! word word word."
+    assert attempts == 0 and api_calls == []
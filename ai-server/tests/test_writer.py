@@ -0,0 +1,424 @@
+import json
+import re
+import threading
+import time
+import zlib
+
+import pytest
+
+pytest.importorskip("langgraph")
+pytest.importorskip("langchain_upstage")
+
+from app.writer import writer
+from app.writer.writer import make_blog, replace_code_snippets
+
+
+def replace_code_snippets_per_key(document, snippets_dict):
+    # 단일 패턴으로 바꾸기 전의 구현: 키마다 패턴을 만들어 re.sub
+    for snippet_key in snippets_dict:
+        pattern = f"<-- {snippet_key}:.*?-->"
+        document = re.sub(pattern, "```" + snippets_dict[snippet_key] + "```\n", document)
+    return document
+
+
+SNIPPETS = {
+    f"Code_Snippet_{i}": f"python\ndef handler_{i}(items):\n    return [item * {i} for item in items]\n"
+    for i in range(1, 13)
+}
+
+DOCUMENTS = {
+    "1": "## 설치\n<-- Code_Snippet_1: 패키지 설치 -->\n설명 <-- Code_Snippet_10: 열 번째 --> 문장 <-- Code_Snippet_1: 다시 등장 -->",
+    "2": "## 구현\n<-- Code_Snippet_2: 첫 구현 --> 그리고 <-- Code_Snippet_12: 마지막 -->\n<-- Code_Snippet_99: 없는 키 -->",
+    "3": "## 코드 없음\n일반 문단만 있는 목차입니다.",
+    "4": "## 형식이 다른 placeholder\n<-- Code_Snippet_3:설명에 공백 없음--> <-- Code_Snippet_11: 두 줄\n설명 -->\n<-- Code_Snippet_4: a --> <-- Code_Snippet_5: b -->",
+}
+
+
+@pytest.mark.parametrize("key", sorted(DOCUMENTS))
+def test_output_matches_per_key_substitution(key):
+    assert replace_code_snippets(DOCUMENTS[key], SNIPPETS) == replace_code_snippets_per_key(DOCUMENTS[key], SNIPPETS)
+
+
+def test_make_blog_matches_per_key_substitution():
+    state = {"final_documents": dict(DOCUMENTS), "code_document": SNIPPETS}
+    expected = {
+        key: replace_code_snippets_per_key(text, SNIPPETS).lstrip('#').lstrip(' ')
+        for key, text in DOCUMENTS.items()
+    }
+    assert make_blog(state)["final_documents"] == expected
+
+
+def test_backslashes_in_code_are_inserted_literally():
+    # 이전 구현은 코드를 re.sub 치환 문자열로 해석해 "\n"이 줄바꿈으로, "\1"은 오류가 되었음
+    code = 'python\nprint("a\\nb")\npath = "C:\\\\Users\\\\me"\npattern = r"(\\d+)\\1"\n'
+    document = "## 경로\n<-- Code_Snippet_1: 역슬래시가 있는 코드 -->"
+    assert replace_code_snippets(document, {"Code_Snippet_1": code}) == "## 경로\n```" + code + "```\n"
+
+
+def test_token_accounting_is_skipped_when_encoding_is_unavailable(monkeypatch):
+    # cl100k_base를 내려받지 못해도 토큰 집계만 0으로 건너뛰고 작성은 계속되어야 함
+    def fail(name):
+        raise OSError("cl100k_base download failed")
+
+    monkeypatch.setattr(writer, "WRITER_TOKEN_ACCOUNTING", True)
+    monkeypatch.setattr(writer.tiktoken, "get_encoding", fail)
+    writer.get_token_encoding.cache_clear()
+    try:
+        assert writer.count_tokens("prompt text") == 0
+    finally:
+        writer.get_token_encoding.cache_clear()
+
+
+def test_token_accounting_is_off_by_default(monkeypatch):
+    monkeypatch.setattr(writer, "make_writing_prompt", lambda qa, document: pytest.fail("prompt built while accounting is off"))
+    stats = writer.new_draft_stats()
+    writer.count_mode_prompt_tokens({"q": "q", "a": "a"}, "## 목차", stats)
+    assert stats == writer.new_draft_stats()
+
+
+class StubPrompt:
+    def __init__(self, name):
+        self.name = name
+
+    def compile(self, **kwargs):
+        return self.name, kwargs
+
+
+class StubMessage:
+    def __init__(self, content):
+        self.content = content
+
+
+class StubWriterModel:
+    """프롬프트 내용만으로 응답이 정해지는 모델. 입력마다 지연 시간을 달리해 병렬 처리 시 완료 순서가 섞이도록 합니다."""
+
+    def invoke(self, prompt, attempt=0):
+        name, kwargs = prompt
+        time.sleep(zlib.crc32(kwargs["q"].encode("utf-8")) % 5 * 0.005)
+        if name == "writing_prompt":
+            return StubMessage(f"{kwargs['document']}\n{kwargs['q']} -> {kwargs['a']}")
+        raise ValueError(f"unexpected prompt: {name}")
+
+
+def make_writer_state():
+    sections = ["1-1", "1-2", "2-1", "2-2", "3-1"]
+    conversations, message_to_index_dict = [], {}
+    for i in range(10):
+        conversations.append({"q": f"question {i}", "a": f"answer {i} <-- Code_Snippet_{i}: code {i} -->"})
+        message_to_index_dict[str(i)] = [sections[i % len(sections)], sections[(i * 3) % len(sections)]]
+    return {
+        "preprocessed_conversations": conversations,
+        "code_document": {f"Code_Snippet_{i}": f"python\nx = {i}" for i in range(10)},
+        "message_to_index_dict": message_to_index_dict,
+        "final_documents": {index: f"## {index}) heading" for index in sections},
+    }
+
+
+def run_make_final_documents(monkeypatch, max_concurrency):
+    monkeypatch.setattr(writer, "WRITER_MAX_CONCURRENCY", max_concurrency)
+    state = writer.make_final_documents(make_writer_state())
+    return json.dumps([state["final_documents"], state["draft_stats"]], ensure_ascii=False, sort_keys=True)
+
+
+@pytest.fixture
+def stub_writer_model(monkeypatch):
+    monkeypatch.setattr(writer, "get_prompt", StubPrompt)
+    monkeypatch.setattr(writer, "model", StubWriterModel())
+    monkeypatch.setattr(writer, "WRITER_DRAFT_MODE", "full")
+    monkeypatch.setattr(writer, "WRITER_MULTI_SECTION", False)
+
+
+def test_parallel_drafts_are_identical_to_serial(monkeypatch, stub_writer_model):
+    serial = run_make_final_documents(monkeypatch, max_concurrency=1)
+    parallel = run_make_final_documents(monkeypatch, max_concurrency=4)
+    assert parallel == serial
+    # 같은 목차의 QA 세트는 대화 순서대로 반영
+    documents = json.loads(serial)[0]
+    assert documents["1-1"].index("question 0 ") < documents["1-1"].index("question 5 ")
+
+
+class StubRefinementModel:
+    """
+    모든 충돌 snippet을 첫 번째 목차에 남기는 모델.
+    remove=True이면 다시 작성할 때 요청받은 snippet을 지우고, batch_removes=False이면 한 번에 지우는 요청만 무시합니다.
+    """
+
+    def __init__(self, remove=True, batch_removes=True):
+        self.remove = remove
+        self.batch_removes = batch_removes
+        self.calls = []
+
+    def invoke(self, prompt, attempt=0, parse=None, response_format=None):
+        name, kwargs = prompt
+        self.calls.append(name)
+        if name == "snippet_assignment_prompt":
+            schema = response_format["json_schema"]["schema"]
+            return parse(json.dumps({code_id: field["enum"][0] for code_id, field in schema["properties"].items()}))
+        doc = kwargs["doc"]
+        if name == "snippet_removal_prompt" and self.remove and self.batch_removes:
+            for snippet in kwargs["code_snippets"].split("\n"):
+                doc = doc.replace(snippet, "")
+        elif name == "document_refinement_2" and self.remove:
+            doc = doc.replace(kwargs["code_snippet"], "")
+        elif name not in ("snippet_removal_prompt", "document_refinement_2"):
+            raise ValueError(f"unexpected prompt: {name}")
+        return StubMessage(doc)
+
+
+def make_refinement_state():
+    return {
+        "code_document": {"Code_Snippet_1": "python\nx = 1", "Code_Snippet_2": "python\nx = 2"},
+        "final_documents": {
+            "1-1": "## 1-1) 설치\n<-- Code_Snippet_1: 설치 --> <-- Code_Snippet_2: 설정 -->",
+            "1-2": "## 1-2) 사용\n<-- Code_Snippet_1: 설치 --> 본문 <-- Code_Snippet_2: 설정 -->",
+        },
+    }
+
+
+@pytest.mark.parametrize("remove", [True, False])
+def test_refinement_reindexes_rewritten_sections(monkeypatch, caplog, remove):
+    monkeypatch.setattr(writer, "get_prompt", StubPrompt)
+    monkeypatch.setattr(writer, "model", StubRefinementModel(remove=remove))
+    updated_sections = []
+    update_section = writer.CodeSnippetIndex.update_section
+
+    def record_update(self, key, text):
+        updated_sections.append(key)
+        update_section(self, key, text)
+
+    monkeypatch.setattr(writer.CodeSnippetIndex, "update_section", record_update)
+    state = writer.document_refinement(make_refinement_state())
+    # 처음 색인한 두 목차와 다시 작성한 목차 하나만 색인
+    assert updated_sections == ["1-1", "1-2", "1-2"]
+    assert ("still appears" in caplog.text) is not remove
+    if remove:
+        assert "Code_Snippet" not in state["final_documents"]["1-2"]
+
+
+def test_lost_snippets_are_removed_in_one_rewrite(monkeypatch):
+    monkeypatch.setattr(writer, "get_prompt", StubPrompt)
+    stub = StubRefinementModel()
+    monkeypatch.setattr(writer, "model", stub)
+    state = writer.document_refinement(make_refinement_state())
+    assert stub.calls == ["snippet_assignment_prompt", "snippet_removal_prompt"]
+    assert state["final_documents"]["1-2"] == "## 1-2) 사용\n 본문 "
+
+
+def test_failed_batched_removal_falls_back_to_one_snippet_per_call(monkeypatch):
+    monkeypatch.setattr(writer, "get_prompt", StubPrompt)
+    stub = StubRefinementModel(batch_removes=False)
+    monkeypatch.setattr(writer, "model", stub)
+    state = writer.document_refinement(make_refinement_state())
+    assert stub.calls == ["snippet_assignment_prompt", "snippet_removal_prompt", "document_refinement_2", "document_refinement_2"]
+    assert "Code_Snippet" not in state["final_documents"]["1-2"]
+
+
+def test_removal_check_requires_other_snippets_to_survive():
+    document = "## 1-1)\n<-- Code_Snippet_1: a --> <-- Code_Snippet_2: b --> <-- Code_Snippet_3: c -->"
+    assert writer.snippets_removed(document, "## 1-1)\n<-- Code_Snippet_3: c -->", {"Code_Snippet_1", "Code_Snippet_2"})
+    assert not writer.snippets_removed(document, "## 1-1)\n", {"Code_Snippet_1", "Code_Snippet_2"})
+    assert not writer.snippets_removed(document, "## 1-1)\n<-- Code_Snippet_2: b --> <-- Code_Snippet_3: c -->", {"Code_Snippet_1", "Code_Snippet_2"})
+
+
+def test_snippet_assignment_is_constrained_to_valid_sections_and_retries_bad_json(monkeypatch):
+    conflicts = {
+        "Code_Snippet_1": (["1-1", "1-2"], ["설치", "사용"], "<-- Code_Snippet_1: 설치 -->"),
+        "Code_Snippet_2": (["2-1", "2-2"], ["설정", "배포"], "<-- Code_Snippet_2: 설정 -->"),
+    }
+    responses = ["not json", '{"Code_Snippet_1": "1-2", "Code_Snippet_2": "9-9"}', '{"Code_Snippet_2": "2-2"}']
+    formats = []
+
+    class StubAssignmentModel:
+        def invoke(self, prompt, attempt=0, parse=None, response_format=None):
+            formats.append(response_format)
+            return parse(responses[attempt])
+
+    monkeypatch.setattr(writer, "get_prompt", StubPrompt)
+    monkeypatch.setattr(writer, "model", StubAssignmentModel())
+    assert writer.assign_conflicting_snippets(conflicts) == {"Code_Snippet_1": "1-2", "Code_Snippet_2": "2-2"}
+    schema = formats[0]["json_schema"]["schema"]
+    assert schema["properties"]["Code_Snippet_2"]["enum"] == ["2-1", "2-2"]
+    assert schema["required"] == ["Code_Snippet_1", "Code_Snippet_2"]
+
+
+REPAIR_QA = {"q": "정렬 방법은? <-- Code_Snippet_1: 정렬 코드 -->", "a": "이렇게 합니다. <-- Code_Snippet_2: key 사용 -->"}
+REPAIR_CODE = {"Code_Snippet_1": "python\nitems.sort()\n", "Code_Snippet_2": "python\nitems.sort(key=len)\n"}
+
+
+@pytest.mark.parametrize("text, expected", [
+    # [Q], [A] 표시 제거
+    ("## 정렬\n[Q] 정렬 방법은?\n[A] 이렇게 합니다.", "## 정렬\n정렬 방법은?\n이렇게 합니다."),
+    # 빈 코드 블록은 지움
+    ("## 정렬\n설명\n```\n```\n끝", "## 정렬\n설명\n\n끝"),
+    ("## 정렬\n설명 ```python\n``` 끝", "## 정렬\n설명  끝"),
+    # placeholder만 감싼 코드 블록은 펜스만 지움
+    ("## 정렬\n```\n<-- Code_Snippet_1: 정렬 코드 -->\n```", "## 정렬\n<-- Code_Snippet_1: 정렬 코드 -->"),
+    ("## 정렬\n```python\n<-- Code_Snippet_1: 정렬 코드 --> <-- Code_Snippet_2: key 사용 -->\n```",
+     "## 정렬\n<-- Code_Snippet_1: 정렬 코드 --> <-- Code_Snippet_2: key 사용 -->"),
+    # QA의 placeholder 코드를 그대로 옮겨 적은 코드 블록은 placeholder로 되돌림 (언어 표시, 줄 끝 공백 무시)
+    ("## 정렬\n```python\nitems.sort(key=len)   \n```\n설명", "## 정렬\n<-- Code_Snippet_2: key 사용 -->\n설명"),
+    ("## 정렬\n```\nitems.sort()\n```", "## 정렬\n<-- Code_Snippet_1: 정렬 코드 -->"),
+])
+def test_repair_section_output(text, expected):
+    assert writer.repair_section_output(text, REPAIR_QA, REPAIR_CODE) == expected
+
+
+@pytest.mark.parametrize("text", [
+    # QA에 없는 코드를 새로 적은 코드 블록
+    "## 정렬\n```python\nsorted(items, reverse=True)\n```",
+    # code_document에는 있지만 이 QA의 placeholder가 아닌 코드
+    "## 정렬\n```python\nprint('other')\n```",
+    # 닫히지 않은 펜스
+    "## 정렬\n```python\nitems.sort()",
+])
+def test_unrepairable_output_returns_none(text):
+    code_document = dict(REPAIR_CODE, Code_Snippet_3="python\nprint('other')\n")
+    assert writer.repair_section_output(text, REPAIR_QA, code_document) is None
+
+
+def test_validate_section_output_counts_only_repairs():
+    stats = writer.new_draft_stats()
+    # 규칙을 지킨 출력은 두 번째 제목 이후만 잘라내고 그대로 사용
+    assert writer.validate_section_output("## 정렬\n본문\n## 다른 목차", REPAIR_QA, REPAIR_CODE, stats) == "## 정렬\n본문"
+    assert stats["repaired"] == 0
+
+    assert writer.validate_section_output("## 정렬\n[Q] 질문", REPAIR_QA, REPAIR_CODE, stats) == "## 정렬\n질문"
+    assert stats["repaired"] == 1
+
+    assert writer.validate_section_output("## 정렬\n```\nnew_code()\n```", REPAIR_QA, REPAIR_CODE, stats) is None
+    assert stats["repaired"] == 1
+
+
+class StubMultiSectionModel:
+    """multi_section_writing_prompt에는 replies[q]로 응답하고, writing_prompt에는 목차 끝에 q를 이어 붙이는 모델."""
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.calls = []
+
+    def invoke(self, prompt, attempt=0):
+        name, kwargs = prompt
+        if name == "multi_section_writing_prompt":
+            self.calls.append((name, kwargs["q"]))
+            return StubMessage(self.replies[kwargs["q"]])
+        if name == "writing_prompt":
+            self.calls.append((name, kwargs["document"].split("\n")[0]))
+            return StubMessage(f"{kwargs['document']}\n{kwargs['q']} (single)")
+        raise ValueError(f"unexpected prompt: {name}")
+
+
+MULTI_QA = {"q": "question", "a": "answer"}
+MULTI_DOCUMENTS = {"1-1": "## 1-1) 설치", "1-2": "## 1-2) 사용", "2-1": "## 2-1) 배포"}
+
+
+@pytest.fixture
+def multi_section_model(monkeypatch):
+    def install(reply):
+        stub = StubMultiSectionModel({"question": reply})
+        monkeypatch.setattr(writer, "get_prompt", StubPrompt)
+        monkeypatch.setattr(writer, "model", stub)
+        monkeypatch.setattr(writer, "WRITER_DRAFT_MODE", "full")
+        return stub
+    return install
+
+
+def run_multi_section(documents=MULTI_DOCUMENTS):
+    draft_stats = {index: writer.new_draft_stats() for index in documents}
+    updated = writer.draft_qa_multi_section(MULTI_QA, dict(documents), {}, draft_stats)
+    return updated, draft_stats
+
+
+def test_multi_section_envelopes_are_parsed(multi_section_model):
+    stub = multi_section_model(
+        '앞 설명\n<section id="2-1">\n## 2-1) 배포\n배포 내용\n</section>\n'
+        '<section id="1-1">## 1-1) 설치\n설치 내용</section>\n'
+        '<section id="1-2">\n## 1-2) 사용\n사용 내용\n## 다음 목차\n</section>'
+    )
+    updated, draft_stats = run_multi_section()
+    assert updated == {"1-1": "## 1-1) 설치\n설치 내용", "1-2": "## 1-2) 사용\n사용 내용", "2-1": "## 2-1) 배포\n배포 내용"}
+    assert stub.calls == [("multi_section_writing_prompt", "question")]
+    assert all(stats["batched"] == 1 for stats in draft_stats.values())
+
+
+@pytest.mark.parametrize("reply", [
+    # 2-1 목차가 빠진 응답
+    '<section id="1-1">## 1-1) 설치\n설치 내용</section><section id="1-2">## 1-2) 사용\n사용 내용</section>',
+    # 2-1 목차가 닫히지 않은 응답
+    '<section id="1-1">## 1-1) 설치\n설치 내용</section><section id="1-2">## 1-2) 사용\n사용 내용</section><section id="2-1">## 2-1) 배포',
+    # 2-1 목차에 고칠 수 없는 코드 블록이 있는 응답
+    '<section id="1-1">## 1-1) 설치\n설치 내용</section><section id="1-2">## 1-2) 사용\n사용 내용</section>'
+    '<section id="2-1">## 2-1) 배포\n```python\nnew_code()\n```</section>',
+    # 2-1 목차가 비어 있는 응답
+    '<section id="1-1">## 1-1) 설치\n설치 내용</section><section id="1-2">## 1-2) 사용\n사용 내용</section><section id="2-1"></section>',
+])
+def test_missing_or_malformed_section_falls_back_to_single_section(multi_section_model, reply):
+    stub = multi_section_model(reply)
+    updated, draft_stats = run_multi_section()
+    assert updated["1-1"] == "## 1-1) 설치\n설치 내용" and updated["1-2"] == "## 1-2) 사용\n사용 내용"
+    # 파싱하지 못했거나 고칠 수 없는 목차만 목차별로 다시 작성
+    assert updated["2-1"] == "## 2-1) 배포\nquestion (single)"
+    assert stub.calls == [("multi_section_writing_prompt", "question"), ("writing_prompt", "## 2-1) 배포")]
+    assert draft_stats["2-1"]["batched"] == 0 and draft_stats["1-1"]["batched"] == 1
+
+
+def test_single_section_is_written_without_envelope(multi_section_model):
+    stub = multi_section_model("unused")
+    updated, _ = run_multi_section({"1-1": "## 1-1) 설치"})
+    assert updated == {"1-1": "## 1-1) 설치\nquestion (single)"}
+    assert stub.calls == [("writing_prompt", "## 1-1) 설치")]
+
+
+def test_ordered_tasks_keep_list_order_for_shared_sections():
+    lock = threading.Lock()
+    events = []
+    running = set()
+    max_running = []
+
+    def run(name, delay):
+        with lock:
+            events.append(("start", name))
+            running.add(name)
+            max_running.append(len(running))
+        time.sleep(delay)
+        with lock:
+            running.discard(name)
+            events.append(("end", name))
+
+    # a와 c는 1-1을, c와 d는 2-1을 공유. b는 다른 작업과 겹치지 않음
+    tasks = [
+        ({"1-1"}, ("a", 0.05)),
+        ({"1-2"}, ("b", 0.01)),
+        ({"1-1", "2-1"}, ("c", 0.01)),
+        ({"2-1"}, ("d", 0.0)),
+    ]
+    progress = []
+    writer.run_ordered_tasks(tasks, run, max_workers=4, on_progress=lambda done, total: progress.append((done, total)))
+
+    position = {event: i for i, event in enumerate(events)}
+    assert position[("end", "a")] < position[("start", "c")]
+    # d는 c보다 먼저 사용할 수 있어도 앞선 c가 기다리는 2-1을 먼저 사용하지 않음
+    assert position[("end", "c")] < position[("start", "d")]
+    # 겹치지 않는 a와 b는 동시에 실행
+    assert position[("start", "b")] < position[("end", "a")] and max(max_running) >= 2
+    assert progress == [(1, 4), (2, 4), (3, 4), (4, 4)]
+
+
+def test_multi_section_parallel_drafts_are_identical_to_serial(monkeypatch):
+    class EchoModel:
+        def invoke(self, prompt, attempt=0):
+            name, kwargs = prompt
+            time.sleep(zlib.crc32(kwargs["q"].encode("utf-8")) % 5 * 0.005)
+            if name == "writing_prompt":
+                return StubMessage(f"{kwargs['document']}\n{kwargs['q']}")
+            sections = writer.SECTION_ENVELOPE_PATTERN.findall(kwargs["sections"])
+            return StubMessage("".join(f'<section id="{index}">{document}\n{kwargs["q"]}</section>' for index, document in sections))
+
+    monkeypatch.setattr(writer, "get_prompt", StubPrompt)
+    monkeypatch.setattr(writer, "model", EchoModel())
+    monkeypatch.setattr(writer, "WRITER_DRAFT_MODE", "full")
+    monkeypatch.setattr(writer, "WRITER_MULTI_SECTION", True)
+    serial = run_make_final_documents(monkeypatch, max_concurrency=1)
+    parallel = run_make_final_documents(monkeypatch, max_concurrency=4)
+    assert parallel == serial
+    documents = json.loads(serial)[0]
+    assert documents["1-1"].index("question 0") < documents["1-1"].index("question 5")